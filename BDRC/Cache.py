@@ -0,0 +1,357 @@
+"""
+Content addressed on-disk cache for OCR results. Entries are keyed by the hash of the image file, the hashes of the
+OCR and line/layout model files and the run_ocr arguments that change the output, so re-importing the same scans
+or changing only the export format skips the inference entirely. The stored value is the serialized OCResult
+(see serialize_ocr_result) written as a .npz of plain arrays plus a json header, so loading an entry never unpickles
+anything from the cache directory. The least recently used entries are evicted once the cache exceeds its size limit.
+"""
+
+import io
+import os
+import json
+import hashlib
+import logging
+import threading
+from uuid import uuid1
+from enum import Enum
+from collections import OrderedDict
+from dataclasses import asdict
+from typing import Callable, Dict, Sequence, Tuple
+
+import numpy as np
+
+from BDRC.Utils import serialize_ocr_result, deserialize_ocr_result
+from BDRC.Data import OCResult, OCRModelConfig, LineDetectionConfig, LayoutDetectionConfig
+
+CACHE_VERSION = 2
+ENTRY_SUFFIX = ".npz"
+DEFAULT_CACHE_SIZE = 1024 * 1024 * 1024
+
+# run_ocr arguments that affect the result, everything else (e.g. batch_lines) is ignored for the key
+KEY_ARGS = (
+    "k_factor", "bbox_tolerance", "merge_lines", "use_tps", "tps_mode", "tps_threshold", "tps_tolerance", "target_encoding"
+)
+
+_file_hashes = {}
+_file_hash_lock = threading.Lock()
+
+
+def get_file_hash(file_path: str) -> str:
+    """
+    sha256 of a file, model files are memoized by path, size and modification time.
+    """
+    stat = os.stat(file_path)
+    memo_key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+
+    with _file_hash_lock:
+        if memo_key in _file_hashes:
+            return _file_hashes[memo_key]
+
+    file_hash = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            file_hash.update(chunk)
+
+    digest = file_hash.hexdigest()
+
+    with _file_hash_lock:
+        _file_hashes[memo_key] = digest
+
+    return digest
+
+
+def _to_key_value(value):
+    if isinstance(value, Enum):
+        return f"{type(value).__name__}.{value.name}"
+    return value
+
+
+def _to_json_value(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, bytes):
+        return value.hex()
+    raise TypeError(f"{type(value).__name__} can't be stored in the OCR cache")
+
+
+def pack_cache_entry(data: dict) -> bytes:
+    """
+    Writes a serialize_ocr_result dict as a .npz: the mask PNG and all line contours as uint8/int32 arrays,
+    everything else as a json header.
+    """
+    lines = [{k: v for k, v in line.items() if k != "contour"} for line in data["lines"]]
+    contours = [np.frombuffer(line["contour"], dtype=np.int32) for line in data["lines"]]
+    header = {k: v for k, v in data.items() if k not in ("mask", "lines")}
+    header["lines"] = lines
+
+    buffer = io.BytesIO()
+    np.savez(
+        buffer,
+        header=np.frombuffer(json.dumps(header, default=_to_json_value).encode("utf-8"), dtype=np.uint8),
+        mask=np.frombuffer(data["mask"], dtype=np.uint8),
+        contours=np.concatenate(contours) if len(contours) > 0 else np.zeros(0, dtype=np.int32)
+    )
+    return buffer.getvalue()
+
+
+def unpack_cache_entry(file) -> dict:
+    """
+    Reads an entry written by pack_cache_entry back into the dict expected by deserialize_ocr_result.
+    """
+    with np.load(file, allow_pickle=False) as entry:
+        header = json.loads(entry["header"].tobytes().decode("utf-8"))
+        mask = entry["mask"].tobytes()
+        contours = entry["contours"]
+
+    if contours.dtype != np.int32:
+        raise ValueError(f"Invalid contour type {contours.dtype}")
+
+    offset = 0
+    for line in header["lines"]:
+        size = int(np.prod(line["contour_shape"]))
+        line["contour"] = contours[offset:offset + size].tobytes()
+        line["guid"] = bytes.fromhex(line["guid"])
+        offset += size
+
+    if offset != len(contours):
+        raise ValueError("Contour data doesn't match the line count")
+
+    for ocr_line in header["text"]:
+        ocr_line["guid"] = bytes.fromhex(ocr_line["guid"])
+
+    if header["guid"] is not None:
+        header["guid"] = bytes.fromhex(header["guid"])
+
+    if header.get("trace") is not None:
+        name, events = header["trace"]
+        header["trace"] = (name, [tuple(event) for event in events])
+
+    header["mask"] = mask
+    return header
+
+
+class OCRResultCache:
+    def __init__(self, cache_dir: str, max_size: int = DEFAULT_CACHE_SIZE, enabled: bool = True):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._entries = None  # key -> file size, in LRU order, loaded on first use
+        self._size = 0
+
+    def _load_index(self):
+        if self._entries is not None:
+            return
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entries = []
+
+        for sub_dir in os.scandir(self.cache_dir):
+            if not sub_dir.is_dir():
+                continue
+            for entry in os.scandir(sub_dir.path):
+                if entry.name.endswith(ENTRY_SUFFIX):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime_ns, entry.name[:-len(ENTRY_SUFFIX)], stat.st_size))
+                elif entry.name.endswith(".pkl"):
+                    # entries of the previous pickle based format are never read again
+                    try:
+                        os.remove(entry.path)
+                    except OSError:
+                        pass
+
+        entries.sort()
+        self._entries = OrderedDict((key, size) for _, key, size in entries)
+        self._size = sum(self._entries.values())
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}{ENTRY_SUFFIX}")
+
+    def make_key(
+            self,
+            image_path: str,
+            ocr_config: OCRModelConfig,
+            line_config: LineDetectionConfig | LayoutDetectionConfig,
+            **ocr_args
+    ) -> str | None:
+        """
+        Returns the cache key of an image and a pipeline setup, or None if the cache is disabled or a file can't be read.
+        """
+        if not self.enabled:
+            return None
+
+        try:
+            ocr_fields = {k: _to_key_value(v) for k, v in asdict(ocr_config).items() if k != "model_file"}
+            # the tile batch size only changes how the tiles are run, not the line mask
+            line_fields = {k: v for k, v in asdict(line_config).items() if k not in ("model_file", "tile_batch_size")}
+            if not line_config.skip_background_tiles:
+                del line_fields["background_ink_ratio"]
+
+            key_data = {
+                "version": CACHE_VERSION,
+                "image": get_file_hash(image_path),
+                "ocr_model": get_file_hash(ocr_config.model_file),
+                "ocr_config": ocr_fields,
+                "line_model": get_file_hash(line_config.model_file),
+                "line_config": [type(line_config).__name__, line_fields],
+                "args": {k: _to_key_value(ocr_args[k]) for k in KEY_ARGS if k in ocr_args}
+            }
+        except OSError as e:
+            logging.warning(f"Failed to build OCR cache key for {image_path}: {e}")
+            return None
+
+        return hashlib.sha256(json.dumps(key_data, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def get(self, key: str | None, guid=None) -> OCResult | None:
+        """
+        Returns the cached OCResult for key with the given page guid. Line guids are regenerated,
+        so the same scan imported twice doesn't share line ids.
+        """
+        if key is None or not self.enabled:
+            return None
+
+        with self._lock:
+            self._load_index()
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+
+        entry_path = self._entry_path(key)
+
+        try:
+            data = unpack_cache_entry(entry_path)
+            result = deserialize_ocr_result(data, guid)
+            os.utime(entry_path)
+        except Exception as e:
+            logging.warning(f"Dropping unreadable OCR cache entry {key}: {e}")
+            self._remove(key)
+            return None
+
+        line_guids = {}
+
+        for line in result.lines:
+            line_guids[line.guid] = uuid1()
+            line.guid = line_guids[line.guid]
+
+        for ocr_line in result.text:
+            ocr_line.guid = line_guids.get(ocr_line.guid, ocr_line.guid)
+
+        return result
+
+    def put(self, key: str | None, result: OCResult):
+        if key is None or not self.enabled:
+            return
+
+        data = pack_cache_entry(serialize_ocr_result(result))
+        entry_path = self._entry_path(key)
+        tmp_path = f"{entry_path}.{threading.get_ident()}.tmp"
+
+        try:
+            os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, entry_path)
+        except OSError as e:
+            logging.warning(f"Failed to write OCR cache entry {key}: {e}")
+            return
+
+        with self._lock:
+            self._load_index()
+            self._size += len(data) - self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            evicted = self._evict()
+
+        for evicted_key in evicted:
+            self._delete_file(evicted_key)
+
+    def clear(self):
+        with self._lock:
+            self._load_index()
+            keys = list(self._entries.keys())
+            self._entries.clear()
+            self._size = 0
+
+        for key in keys:
+            self._delete_file(key)
+
+    def _evict(self):
+        evicted = []
+
+        while self._size > self.max_size and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._size -= size
+            evicted.append(key)
+
+        return evicted
+
+    def _remove(self, key: str):
+        with self._lock:
+            self._size -= self._entries.pop(key, 0)
+
+        self._delete_file(key)
+
+    def _delete_file(self, key: str):
+        try:
+            os.remove(self._entry_path(key))
+        except OSError:
+            pass
+
+
+class CachedExecutor:
+    """
+    Wraps a StagedOCRPipeline or OCRProcessPool: pages with a cached result are reported right away,
+    only the remaining pages are passed on to the executor and their results are added to the cache.
+    """
+
+    def __init__(
+            self,
+            executor,
+            cache: OCRResultCache,
+            ocr_config: OCRModelConfig,
+            line_config: LineDetectionConfig | LayoutDetectionConfig,
+            **ocr_args
+    ):
+        self.executor = executor
+        self.cache = cache
+        self.ocr_config = ocr_config
+        self.line_config = line_config
+        self.ocr_args = ocr_args
+        self._stopped = False
+
+    def stop(self):
+        self._stopped = True
+        self.executor.stop()
+
+    def run(
+            self,
+            pages: Sequence[Tuple[object, str]],
+            on_result: Callable[[int, object, OCResult], None],
+            on_error: Callable[[int, object, str], None]
+    ):
+        missing = []
+        keys: Dict[int, str | None] = {}
+
+        for idx, (key, image_path) in enumerate(pages):
+            if self._stopped:
+                return
+
+            cache_key = self.cache.make_key(image_path, self.ocr_config, self.line_config, **self.ocr_args)
+            result = self.cache.get(cache_key, getattr(key, "guid", None))
+
+            if result is not None:
+                on_result(idx, key, result)
+            else:
+                keys[len(missing)] = cache_key
+                missing.append((idx, key, image_path))
+
+        if len(missing) == 0 or self._stopped:
+            return
+
+        def handle_result(sub_idx: int, key, result: OCResult):
+            self.cache.put(keys[sub_idx], result)
+            on_result(missing[sub_idx][0], key, result)
+
+        def handle_error(sub_idx: int, key, msg: str):
+            on_error(missing[sub_idx][0], key, msg)
+
+        self.executor.run([(key, image_path) for _, key, image_path in missing], handle_result, handle_error)
@@ -2,8 +2,11 @@ from uuid import UUID
 from enum import Enum
 import numpy.typing as npt
 from dataclasses import dataclass
-from typing import Dict, List, Tuple
-from PySide6.QtGui import QImage
+from typing import Dict, List, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from PySide6.QtGui import QImage
+    from BDRC.Trace import PageTrace
 
 class OpStatus(Enum):
     SUCCESS = 0
@@ -56,6 +59,16 @@ class TPSMode(Enum):
     LOCAL = 1
 
 
+class KFactorSearch(Enum):
+    Iterative = 0
+    Bisect = 1
+
+
+class CTCDecoding(Enum):
+    Greedy = 0
+    BeamSearch = 1
+
+
 class Language(Enum):
     English = 0
     German = 1
@@ -88,6 +101,16 @@ class Line:
     center: Tuple[int, int]
 
 
+@dataclass
+class ContourTable:
+    contours: List[npt.NDArray]  # views into points, shaped like the output of cv2.findContours
+    points: npt.NDArray  # (N, 2) int32 points of all contours
+    offsets: npt.NDArray  # (n + 1,) start of each contour in points
+    areas: npt.NDArray  # (n,)
+    bboxes: npt.NDArray  # (n, 4) x, y, w, h
+    rects: npt.NDArray  # (n, 5) center x, center y, w, h, angle of the minAreaRect, NaN if not computed
+
+
 @dataclass
 class OCRLine:
     guid: UUID
@@ -120,7 +143,7 @@ class OCRData:
     guid: UUID
     image_path: str
     image_name: str
-    qimage: QImage
+    qimage: "QImage"
     ocr_lines: List[OCRLine] | None
     lines: List[Line] | None
     preview: npt.NDArray | None
@@ -131,6 +154,12 @@ class OCRData:
 class LineDetectionConfig:
     model_file: str
     patch_size: int
+    tile_batch_size: int = 8  # max. tiles per onnx call, 0 runs all tiles of a page at once
+    tile_overlap: int = 0  # pixels shared by neighbouring tiles, their predictions are blended
+    skip_background_tiles: bool = False  # background tiles are not run through the model, their prediction is empty
+    background_ink_ratio: float = 0.001  # max. share of ink pixels of a binarized tile that still counts as background
+    detection_scale: float = 1.0  # the page is downscaled by this factor for the detection, the mask is scaled back
+    target_line_height: int = 0  # if > 0 the page is downscaled so that its lines are about this many pixels apart
 
 
 @dataclass
@@ -138,6 +167,12 @@ class LayoutDetectionConfig:
     model_file: str
     patch_size: int
     classes: List[str]
+    tile_batch_size: int = 8
+    tile_overlap: int = 0
+    skip_background_tiles: bool = False
+    background_ink_ratio: float = 0.001
+    detection_scale: float = 1.0
+    target_line_height: int = 0
 
 
 @dataclass
@@ -154,6 +189,7 @@ class OCRModelConfig:
     charset: List[str]
     add_blank: bool
     version: str
+    ctc_decoding: CTCDecoding = CTCDecoding.BeamSearch
 
 
 @dataclass
@@ -179,6 +215,7 @@ class OCResult:
     lines: List[Line]
     text: List[OCRLine]
     angle: float
+    trace: "PageTrace | None" = None  # stage timings, only set if tracing was enabled
 
 @dataclass
 class OCRSample:
@@ -207,9 +244,22 @@ class OCRSettings:
     tps_mode: TPSMode
     output_encoding: Encoding
 
+@dataclass
+class PipelineSettings:
+    prefetch_workers: int = 1
+    detection_workers: int = 1
+    geometry_workers: int = 2
+    recognition_workers: int = 1
+    queue_size: int = 4
+    line_batch_size: int = 64
+    process_workers: int = 0  # > 0 runs the pages in that many worker processes instead
+    trace: bool = False  # record a PageTrace for every page, see OCResult.trace
+
 @dataclass
 class AppSettings:
     model_path: str
     language: Language
     encoding: Encoding
     theme: Theme
+    result_cache: bool = True
+    result_cache_size: int = 1024  # MB
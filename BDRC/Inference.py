@@ -1,17 +1,25 @@
 import cv2
 import pyewts
+import hashlib
+import threading
 import numpy as np
 import numpy.typing as npt
 import onnxruntime as ort
-from typing import List, Union
+from uuid import uuid1
+from dataclasses import replace
+from collections import deque, OrderedDict
+from typing import List, Tuple, Union
 
 
-from scipy.special import softmax
 from Config import COLOR_DICT, CHARSETENCODER
+from BDRC.Trace import PageTrace, NO_TRACE
 from BDRC.Data import (
+    Line,
     OCRLine,
     OpStatus,
     TPSMode,
+    KFactorSearch,
+    CTCDecoding,
     Encoding,
     OCRModelConfig,
     LineDetectionConfig,
@@ -23,24 +31,35 @@ from BDRC.Utils import (
     apply_global_tps,
     build_line_data,
     extract_line_images,
+    get_line_images_via_local_tps,
     optimize_countour,
     preprocess_image,
     binarize,
-    normalize,
+    binarize_gray,
+    get_ink_ratio,
+    estimate_line_height,
+    get_tile_view,
+    normalize_tiles,
     sort_lines_by_threshold2,
     stitch_predictions,
-    tile_image,
-    sigmoid,
+    blend_predictions,
+    logit,
     pad_to_height,
     pad_to_width,
-    build_raw_line_data,
-    filter_line_contours,
-    check_for_tps, get_execution_providers
+    build_line_geometry,
+    chain_page_maps,
+    get_global_tps_maps,
+    warp_image,
+    DeferredWarp,
+    rotate_from_angle,
+    filter_contour_table,
+    check_for_tps, get_execution_providers,
+    get_session_options
 )
 
 
 class CTCDecoder:
-    def __init__(self, charset: str | List[str], add_blank: bool):
+    def __init__(self, charset: str | List[str], add_blank: bool, decoding: CTCDecoding = CTCDecoding.BeamSearch):
 
         if isinstance(charset, str):
             self.charset = [x for x in charset]
@@ -53,7 +72,11 @@ class CTCDecoder:
 
         if self.add_blank:
             self.ctc_vocab.insert(0, " ")
-        self.ctc_decoder = build_ctcdecoder(self.ctc_vocab)
+
+        self.decoding = decoding
+        self.ctc_decoder = build_ctcdecoder(self.ctc_vocab) if decoding == CTCDecoding.BeamSearch else None
+        # like pyctcdecode, an output beyond the vocab is the blank
+        self._greedy_labels = np.array(self.ctc_vocab + [""], dtype=object)
 
     def encode(self, label: str):
         return [self.charset.index(x) + 1 for x in label]
@@ -61,30 +84,107 @@ class CTCDecoder:
     def decode(self, inputs: List[int]) -> str:
         return "".join(self.charset[x - 1] for x in inputs)
 
+    def greedy_decode(self, logits: npt.NDArray) -> str:
+        """
+        Best path decoding of (time, vocab) logits: the most likely label per time step, repeats collapsed and the
+        blank and spaces dropped, as in the result of the beam search.
+        """
+        best_path = np.argmax(logits, axis=-1)
+        if len(best_path) == 0:
+            return ""
+
+        changes = np.empty(len(best_path), dtype=bool)
+        changes[0] = True
+        np.not_equal(best_path[1:], best_path[:-1], out=changes[1:])
+        labels = self._greedy_labels[best_path[changes]]
+
+        return "".join(labels).replace(" ", "")
+
     def ctc_decode(self, logits):
+        if self.decoding == CTCDecoding.Greedy:
+            return self.greedy_decode(logits)
+
         return self.ctc_decoder.decode(logits).replace(" ", "")
 
 
+# logit of the classes of skipped background tiles, only used for the pixels that no active tile covers
+BACKGROUND_LOGIT = -1e4
+
+
 class Detection:
-    def __init__(self, platform: Platform, config: LineDetectionConfig | LayoutDetectionConfig):
+    def __init__(self, platform: Platform, config: LineDetectionConfig | LayoutDetectionConfig, num_threads: int = 0):
         self.platform = platform
         self.config = config
         self._config_file = config
         self._onnx_model_file = config.model_file
         self._patch_size = config.patch_size
+        self._tile_batch_size = config.tile_batch_size
+        self._tile_overlap = min(max(0, config.tile_overlap), self._patch_size // 2)
+        self._skip_background_tiles = config.skip_background_tiles
+        self._background_ink_ratio = config.background_ink_ratio
+        self._detection_scale = config.detection_scale
+        self._target_line_height = config.target_line_height
+        self._tile_buffers = threading.local()
         self._execution_providers = get_execution_providers()
         self._inference = ort.InferenceSession(
-            self._onnx_model_file, providers=self._execution_providers
+            self._onnx_model_file, sess_options=get_session_options(num_threads), providers=self._execution_providers
         )
 
-    def _preprocess_image(self, image: npt.NDArray, patch_size: int = 512):
-        padded_img, pad_x, pad_y = preprocess_image(image, patch_size)
-        tiles, y_steps = tile_image(padded_img, patch_size)
-        tiles = [binarize(x) for x in tiles]
-        tiles = [normalize(x) for x in tiles]
-        tiles = np.array(tiles)
+    def _get_tile_buffer(self, shape: Tuple[int, ...]) -> npt.NDArray:
+        """
+        The model input buffer of the calling thread, which is reused for all pages with the same number of tiles.
+        """
+        buffer = getattr(self._tile_buffers, "tiles", None)
+        if buffer is None or buffer.shape != shape:
+            buffer = np.empty(shape, dtype=np.float32)
+            self._tile_buffers.tiles = buffer
+
+        return buffer
+
+    def _get_detection_scale(self, image: npt.NDArray) -> float:
+        """
+        The factor by which the page is downscaled for the detection: target_line_height over the estimated line
+        distance of the page if a target is set, else detection_scale. Pages are never upscaled.
+        """
+        scale = self._detection_scale
+
+        if self._target_line_height > 0:
+            line_height = estimate_line_height(image)
+            if line_height > 0:
+                scale = self._target_line_height / line_height
+
+        return min(1.0, scale) if scale > 0 else 1.0
 
-        return padded_img, tiles, y_steps, pad_x, pad_y
+    def _preprocess_image(self, image: npt.NDArray, patch_size: int = 512, trace: PageTrace = NO_TRACE):
+        """
+        Returns the padded image, the normalized (N, C, H, W) tiles, the number of tile rows, the paddings and for
+        every tile whether it has to be run through the model, i.e. whether it has more ink than background_ink_ratio
+        if background tiles are skipped. The page is binarized as a whole, so the tiles don't have seams from
+        thresholding each tile on its own. The tiles are only valid until the next call from the same thread.
+        The page is downscaled according to the detection resolution settings first, the paddings refer to the
+        scaled page and _crop_prediction resizes the mask back to the size of the original image.
+        """
+        with trace.stage("detection_tiling", image_shape=image.shape) as info:
+            scale = self._get_detection_scale(image)
+            if scale < 1.0:
+                image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            info["detection_scale"] = scale
+
+            padded_img, pad_x, pad_y = preprocess_image(image, patch_size, overlap=self._tile_overlap)
+            tile_view = get_tile_view(binarize_gray(padded_img), patch_size, self._tile_overlap)
+            y_steps, x_steps = tile_view.shape[:2]
+
+            if self._skip_background_tiles:
+                active = get_ink_ratio(tile_view).reshape(-1) > self._background_ink_ratio
+            else:
+                active = np.ones(y_steps * x_steps, dtype=bool)
+
+            tiles = self._get_tile_buffer((y_steps * x_steps, 3, patch_size, patch_size))
+            normalize_tiles(tile_view, out=tiles)
+            info["tiles"] = tiles.shape[0]
+            info["skipped_tiles"] = int((~active).sum())
+
+        return padded_img, tiles, y_steps, pad_x, pad_y, active
 
     def _crop_prediction(
             self, image: npt.NDArray, prediction: npt.NDArray, x_pad: int, y_pad: int
@@ -93,46 +193,91 @@ class Detection:
         y_lim = prediction.shape[0] - y_pad
 
         prediction = prediction[:y_lim, :x_lim]
-        prediction = cv2.resize(prediction, dsize=(image.shape[1], image.shape[0]))
+        prediction = cv2.resize(
+            prediction, dsize=(image.shape[1], image.shape[0]), interpolation=cv2.INTER_NEAREST
+        )
 
         return prediction
 
-    def _predict(self, image_batch: npt.NDArray):
-        image_batch = np.transpose(image_batch, axes=[0, 3, 1, 2])
-        ort_batch = ort.OrtValue.ortvalue_from_numpy(image_batch)
-        prediction = self._inference.run_with_ort_values(
-            ["output"], {"input": ort_batch}
-        )
-        prediction = prediction[0].numpy()
+    def _predict(self, image_batch: npt.NDArray, trace: PageTrace = NO_TRACE):
+        with trace.stage("detection_inference", batch_shape=image_batch.shape):
+            ort_batch = ort.OrtValue.ortvalue_from_numpy(image_batch)
+            prediction = self._inference.run_with_ort_values(
+                ["output"], {"input": ort_batch}
+            )
+            prediction = prediction[0].numpy()
 
         return prediction
 
-    def predict(self, image: npt.NDArray, class_threshold: float = 0.8) -> npt.NDArray:
+    def _background_logits(self) -> npt.NDArray:
+        """
+        The logits per class of a skipped background tile, by default every output channel of the model is far
+        below any class threshold. Models with an explicit background class override this.
+        """
+        n_classes = self._inference.get_outputs()[0].shape[1]
+
+        return np.full(n_classes if isinstance(n_classes, int) else 1, BACKGROUND_LOGIT)
+
+    def _predict_tiles(self, tiles: npt.NDArray, active: npt.NDArray, trace: PageTrace = NO_TRACE) -> npt.NDArray:
+        """
+        Runs the active tiles through the model in batches of at most tile_batch_size tiles, which bounds the memory
+        of the model activations for large pages. Returns the (N, H, W, C) logits of all tiles, the masks are
+        thresholded on the logits so that no activation has to be computed for every pixel.
+        """
+        indices = np.flatnonzero(active)
+        batch_size = self._tile_batch_size if self._tile_batch_size > 0 else max(1, len(indices))
+
+        background = self._background_logits().astype(np.float32)
+        logits = np.empty((tiles.shape[0],) + tiles.shape[2:] + background.shape, dtype=np.float32)
+        logits[~active] = background
+
+        for start in range(0, len(indices), batch_size):
+            batch = indices[start:start + batch_size]
+            # consecutive tiles are passed as a view of the tile buffer
+            if batch[-1] - batch[0] + 1 == len(batch):
+                batch = slice(batch[0], batch[-1] + 1)
+            prediction = self._predict(tiles[batch], trace)
+            logits[batch] = np.transpose(prediction, axes=[0, 2, 3, 1])
+
+        return logits
+
+    def _merge_tiles(
+            self, prediction: npt.NDArray, y_steps: int, active: npt.NDArray, trace: PageTrace = NO_TRACE
+    ) -> npt.NDArray:
+        with trace.stage("stitch_predictions"):
+            if self._tile_overlap > 0:
+                return blend_predictions(prediction, y_steps, self._tile_overlap, active)
+
+            return stitch_predictions(prediction, y_steps=y_steps)
+
+    def predict(self, image: npt.NDArray, trace: PageTrace = NO_TRACE) -> npt.NDArray:
         pass
 
 
 class LineDetection(Detection):
-    def __init__(self, platform: Platform, config: LineDetectionConfig) -> None:
-        super().__init__(platform, config)
-
-    def predict(self, image: npt.NDArray, class_threshold: float = 0.9) -> npt.NDArray:
-        _, tiles, y_steps, pad_x, pad_y = self._preprocess_image(
-            image, patch_size=self._patch_size)
-        prediction = self._predict(tiles)
-        prediction = np.squeeze(prediction, axis=1)
-        prediction = sigmoid(prediction)
-        prediction = np.where(prediction > class_threshold, 1.0, 0.0)
-        merged_image = stitch_predictions(prediction, y_steps=y_steps)
-        merged_image = self._crop_prediction(image, merged_image, pad_x, pad_y)
-        merged_image = merged_image.astype(np.uint8)
-        merged_image *= 255
+    def __init__(self, platform: Platform, config: LineDetectionConfig, num_threads: int = 0) -> None:
+        super().__init__(platform, config, num_threads)
+
+    def predict(self, image: npt.NDArray, class_threshold: float = 0.9, trace: PageTrace = NO_TRACE) -> npt.NDArray:
+        _, tiles, y_steps, pad_x, pad_y, active = self._preprocess_image(
+            image, patch_size=self._patch_size, trace=trace)
+        prediction = self._predict_tiles(tiles, active, trace)
+        merged_image = self._merge_tiles(prediction[..., 0], y_steps, active, trace)
+
+        with trace.stage("detection_threshold"):
+            # sigmoid(x) > class_threshold without computing the sigmoid
+            merged_image = (merged_image > logit(class_threshold)).astype(np.uint8)
+            merged_image *= 255
+
+        with trace.stage("resize_prediction", mask_shape=merged_image.shape):
+            merged_image = self._crop_prediction(image, merged_image, pad_x, pad_y)
 
         return merged_image
 
 
 class LayoutDetection(Detection):
-    def __init__(self, platform: Platform, config: LayoutDetectionConfig, debug: bool = False) -> None:
-        super().__init__(platform, config)
+    def __init__(self, platform: Platform, config: LayoutDetectionConfig, debug: bool = False, num_threads: int = 0) -> None:
+        super().__init__(platform, config, num_threads)
         self._classes = config.classes
         self._debug = debug
 
@@ -204,23 +349,36 @@ class LayoutDetection(Detection):
 
         return image
 
-    def predict(self, image: npt.NDArray, class_threshold: float = 0.8) -> npt.NDArray:
-        _, tiles, y_steps, pad_x, pad_y = self._preprocess_image(
-            image, patch_size=self._patch_size)
-        prediction = self._predict(tiles)
-        prediction = np.transpose(prediction, axes=[0, 2, 3, 1])
-        prediction = softmax(prediction, axis=-1)
-        prediction = np.where(prediction > class_threshold, 1.0, 0)
-        merged_image = stitch_predictions(prediction, y_steps=y_steps)
-        merged_image = self._crop_prediction(image, merged_image, pad_x, pad_y)
-        merged_image = merged_image.astype(np.uint8)
-        merged_image *= 255
+    def _background_logits(self) -> npt.NDArray:
+        # the first class is the background
+        logits = np.full(len(self._classes), BACKGROUND_LOGIT)
+        logits[0] = 0.0
+
+        return logits
+
+    def predict(self, image: npt.NDArray, trace: PageTrace = NO_TRACE) -> npt.NDArray:
+        """
+        Returns a (H, W, classes) uint8 mask in which every pixel is set (255) for its most likely class only.
+        """
+        _, tiles, y_steps, pad_x, pad_y, active = self._preprocess_image(
+            image, patch_size=self._patch_size, trace=trace)
+        prediction = self._predict_tiles(tiles, active, trace)
+        merged_image = self._merge_tiles(prediction, y_steps, active, trace)
+
+        with trace.stage("detection_threshold"):
+            # the argmax of the logits is the argmax of the softmax
+            labels = np.argmax(merged_image, axis=-1).astype(np.uint8)
+
+        with trace.stage("resize_prediction", mask_shape=labels.shape):
+            labels = self._crop_prediction(image, labels, pad_x, pad_y)
+            merged_image = (labels[..., None] == np.arange(len(self._classes), dtype=np.uint8)).astype(np.uint8)
+            merged_image *= 255
 
         return merged_image
 
 
 class OCRInference:
-    def __init__(self, platform: Platform, ocr_config: OCRModelConfig):
+    def __init__(self, platform: Platform, ocr_config: OCRModelConfig, batch_size: int = 16, num_threads: int = 0):
         self.platform = platform
         self.config = ocr_config
         self._onnx_model_file = ocr_config.model_file
@@ -231,12 +389,27 @@ class OCRInference:
         self._characters = ocr_config.charset
         self._squeeze_channel_dim = ocr_config.squeeze_channel
         self._swap_hw = ocr_config.swap_hw
+        self._batch_size = max(1, batch_size)
         self._execution_providers = get_execution_providers()
         self.ocr_session = ort.InferenceSession(
-            self._onnx_model_file, providers=self._execution_providers
+            self._onnx_model_file, sess_options=get_session_options(num_threads), providers=self._execution_providers
         )
         self._add_blank = ocr_config.add_blank
-        self.decoder = CTCDecoder(self._characters, self._add_blank)
+        self.decoder = CTCDecoder(self._characters, self._add_blank, ocr_config.ctc_decoding)
+        self._static_batch_size = self._get_static_batch_size()
+
+    def _get_static_batch_size(self) -> int | None:
+        """
+        Returns the batch dimension of the input layer if the model was exported with a fixed one (often 1),
+        None if it is dynamic.
+        """
+        inputs = self.ocr_session.get_inputs()
+        input_layer = next((x for x in inputs if x.name == self._input_layer), inputs[0])
+
+        if len(input_layer.shape) > 0 and isinstance(input_layer.shape[0], int) and input_layer.shape[0] > 0:
+            return input_layer.shape[0]
+
+        return None
 
     def _pad_ocr_line(
             self,
@@ -296,6 +469,36 @@ class OCRInference:
 
         return logits
 
+    def _predict_batch(self, image_batch: npt.NDArray) -> List[npt.NDArray]:
+        """
+        Runs a stacked batch of prepared line images through the session and returns the per-line logits.
+        Unlike _predict, only the batch axis is split off, so single-line chunks keep their time/vocab axes.
+        A chunk that is smaller than a static batch dimension is padded with blank lines, their logits are dropped.
+        """
+        batch_size = image_batch.shape[0]
+        image_batch = image_batch.astype(np.float32)
+
+        if self._static_batch_size is not None and batch_size < self._static_batch_size:
+            padding = np.zeros((self._static_batch_size - batch_size, *image_batch.shape[1:]), dtype=np.float32)
+            image_batch = np.concatenate([image_batch, padding], axis=0)
+
+        ort_batch = ort.OrtValue.ortvalue_from_numpy(image_batch)
+        ocr_results = self.ocr_session.run_with_ort_values(
+            [self._output_layer], {self._input_layer: ort_batch}
+        )
+
+        logits = ocr_results[0].numpy()
+
+        run_size = image_batch.shape[0]
+
+        # some exports emit (time, batch, vocab) instead of (batch, ...)
+        if logits.shape[0] != run_size and logits.ndim > 1 and logits.shape[1] == run_size:
+            logits = np.swapaxes(logits, 0, 1)
+
+        logits = logits.reshape(run_size, *logits.shape[1:])[:batch_size]
+
+        return [np.squeeze(x) for x in logits]
+
     def _decode(self, logits: npt.NDArray) -> str:
         if logits.shape[0] == len(self.decoder.ctc_vocab):
             logits = np.transpose(
@@ -306,23 +509,348 @@ class OCRInference:
 
         return text
 
-    def run(self, line_image: npt.NDArray, pre_pad: bool = True) -> str:
+    def run(self, line_image: npt.NDArray, pre_pad: bool = True, trace: PageTrace = NO_TRACE) -> str:
+
+        with trace.stage("line_preprocessing", lines=1):
+            if pre_pad:
+                line_image = self._pre_pad(line_image)
+            line_image = self._prepare_ocr_line(line_image)
 
-        if pre_pad:
-            line_image = self._pre_pad(line_image)
-        line_image = self._prepare_ocr_line(line_image)
+            if self._swap_hw:
+                line_image = np.transpose(line_image, axes=[0, 2, 1])
 
-        if self._swap_hw:
-            line_image = np.transpose(line_image, axes=[0, 2, 1])
+            if not self._squeeze_channel_dim:
+                line_image = np.expand_dims(line_image, axis=1)
 
-        if not self._squeeze_channel_dim:
-            line_image = np.expand_dims(line_image, axis=1)
+        with trace.stage("ocr_inference", lines=1):
+            logits = self._predict(line_image)
 
-        logits = self._predict(line_image)
-        text = self._decode(logits)
+        with trace.stage("ctc_decode", lines=1):
+            text = self._decode(logits)
 
         return text
 
+    def run_batch(
+            self,
+            line_images: List[npt.NDArray],
+            pre_pad: bool = True,
+            batch_size: int | None = None,
+            trace: PageTrace = NO_TRACE
+    ) -> List[str]:
+        """
+        Preprocesses all line images of a page into a single tensor and runs it through the session
+        in chunks of batch_size lines, returning the decoded text for each line in input order.
+        """
+        if len(line_images) == 0:
+            return []
+
+        if batch_size is None:
+            batch_size = self._batch_size
+
+        # models exported with a fixed batch dimension only accept chunks of exactly that size
+        if self._static_batch_size is not None:
+            batch_size = self._static_batch_size
+
+        with trace.stage("line_preprocessing", lines=len(line_images)) as info:
+            prepared = []
+            for line_image in line_images:
+                if pre_pad:
+                    line_image = self._pre_pad(line_image)
+                prepared.append(self._prepare_ocr_line(line_image))
+
+            line_batch = np.stack(prepared, axis=0)  # (N, 1, H, W)
+
+            if self._swap_hw:
+                line_batch = np.transpose(line_batch, axes=[0, 1, 3, 2])
+
+            if self._squeeze_channel_dim:
+                line_batch = np.squeeze(line_batch, axis=1)
+
+            info["batch_shape"] = line_batch.shape
+
+        texts = []
+        for start in range(0, line_batch.shape[0], batch_size):
+            chunk = line_batch[start:start + batch_size]
+
+            with trace.stage("ocr_inference", lines=chunk.shape[0]):
+                chunk_logits = self._predict_batch(chunk)
+
+            with trace.stage("ctc_decode", lines=chunk.shape[0]):
+                for logits in chunk_logits:
+                    texts.append(self._decode(logits))
+
+        return texts
+
+
+class LineBatchScheduler:
+    """
+    Collects the line images of consecutive pages into a shared recognition queue and runs them through
+    OCRInference in fixed-size batches, so that short pages (title leaves, colophons etc.) don't under-fill a batch.
+    Pages are handed back in submission order as soon as all of their lines are recognized.
+    """
+
+    def __init__(self, ocr_inference: OCRInference, batch_size: int = 64):
+        self.ocr_inference = ocr_inference
+        self.batch_size = max(1, batch_size)
+        self._pages = deque()  # [page_key, texts, pending line count, trace]
+        self._queue = deque()  # (page entry, line index, line image)
+
+    def pending_lines(self) -> int:
+        return len(self._queue)
+
+    def pending_pages(self) -> int:
+        return len(self._pages)
+
+    def submit(self, page_key, line_images: List[npt.NDArray], trace: PageTrace = NO_TRACE) -> List[Tuple[object, List[str]]]:
+        """
+        Queues the line images of a page and runs all full batches that are available.
+        Returns the (page_key, texts) pairs of all pages that got completed by this call.
+        The recognition time of a batch is added to the traces of its pages by their share of lines.
+        """
+        entry = [page_key, [""] * len(line_images), len(line_images), trace]
+        self._pages.append(entry)
+
+        for idx, line_image in enumerate(line_images):
+            self._queue.append((entry, idx, line_image))
+
+        while len(self._queue) >= self.batch_size:
+            self._run_batch(self.batch_size)
+
+        return self._collect_completed()
+
+    def flush(self) -> List[Tuple[object, List[str]]]:
+        """
+        Runs the remaining, partially filled batch and returns all pages that are complete afterwards.
+        """
+        while len(self._queue) > 0:
+            self._run_batch(min(self.batch_size, len(self._queue)))
+
+        return self._collect_completed()
+
+    def drain(self) -> List[Tuple[object, List[str]]]:
+        """
+        Drops all queued lines and returns the (page_key, texts) pairs of the pages that were still pending.
+        """
+        pending = [(x[0], x[1]) for x in self._pages]
+        self._pages.clear()
+        self._queue.clear()
+
+        return pending
+
+    def _run_batch(self, size: int):
+        batch = [self._queue.popleft() for _ in range(size)]
+        traced = any(x[0][3].enabled for x in batch)
+        batch_trace = PageTrace() if traced else NO_TRACE
+        texts = self.ocr_inference.run_batch([x[2] for x in batch], batch_size=size, trace=batch_trace)
+
+        for (entry, idx, _), text in zip(batch, texts):
+            entry[1][idx] = text
+            entry[2] -= 1
+
+        if traced:
+            page_lines = {}
+            for entry, _, _ in batch:
+                page_lines.setdefault(id(entry), [entry, 0])[1] += 1
+
+            for entry, count in page_lines.values():
+                entry[3].add_share(batch_trace, count / size)
+
+    def _collect_completed(self) -> List[Tuple[object, List[str]]]:
+        completed = []
+
+        while len(self._pages) > 0 and self._pages[0][2] == 0:
+            page_key, texts, _, _ = self._pages.popleft()
+            completed.append((page_key, texts))
+
+        return completed
+
+
+class LineDataCache:
+    """
+    Size-bounded in-memory LRU cache for the detection output (line mask) and the extracted line data
+    (rot_mask, sorted lines, line images, angle) of a page, so that switching the recognition model
+    or re-running a page only runs OCRInference again. Entries are shared by all threads of a pipeline.
+    """
+
+    def __init__(self, max_size: int = 1024 * 1024 * 1024):
+        self.max_size = max_size
+        self._entries = OrderedDict()  # key -> (value, size)
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value, size: int):
+        if size > self.max_size:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._entries.pop(key)[1]
+
+            self._entries[key] = (value, size)
+            self._size += size
+
+            while self._size > self.max_size:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+def get_geometry_args(
+        k_factor: float = 2.5,
+        bbox_tolerance: float = 4.0,
+        merge_lines: bool = True,
+        use_tps: bool = False,
+        tps_mode: TPSMode = TPSMode.GLOBAL,
+        tps_threshold: float = 0.25,
+        tps_tolerance: float = 0.01
+) -> dict:
+    """
+    The arguments of extract_page_lines that change its result, they are also the line data cache key.
+    """
+    return {
+        "k_factor": k_factor,
+        "bbox_tolerance": bbox_tolerance,
+        "merge_lines": merge_lines,
+        "use_tps": use_tps,
+        "tps_mode": tps_mode,
+        "tps_threshold": tps_threshold,
+        "tps_tolerance": tps_tolerance
+    }
+
+
+def copy_lines(lines: List[Line]) -> List[Line]:
+    """
+    Copies of cached lines with new guids, so that pages with the same content don't share line identities.
+    """
+    return [Line(guid=uuid1(), contour=x.contour.copy(), bbox=replace(x.bbox), center=x.center) for x in lines]
+
+
+def get_image_key(image: npt.NDArray) -> str:
+    image = np.ascontiguousarray(image)
+    image_hash = hashlib.blake2b(image.data, digest_size=20)
+    image_hash.update(str((image.shape, image.dtype.str)).encode("ascii"))
+
+    return image_hash.hexdigest()
+
+
+def extract_page_lines(
+        image: npt.NDArray,
+        line_mask: npt.NDArray,
+        k_factor: float = 2.5,
+        bbox_tolerance: float = 4.0,
+        merge_lines: bool = True,
+        use_tps: bool = False,
+        tps_mode: TPSMode = TPSMode.GLOBAL,
+        tps_threshold: float = 0.25,
+        tps_tolerance: float = 0.01,
+        k_search: KFactorSearch = KFactorSearch.Iterative,
+        num_threads: int = 0,
+        trace: PageTrace = NO_TRACE
+):
+    """
+    The geometry of OCRPipeline.extract_lines without the line cache, see there.
+    Returns (rot_mask, sorted_lines, line_images, page_angle) on success or an error message.
+    """
+    # Build line data, the page image is only rotated where the line images are cut from it
+    try:
+        with trace.stage("build_line_geometry", image_shape=image.shape) as info:
+            rot_mask, line_table, page_angle, rot_matrix = build_line_geometry(line_mask)
+            info["contours"] = len(line_table.contours)
+        if len(line_table.contours) == 0:
+            return OpStatus.FAILED, "No lines detected"
+    except Exception as e:
+        return OpStatus.FAILED, f"Line data building failed: {str(e)}"
+
+    # Filter contours
+    with trace.stage("filter_line_contours") as info:
+        filtered_contours = filter_contour_table(line_table, rot_mask.shape[1]).contours
+        info["lines"] = len(filtered_contours)
+    if len(filtered_contours) == 0:
+        return OpStatus.FAILED, "No valid lines after filtering"
+
+    # Handle TPS (dewarping)
+    try:
+        rot_img = DeferredWarp(image, matrix=rot_matrix) if page_angle != 0 else image
+        line_source = rot_img
+
+        if use_tps and tps_mode == TPSMode.GLOBAL:
+            with trace.stage("check_for_tps") as info:
+                ratio, tps_line_data = check_for_tps(rot_mask, filtered_contours)
+                info["ratio"] = ratio
+
+            if ratio > tps_threshold and tps_tolerance > 0:
+                # the dewarped mask is deskewed again, the page image gets both rotations and the dewarping in one remap
+                with trace.stage("apply_global_tps"):
+                    map_x, map_y = get_global_tps_maps(rot_mask.shape[0], rot_mask.shape[1], tps_line_data, tps_tolerance)
+                    # sampled like the mask of apply_global_tps, the contours are traced on it
+                    dewarped_mask = warp_image(rot_mask, np.stack([map_y, map_x]))
+                with trace.stage("build_line_geometry", image_shape=dewarped_mask.shape) as info:
+                    _, line_table, page_angle, dew_rot_matrix = build_line_geometry(dewarped_mask)
+                    info["contours"] = len(line_table.contours)
+                line_source = DeferredWarp(image, maps=chain_page_maps(rot_matrix, map_x, map_y, dew_rot_matrix))
+
+            elif ratio > tps_threshold:
+                rot_img = rot_img.to_array() if isinstance(rot_img, DeferredWarp) else rot_img
+                with trace.stage("apply_global_tps"):
+                    dewarped_img, dewarped_mask = apply_global_tps(rot_img, rot_mask, tps_line_data, tps_tolerance)
+                    if len(dewarped_mask.shape) == 3:
+                        dewarped_mask = cv2.cvtColor(dewarped_mask, cv2.COLOR_RGB2GRAY)
+                with trace.stage("build_line_geometry", image_shape=dewarped_img.shape) as info:
+                    _, line_table, page_angle, _ = build_line_geometry(dewarped_mask)
+                    line_source = rotate_from_angle(dewarped_img, page_angle)
+                    info["contours"] = len(line_table.contours)
+
+            if ratio > tps_threshold:
+                with trace.stage("filter_line_contours") as info:
+                    filtered_contours = filter_contour_table(line_table, rot_mask.shape[1]).contours
+                    info["lines"] = len(filtered_contours)
+
+        with trace.stage("sort_lines_by_threshold2", lines=len(filtered_contours)):
+            line_data = [build_line_data(x) for x in filtered_contours]
+            sorted_lines, _ = sort_lines_by_threshold2(rot_mask, line_data, group_lines=merge_lines)
+
+        tps_line_data = None
+        if use_tps and tps_mode == TPSMode.LOCAL:
+            with trace.stage("check_for_tps") as info:
+                ratio, tps_line_data = check_for_tps(rot_mask, [x.contour for x in sorted_lines])
+                info["ratio"] = ratio
+            if ratio == 0:
+                tps_line_data = None
+
+        with trace.stage("extract_line_images", lines=len(sorted_lines)) as info:
+            if tps_line_data is not None:
+                info["dewarped_lines"] = sum(1 for x in tps_line_data if x["tps"] is True)
+                line_images = get_line_images_via_local_tps(
+                    rot_img, tps_line_data, k_factor, bbox_tolerance, k_search,
+                    num_threads=num_threads, tps_tolerance=tps_tolerance
+                )
+            else:
+                line_images = extract_line_images(line_source, sorted_lines, k_factor, bbox_tolerance, k_search)
+    except Exception as e:
+        return OpStatus.FAILED, f"Line processing failed: {str(e)}"
+
+    if line_images is None or len(line_images) == 0:
+        return OpStatus.FAILED, "No valid line images extracted"
+
+    rot_mask = cv2.cvtColor(rot_mask, cv2.COLOR_GRAY2RGB)
+
+    return OpStatus.SUCCESS, (rot_mask, sorted_lines, line_images, page_angle)
+
 
 class OCRPipeline:
     """
@@ -335,42 +863,184 @@ class OCRPipeline:
             self,
             platform: Platform,
             ocr_config: OCRModelConfig,
-            line_config: LineDetectionConfig | LayoutDetectionConfig
+            line_config: LineDetectionConfig | LayoutDetectionConfig,
+            ocr_batch_size: int = 16,
+            num_threads: int = 0,
+            line_cache_size: int = 1024 * 1024 * 1024
     ):
+        """
+        line_cache_size is the memory budget in bytes for cached line masks and line data, 0 disables the cache.
+        """
         self.ready = False
         self.platform = platform
         self.ocr_model_config = ocr_config
         self.line_config = line_config
         self.encoder = ocr_config.encoder
-        self.ocr_inference = OCRInference(self.platform, self.ocr_model_config)
+        self.ocr_batch_size = ocr_batch_size
+        self.num_threads = num_threads
+        self.ocr_inference = OCRInference(self.platform, self.ocr_model_config, self.ocr_batch_size, self.num_threads)
         self.converter = pyewts.pyewts()
+        self.line_cache = LineDataCache(line_cache_size)
 
         if isinstance(self.line_config, LineDetectionConfig):
-            self.line_inference = LineDetection(self.platform, self.line_config)
+            self.line_inference = LineDetection(self.platform, self.line_config, num_threads=self.num_threads)
             self.ready = True
         elif isinstance(self.line_config, LayoutDetectionConfig):
-            self.line_inference = LayoutDetection(self.platform, self.line_config)
+            self.line_inference = LayoutDetection(self.platform, self.line_config, num_threads=self.num_threads)
             self.ready = True
         else:
             self.line_inference = None
             self.ready = False
 
     def update_ocr_model(self, config: OCRModelConfig):
+        # the line detection output doesn't depend on the OCR model, cached line data stays valid
         self.ocr_model_config = config
-        self.ocr_inference = OCRInference(self.platform, config)
+        self.encoder = config.encoder
+        self.ocr_inference = OCRInference(self.platform, config, self.ocr_batch_size, self.num_threads)
 
     def update_line_detection(self, config: Union[LineDetectionConfig, LayoutDetectionConfig]):
         if isinstance(config, LineDetectionConfig) and isinstance(self.line_config, LayoutDetectionConfig):
-            self.line_inference = LineDetection(self.platform, config)
+            self.line_inference = LineDetection(self.platform, config, num_threads=self.num_threads)
         elif isinstance(config, LayoutDetectionConfig) and isinstance(self.line_config, LineDetectionConfig):
-            self.line_inference = LayoutDetection(self.platform, config)
+            self.line_inference = LayoutDetection(self.platform, config, num_threads=self.num_threads)
 
         else:
             return
 
+        # keep the config in sync, detect_lines and worker processes dispatch on its type
+        self.line_config = config
+
+
+    def get_image_key(self, image: npt.NDArray) -> str | None:
+        """
+        Returns the line cache key of an image, or None if the line cache is disabled.
+        """
+        return get_image_key(image) if self.line_cache.enabled() else None
+
+    def _detection_key(self, image_key: str):
+        return (
+            image_key, type(self.line_config).__name__, self.line_config.model_file,
+            self.line_config.tile_overlap, self.line_config.skip_background_tiles,
+            self.line_config.background_ink_ratio if self.line_config.skip_background_tiles else None,
+            self.line_config.detection_scale, self.line_config.target_line_height
+        )
+
+    def _lines_key(self, image_key: str, geometry_args: dict):
+        return "lines", self._detection_key(image_key), tuple(sorted(geometry_args.items()))
+
+    def detect_lines(self, image: npt.NDArray, image_key: str | None = None, trace: PageTrace = NO_TRACE) -> npt.NDArray:
+        if image_key is not None:
+            line_mask = self.line_cache.get(("mask", self._detection_key(image_key)))
+            if line_mask is not None:
+                trace.record("detection_cached", 0.0)
+                return line_mask
+
+        if isinstance(self.line_config, LineDetectionConfig):
+            line_mask = self.line_inference.predict(image, trace=trace)
+        else:
+            layout_mask = self.line_inference.predict(image, trace=trace)
+            # a copy, a view of the channel would keep the whole layout mask alive in the line cache
+            line_mask = np.ascontiguousarray(layout_mask[:, :, 2])
+
+        if image_key is not None:
+            self.line_cache.put(("mask", self._detection_key(image_key)), line_mask, line_mask.nbytes)
+
+        return line_mask
+
+    def get_cached_lines(self, image_key: str | None, **geometry_args):
+        """
+        Returns the cached result of extract_lines for an image and geometry settings, or None.
+        The lines are copies with new guids.
+        """
+        if image_key is None:
+            return None
+
+        cached = self.line_cache.get(self._lines_key(image_key, geometry_args))
+
+        if cached is None:
+            return None
+
+        rot_mask, sorted_lines, line_images, page_angle = cached
+
+        return rot_mask, copy_lines(sorted_lines), list(line_images), page_angle
+
+    def extract_lines(self,
+                      image: npt.NDArray,
+                      line_mask: npt.NDArray,
+                      k_factor: float = 2.5,
+                      bbox_tolerance: float = 4.0,
+                      merge_lines: bool = True,
+                      use_tps: bool = False,
+                      tps_mode: TPSMode = TPSMode.GLOBAL,
+                      tps_threshold: float = 0.25,
+                      tps_tolerance: float = 0.01,
+                      k_search: KFactorSearch = KFactorSearch.Iterative,
+                      image_key: str | None = None,
+                      num_threads: int | None = None,
+                      trace: PageTrace = NO_TRACE
+                      ):
+        """
+        Runs the geometry part of the pipeline on a detected line mask: deskewing, contour filtering,
+        optional dewarping, sorting and cropping of the line images.
+        Returns (rot_mask, sorted_lines, line_images, page_angle) on success or an error message.
+        With an image_key (see get_image_key) the result is cached per image and geometry settings.
+        TPSMode.GLOBAL dewarps the whole page if more than tps_threshold of the lines are curved,
+        TPSMode.LOCAL only dewarps the regions of the curved lines. The dewarping maps are evaluated on a coarse grid
+        that stays within tps_tolerance pixels of the exact spline, tps_tolerance = 0 evaluates every pixel.
+        k_search only changes how the line images are found, not the result, so it is not part of the cache key.
+        num_threads limits the threads of the local dewarping, None uses the num_threads of the pipeline.
+        """
+        geometry_args = get_geometry_args(
+            k_factor, bbox_tolerance, merge_lines, use_tps, tps_mode, tps_threshold, tps_tolerance
+        )
+
+        cached = self.get_cached_lines(image_key, **geometry_args)
+        if cached is not None:
+            trace.record("line_data_cached", 0.0, lines=len(cached[1]))
+            return OpStatus.SUCCESS, cached
+
+        status, result = extract_page_lines(
+            image, line_mask, k_search=k_search, num_threads=num_threads if num_threads is not None else self.num_threads,
+            trace=trace, **geometry_args
+        )
+        if status != OpStatus.SUCCESS:
+            return status, result
+
+        rot_mask, sorted_lines, line_images, page_angle = result
+
+        if image_key is not None:
+            size = rot_mask.nbytes + sum(x.nbytes for x in line_images) + sum(x.contour.nbytes for x in sorted_lines)
+            # the cache keeps its own lines, the returned ones can be edited like those of a cache hit
+            cached_lines = copy_lines(sorted_lines)
+            self.line_cache.put(self._lines_key(image_key, geometry_args), (rot_mask, cached_lines, list(line_images), page_angle), size)
+
+        return OpStatus.SUCCESS, (rot_mask, sorted_lines, line_images, page_angle)
+
+    def build_ocr_lines(self, predictions: List[str], lines: List[Line], target_encoding: Encoding = Encoding.Unicode) -> List[OCRLine]:
+        """
+        Turns the raw recognition output of a page into OCRLines in the requested target encoding.
+        """
+        ocr_lines = []
+
+        for pred, line_info in zip(predictions, lines):
+            pred = pred.strip()
+            pred = pred.replace("§", " ")
+
+            if self.encoder == CharsetEncoder.Wylie and target_encoding == Encoding.Unicode:
+                pred = self.converter.toUnicode(pred)
+            elif self.encoder == CharsetEncoder.Stack and target_encoding == Encoding.Wylie:
+                pred = self.converter.toWylie(pred)
+
+            ocr_line = OCRLine(
+                guid=line_info.guid,
+                text=pred,
+                encoding=Encoding.Wylie if target_encoding == Encoding.Wylie else Encoding.Unicode
+            )
+            ocr_lines.append(ocr_line)
+
+        return ocr_lines
 
     # TODO: Generate specific meaningful error codes that can be returned inbetween the steps
-    # TPS Mode is global-only at the moment
     def run_ocr(self,
                 image: npt.NDArray,
                 k_factor: float = 2.5,
@@ -379,8 +1049,17 @@ class OCRPipeline:
                 use_tps: bool = False,
                 tps_mode: TPSMode = TPSMode.GLOBAL,
                 tps_threshold: float = 0.25,
-                target_encoding: Encoding = Encoding.Unicode
+                tps_tolerance: float = 0.01,
+                k_search: KFactorSearch = KFactorSearch.Iterative,
+                target_encoding: Encoding = Encoding.Unicode,
+                batch_lines: bool = True,
+                trace: PageTrace = NO_TRACE
                 ):
+        """
+        Runs detection, line extraction and recognition on an image.
+        Returns (rot_mask, sorted_lines, ocr_lines, page_angle) on success or an error message,
+        the timings of all stages are recorded into trace.
+        """
         try:
             if not self.ready:
                 return OpStatus.FAILED, "OCR pipeline not ready"
@@ -388,80 +1067,44 @@ class OCRPipeline:
             if image is None:
                 return OpStatus.FAILED, "Input image is None"
 
-            # Get line mask
-            try:
-                if isinstance(self.line_config, LineDetectionConfig):
-                    line_mask = self.line_inference.predict(image)
-                else:
-                    layout_mask = self.line_inference.predict(image)
-                    line_mask = layout_mask[:, :, 2]
-            except Exception as e:
-                return OpStatus.FAILED, f"Line detection failed: {str(e)}"
+            image_key = self.get_image_key(image)
+            geometry_args = get_geometry_args(
+                k_factor, bbox_tolerance, merge_lines, use_tps, tps_mode, tps_threshold, tps_tolerance
+            )
 
-            # Build line data
-            try:
-                rot_img, rot_mask, line_contours, page_angle = build_raw_line_data(image, line_mask)
-                if len(line_contours) == 0:
-                    return OpStatus.FAILED, "No lines detected"
-            except Exception as e:
-                return OpStatus.FAILED, f"Line data building failed: {str(e)}"
+            cached = self.get_cached_lines(image_key, **geometry_args)
 
-            # Filter contours
-            filtered_contours = filter_line_contours(rot_mask, line_contours)
-            if len(filtered_contours) == 0:
-                return OpStatus.FAILED, "No valid lines after filtering"
+            if cached is not None:
+                trace.record("line_data_cached", 0.0, lines=len(cached[1]))
+                status, result = OpStatus.SUCCESS, cached
+            else:
+                # Get line mask
+                try:
+                    line_mask = self.detect_lines(image, image_key, trace)
+                except Exception as e:
+                    return OpStatus.FAILED, f"Line detection failed: {str(e)}"
 
-            # Handle TPS (dewarping)
+                status, result = self.extract_lines(
+                    image, line_mask, k_search=k_search, image_key=image_key, trace=trace, **geometry_args
+                )
+
+            if status != OpStatus.SUCCESS:
+                return status, result
+
+            rot_mask, sorted_lines, line_images, page_angle = result
+
+            # Process each line
             try:
-                if use_tps:
-                    ratio, tps_line_data = check_for_tps(rot_img, filtered_contours)
-                    if ratio > tps_threshold:
-                        dewarped_img, dewarped_mask = apply_global_tps(rot_img, rot_mask, tps_line_data)
-                        if len(dewarped_mask.shape) == 3:
-                            dewarped_mask = cv2.cvtColor(dewarped_mask, cv2.COLOR_RGB2GRAY)
-                        dew_rot_img, dew_rot_mask, line_contours, page_angle = build_raw_line_data(dewarped_img, dewarped_mask)
-                        filtered_contours = filter_line_contours(dew_rot_mask, line_contours)
-                        line_data = [build_line_data(x) for x in filtered_contours]
-                        sorted_lines, _ = sort_lines_by_threshold2(rot_mask, line_data, group_lines=merge_lines)
-                        line_images = extract_line_images(dew_rot_img, sorted_lines, k_factor, bbox_tolerance)
-                    else:
-                        line_data = [build_line_data(x) for x in filtered_contours]
-                        sorted_lines, _ = sort_lines_by_threshold2(rot_mask, line_data, group_lines=merge_lines)
-                        line_images = extract_line_images(rot_img, sorted_lines, k_factor, bbox_tolerance)
+                if batch_lines:
+                    predictions = self.ocr_inference.run_batch(line_images, trace=trace)
                 else:
-                    line_data = [build_line_data(x) for x in filtered_contours]
-                    sorted_lines, _ = sort_lines_by_threshold2(rot_mask, line_data, group_lines=merge_lines)
-                    line_images = extract_line_images(rot_img, sorted_lines, k_factor, bbox_tolerance)
-            except Exception as e:
-                return OpStatus.FAILED, f"Line processing failed: {str(e)}"
+                    predictions = [self.ocr_inference.run(x, trace=trace) for x in line_images]
 
-            # Process each line
-            if line_images is not None and len(line_images) > 0:
-                page_text = []
-                ocr_lines = []
-                try:
-                    for line_img, line_info in zip(line_images, sorted_lines):
-                        pred = self.ocr_inference.run(line_img)
-                        pred = pred.strip()
-                        pred = pred.replace("§", " ")
-
-                        if self.encoder == CharsetEncoder.Wylie and target_encoding == Encoding.Unicode:
-                            pred = self.converter.toUnicode(pred)
-                        elif self.encoder == CharsetEncoder.Stack and target_encoding == Encoding.Wylie:
-                            pred = self.converter.toWylie(pred)
-
-                        ocr_line = OCRLine(
-                            guid=line_info.guid,
-                            text=pred,
-                            encoding=Encoding.Wylie if target_encoding == Encoding.Wylie else Encoding.Unicode
-                        )
-                        ocr_lines.append(ocr_line)
-                        page_text.append(pred)
-
-                    return OpStatus.SUCCESS, (rot_mask, sorted_lines, ocr_lines, page_angle)
-                except Exception as e:
-                    return OpStatus.FAILED, f"OCR processing failed: {str(e)}"
-            else:
-                return OpStatus.FAILED, "No valid line images extracted"
+                with trace.stage("build_ocr_lines", lines=len(predictions)):
+                    ocr_lines = self.build_ocr_lines(predictions, sorted_lines, target_encoding)
+
+                return OpStatus.SUCCESS, (rot_mask, sorted_lines, ocr_lines, page_angle)
+            except Exception as e:
+                return OpStatus.FAILED, f"OCR processing failed: {str(e)}"
         except Exception as e:
             return OpStatus.FAILED, f"OCR pipeline failed: {str(e)}"
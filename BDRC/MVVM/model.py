@@ -6,7 +6,8 @@ import numpy.typing as npt
 from uuid import UUID
 from glob import glob
 from typing import List, Dict
-from BDRC.Utils import create_dir, import_local_models
+from BDRC.Cache import OCRResultCache
+from BDRC.Utils import create_dir, import_local_models, read_tiling_config
 from BDRC.Data import (
     AppSettings,
     Encoding,
@@ -55,6 +56,12 @@ class SettingsModel:
         self.tmp_dir = os.path.join(self.user_directory, "tmp")
         create_dir(self.tmp_dir)
 
+        self.result_cache = OCRResultCache(
+            os.path.join(self.user_directory, "cache"),
+            max_size=self.app_settings.result_cache_size * 1024 * 1024,
+            enabled=self.app_settings.result_cache
+        )
+
         # First try to load models from user-specified path
         models_loaded = False
         if os.path.isdir(self.app_settings.model_path):
@@ -100,13 +107,17 @@ class SettingsModel:
 
     def update_app_settings(self, settings: AppSettings):
         self.app_settings = settings
+        self.result_cache.enabled = settings.result_cache
+        self.result_cache.max_size = settings.result_cache_size * 1024 * 1024
 
     def create_default_app_config(self, user_dir: str):
         settings = {
                 "model_path": os.path.join(self.user_directory, "Models"),
                 "language": "en",
                 "encoding": "unicode",
-                "theme": "dark"
+                "theme": "dark",
+                "result_cache": "yes",
+                "result_cache_size": 1024
             }
         app_settings_file = os.path.join(user_dir, "app_settings.json")
         with open(app_settings_file, "w", encoding="utf-8") as f:
@@ -146,12 +157,17 @@ class SettingsModel:
         _lang_code = app_json_settings["language"]
         _encoding = app_json_settings["encoding"]
         _theme = app_json_settings["theme"]
+        # optional, settings files of older versions don't have them
+        _result_cache = app_json_settings.get("result_cache", "yes")
+        _result_cache_size = app_json_settings.get("result_cache_size", 1024)
 
         app_settings = AppSettings(
             model_path=_model_path,
             language=LANGUAGES[_lang_code],
             encoding=ENCODINGS[_encoding],
-            theme=THEMES[_theme]
+            theme=THEMES[_theme],
+            result_cache=True if _result_cache == "yes" else False,
+            result_cache_size=int(_result_cache_size)
         )
 
         file = open(ocr_settings_file, encoding="utf-8")
@@ -190,7 +206,9 @@ class SettingsModel:
                     "model_path": _model_path,
                     "language": _language,
                     "encoding": _encoding,
-                    "theme": _theme
+                    "theme": _theme,
+                    "result_cache": "yes" if settings.result_cache else "no",
+                    "result_cache_size": settings.result_cache_size
                 }
 
         app_settings_file = os.path.join(self.user_directory, "app_settings.json")
@@ -231,7 +249,7 @@ class SettingsModel:
         onnx_model_file = f"{model_dir}/{json_content['onnx-model']}"
         patch_size = int(json_content["patch_size"])
 
-        config = LineDetectionConfig(onnx_model_file, patch_size)
+        config = LineDetectionConfig(onnx_model_file, patch_size, **read_tiling_config(json_content))
 
         return config
     
@@ -245,7 +263,7 @@ class SettingsModel:
         patch_size = int(json_content["patch_size"])
         classes = json_content["classes"]
 
-        config = LayoutDetectionConfig(onnx_model_file, patch_size, classes)
+        config = LayoutDetectionConfig(onnx_model_file, patch_size, classes, **read_tiling_config(json_content))
 
         return config
 
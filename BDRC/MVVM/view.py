@@ -22,20 +22,36 @@ import logging
 # Thread for asynchronous OCR
 class _OCRThread(QThread):
     ocr_finished = Signal(object, object, object)  # status, result, guid
-    def __init__(self, pipeline, img, settings, guid, parent=None):
+    def __init__(self, pipeline, img, settings, guid, image_path=None, cache=None, parent=None):
         super().__init__(parent)
         self.pipeline = pipeline
         self.img = img
         self.settings = settings
         self.guid = guid
+        self.image_path = image_path
+        self.cache = cache
     def run(self):
-        status, result = self.pipeline.run_ocr(
-            self.img,
-            k_factor=self.settings.k_factor,
-            bbox_tolerance=self.settings.bbox_tolerance,
-            merge_lines=self.settings.merge_lines,
-            use_tps=self.settings.dewarping
-        )
+        ocr_args = {
+            "k_factor": self.settings.k_factor,
+            "bbox_tolerance": self.settings.bbox_tolerance,
+            "merge_lines": self.settings.merge_lines,
+            "use_tps": self.settings.dewarping,
+            "tps_mode": self.settings.tps_mode
+        }
+        cache_key = None
+        if self.cache is not None and self.image_path is not None:
+            cache_key = self.cache.make_key(self.image_path, self.pipeline.ocr_model_config, self.pipeline.line_config, **ocr_args)
+            cached = self.cache.get(cache_key, self.guid)
+            if cached is not None:
+                self.ocr_finished.emit(OpStatus.SUCCESS, (cached.mask, cached.lines, cached.text, cached.angle), self.guid)
+                return
+
+        status, result = self.pipeline.run_ocr(self.img, **ocr_args)
+
+        if status == OpStatus.SUCCESS and cache_key is not None:
+            mask, lines, ocr_lines, angle = result
+            self.cache.put(cache_key, OCResult(guid=self.guid, mask=mask, lines=lines, text=ocr_lines, angle=angle))
+
         self.ocr_finished.emit(status, result, self.guid)
 
 class MainView(QWidget):
@@ -181,7 +197,7 @@ class MainView(QWidget):
         self._progress_dialog.show()
         self.setEnabled(False)
         # start thread
-        thread = _OCRThread(self.ocr_pipeline, img, ocr_settings, guid)
+        thread = _OCRThread(self.ocr_pipeline, img, ocr_settings, guid, data.image_path, self._settings_view.get_result_cache())
         self._ocr_thread = thread  # keep reference
         thread.ocr_finished.connect(self._on_thread_finished)
         thread.start()
@@ -502,7 +518,7 @@ class AppView(QWidget):
         self._progress_dialog.show()
         self.setEnabled(False)
         # run in background thread
-        thread = _OCRThread(self.ocr_pipeline, img, ocr_settings, guid)
+        thread = _OCRThread(self.ocr_pipeline, img, ocr_settings, guid, data.image_path, self._settingsview_model.get_result_cache())
         self._ocr_thread = thread  # keep reference
         thread.ocr_finished.connect(self._on_ocr_finished)
         thread.start()
@@ -540,7 +556,8 @@ class AppView(QWidget):
                 ocr_models=self._settingsview_model.get_ocr_models(),
                 ocr_settings=self._settingsview_model.get_ocr_settings(),
                 threadpool=self.threadpool,
-                current_model=current_model  # Pass the currently selected model
+                current_model=current_model,  # Pass the currently selected model
+                cache=self._settingsview_model.get_result_cache()
             )
             batch_dialog.sign_ocr_result.connect(self.update_ocr_result)
 
@@ -2,6 +2,7 @@ from uuid import UUID
 import numpy.typing as npt
 from typing import List, Dict
 from PySide6.QtCore import QObject, Signal
+from BDRC.Cache import OCRResultCache
 from BDRC.MVVM.model import OCRDataModel, SettingsModel
 from BDRC.Data import OCRData, Line, OCRLine, OCRLineUpdate, OCRModel, AppSettings, OCRSettings
 
@@ -19,6 +20,9 @@ class SettingsViewModel(QObject):
     def get_tmp_dir(self):
         return self._model.tmp_dir
 
+    def get_result_cache(self) -> OCRResultCache:
+        return self._model.result_cache
+
     def get_execution_dir(self) -> str:
         return self._model.execution_directory
     
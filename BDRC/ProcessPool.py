@@ -0,0 +1,161 @@
+"""
+Process based batch OCR for multi-core servers: the line geometry in BDRC.Utils is plain Python and holds the GIL,
+so a single OCRPipeline keeps roughly one core busy outside of the ONNX calls. OCRProcessPool starts N worker
+processes which each load their own OCRPipeline, with the onnxruntime intra-op threads split between them.
+Pages are handed out by index and the results are streamed back as serialized OCResults.
+"""
+
+import os
+import cv2
+import logging
+import multiprocessing
+from typing import Callable, Sequence, Tuple
+
+from BDRC.Inference import OCRPipeline
+from BDRC.Trace import PageTrace, NO_TRACE
+from BDRC.Utils import serialize_ocr_result, deserialize_ocr_result
+from BDRC.Data import (
+    OpStatus,
+    OCResult,
+    Platform,
+    OCRModelConfig,
+    LineDetectionConfig,
+    LayoutDetectionConfig
+)
+
+_POLL_TIMEOUT = 0.2  # seconds between checks for stop() while waiting for the next page
+
+# the pipeline of the current worker process, created once by _init_worker
+_worker_pipeline = None
+_worker_ocr_args = None
+_worker_trace = False
+
+
+def _init_worker(
+        platform: Platform,
+        ocr_config: OCRModelConfig,
+        line_config: LineDetectionConfig | LayoutDetectionConfig,
+        num_threads: int,
+        ocr_args: dict,
+        trace: bool = False
+):
+    global _worker_pipeline, _worker_ocr_args, _worker_trace
+    # every page is processed once per run, caching line data would only hold memory in each worker
+    _worker_pipeline = OCRPipeline(platform, ocr_config, line_config, num_threads=num_threads, line_cache_size=0)
+    _worker_ocr_args = ocr_args
+    _worker_trace = trace
+
+
+def _run_page(task: Tuple[int, str]):
+    idx, image_path = task
+    trace = PageTrace(image_path) if _worker_trace else NO_TRACE
+
+    with trace.stage("imread"):
+        img = cv2.imread(image_path)
+
+    if img is None:
+        return idx, OpStatus.FAILED.value, f"Failed to load image: {image_path}"
+
+    status, result = _worker_pipeline.run_ocr(img, trace=trace, **_worker_ocr_args)
+
+    if status != OpStatus.SUCCESS:
+        return idx, status.value, result
+
+    rot_mask, lines, ocr_lines, angle = result
+    ocr_result = OCResult(
+        guid=None, mask=rot_mask, lines=lines, text=ocr_lines, angle=angle, trace=trace if trace.enabled else None
+    )
+
+    return idx, status.value, serialize_ocr_result(ocr_result)
+
+
+def get_threads_per_worker(workers: int) -> int:
+    cpu_count = os.cpu_count() or 1
+    return max(1, cpu_count // max(1, workers))
+
+
+class OCRProcessPool:
+    def __init__(
+            self,
+            platform: Platform,
+            ocr_config: OCRModelConfig,
+            line_config: LineDetectionConfig | LayoutDetectionConfig,
+            workers: int = 0,
+            threads_per_worker: int = 0,
+            trace: bool = False,
+            **ocr_args
+    ):
+        """
+        workers = 0 starts one process per core, threads_per_worker = 0 splits the available cores evenly.
+        With trace, every OCResult carries the PageTrace recorded in its worker.
+        All other keyword arguments are passed on to OCRPipeline.run_ocr in the workers.
+        """
+        self.platform = platform
+        self.ocr_config = ocr_config
+        self.line_config = line_config
+        self.workers = workers if workers > 0 else (os.cpu_count() or 1)
+        self.threads_per_worker = threads_per_worker if threads_per_worker > 0 else get_threads_per_worker(self.workers)
+        self.trace = trace
+        self.ocr_args = ocr_args
+        self._pool = None
+        self._stopped = False
+
+    def stop(self):
+        """
+        Makes run() return within _POLL_TIMEOUT, the workers are terminated by run() itself.
+        """
+        self._stopped = True
+
+    def run(
+            self,
+            pages: Sequence[Tuple[object, str]],
+            on_result: Callable[[int, object, OCResult], None],
+            on_error: Callable[[int, object, str], None]
+    ):
+        """
+        Runs OCR on all (key, image_path) pairs and blocks until all pages are processed.
+        Callbacks are invoked in the calling thread in order of completion, the OCResult guid is taken from key.guid if present.
+        """
+        if len(pages) == 0 or self._stopped:
+            return
+
+        # spawn instead of fork: neither Qt nor onnxruntime are safe to use in a forked child
+        context = multiprocessing.get_context("spawn")
+        tasks = [(idx, image_path) for idx, (_, image_path) in enumerate(pages)]
+
+        self._pool = context.Pool(
+            processes=min(self.workers, len(pages)),
+            initializer=_init_worker,
+            initargs=(self.platform, self.ocr_config, self.line_config, self.threads_per_worker, self.ocr_args, self.trace)
+        )
+
+        try:
+            results = self._pool.imap_unordered(_run_page, tasks, chunksize=1)
+
+            for _ in range(len(tasks)):
+                # a blocking next() would never return once the pool is terminated, so stop() is polled for
+                while not self._stopped:
+                    try:
+                        idx, status, payload = results.next(timeout=_POLL_TIMEOUT)
+                        break
+                    except multiprocessing.TimeoutError:
+                        continue
+
+                if self._stopped:
+                    break
+
+                key = pages[idx][0]
+
+                if status == OpStatus.SUCCESS.value:
+                    on_result(idx, key, deserialize_ocr_result(payload, getattr(key, "guid", None)))
+                else:
+                    on_error(idx, key, payload)
+
+        except Exception as e:
+            if not self._stopped:
+                logging.error(f"OCR worker pool failed: {e}")
+                raise
+        finally:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
@@ -0,0 +1,51 @@
+"""
+Reading order of the line fragments of a page. The bbox centers are clustered into lines in the order the contours
+were found: a center starts a new line if it is further than the line threshold from the mean y of the current line.
+The lines are then ordered top to bottom and the fragments of each line from left to right.
+
+Every cluster keeps a running sum of its y values, so the clustering is a single pass and the ordering is
+O(n log n) for sorting the fragments by x.
+"""
+
+from typing import Dict, List, Sequence, Tuple
+
+
+def cluster_bbox_centers(bbox_centers: Sequence[Tuple[int, int]], line_threshold: float = 20) -> List[List[int]]:
+    """
+    Groups the indices of the bbox centers into lines, same ordering as sort_bbox_centers.
+    """
+    clusters = []
+    current = []
+    y_sum = 0
+
+    for idx, (_, y) in enumerate(bbox_centers):
+        # integer sums keep the mean exactly equal to np.mean of the y values
+        if len(current) > 0 and abs(y_sum / len(current) - y) > line_threshold:
+            clusters.append(current)
+            current = []
+            y_sum = 0
+
+        current.append(idx)
+        y_sum += y
+
+    if len(current) > 0:
+        clusters.append(current)
+
+    # the contours come bottom up from cv2.findContours, python's sort is stable for fragments with the same x
+    return [sorted(cluster, key=lambda idx: bbox_centers[idx][0]) for cluster in reversed(clusters)]
+
+
+def sort_bbox_centers(bbox_centers: List[Tuple[int, int]], line_threshold: float = 20) -> List[List[Tuple[int, int]]]:
+    return [[bbox_centers[idx] for idx in cluster] for cluster in cluster_bbox_centers(bbox_centers, line_threshold)]
+
+
+def index_by_center(centers: Sequence[Tuple[int, int]]) -> Dict[Tuple[int, int], List[int]]:
+    """
+    Positions of the items with each center, in their original order.
+    """
+    index = {}
+
+    for idx, center in enumerate(centers):
+        index.setdefault(tuple(center), []).append(idx)
+
+    return index
@@ -3,8 +3,11 @@ from uuid import UUID
 from typing import List
 from PySide6.QtCore import QObject, Signal, QRunnable
 
+from BDRC.Cache import OCRResultCache, CachedExecutor
 from BDRC.Inference import OCRPipeline
-from BDRC.Data import OpStatus, OCResult, LineMode, OCRData, Encoding, OCRSettings, OCRSample
+from BDRC.Stages import StagedOCRPipeline
+from BDRC.ProcessPool import OCRProcessPool
+from BDRC.Data import OpStatus, OCResult, LineMode, OCRData, Encoding, OCRSettings, OCRSample, PipelineSettings, TPSMode
 
 
 
@@ -17,16 +20,33 @@ class RunnerSignals(QObject):
     ocr_data = Signal(dict[UUID, OCRData])
 
 class OCRunner(QRunnable):
-    def __init__(self, data: OCRData, ocr_pipeline: OCRPipeline, settings: OCRSettings):
+    def __init__(self, data: OCRData, ocr_pipeline: OCRPipeline, settings: OCRSettings, cache: OCRResultCache | None = None):
         super(OCRunner, self).__init__()
         self.signals = RunnerSignals()
         self.data = data
         self.pipeline = ocr_pipeline
         self.settings = settings
+        self.cache = cache
         self.k_factor =  settings.k_factor
         self.bbox_tolerance = settings.bbox_tolerance
 
     def run(self):
+        cache_key = None
+
+        if self.cache is not None:
+            cache_key = self.cache.make_key(
+                self.data.image_path,
+                self.pipeline.ocr_model_config,
+                self.pipeline.line_config,
+                k_factor=self.k_factor,
+                bbox_tolerance=self.bbox_tolerance
+            )
+            ocr_result = self.cache.get(cache_key, self.data.guid)
+
+            if ocr_result is not None:
+                self.signals.ocr_result.emit(ocr_result)
+                return
+
         img = cv2.imread(self.data.image_path)
         status, result = self.pipeline.run_ocr(img, k_factor=self.k_factor, bbox_tolerance=self.bbox_tolerance)
 
@@ -40,6 +60,10 @@ class OCRunner(QRunnable):
                 text=ocr_lines,
                 angle=angle
             )
+
+            if self.cache is not None:
+                self.cache.put(cache_key, ocr_result)
+
             self.signals.ocr_result.emit(ocr_result)
         else:
             self.signals.finished.emit()
@@ -52,10 +76,13 @@ class OCRBatchRunner(QRunnable):
             ocr_pipeline: OCRPipeline,
             mode: LineMode = LineMode.Layout,
             dewarp: bool = True,
+            tps_mode: TPSMode = TPSMode.GLOBAL,
             merge_lines: bool = True,
             k_factor: float = 1.7,
             bbox_tolerance: float = 3.0,
-            target_encoding: Encoding = Encoding.Unicode
+            target_encoding: Encoding = Encoding.Unicode,
+            pipeline_settings: PipelineSettings | None = None,
+            cache: OCRResultCache | None = None
             ):
 
         super(OCRBatchRunner, self).__init__()
@@ -65,62 +92,75 @@ class OCRBatchRunner(QRunnable):
         self.data = data
         self.mode = mode
         self.do_dewarp = dewarp
+        self.tps_mode = tps_mode
         self.merge_lines = merge_lines
         self.k_factor = k_factor
         self.bbox_tolerance = bbox_tolerance
         self.target_encoding = target_encoding
+        self.pipeline_settings = pipeline_settings if pipeline_settings is not None else PipelineSettings()
         self.stop = False
 
+        self.ocr_args = {
+            "k_factor": self.k_factor,
+            "bbox_tolerance": self.bbox_tolerance,
+            "merge_lines": self.merge_lines,
+            "use_tps": self.do_dewarp,
+            "tps_mode": self.tps_mode,
+            "target_encoding": self.target_encoding
+        }
+
+        if self.pipeline_settings.process_workers > 0:
+            self.executor = OCRProcessPool(
+                self.ocr_pipeline.platform,
+                self.ocr_pipeline.ocr_model_config,
+                self.ocr_pipeline.line_config,
+                workers=self.pipeline_settings.process_workers,
+                trace=self.pipeline_settings.trace,
+                **self.ocr_args
+            )
+        else:
+            self.executor = StagedOCRPipeline(self.ocr_pipeline, self.pipeline_settings, **self.ocr_args)
+
+        if cache is not None and cache.enabled:
+            self.executor = CachedExecutor(
+                self.executor,
+                cache,
+                self.ocr_pipeline.ocr_model_config,
+                self.ocr_pipeline.line_config,
+                **self.ocr_args
+            )
+
     def kill(self):
         print("OCRunner -> kill")
         self.stop = True
+        self.executor.stop()
+
+    def handle_result(self, idx: int, data: OCRData, ocr_result: OCResult):
+        sample = OCRSample(
+            cnt=idx,
+            guid=data.guid,
+            name=data.image_name,
+            result=ocr_result
+        )
+        self.signals.sample.emit(sample)
+        self.signals.ocr_result.emit(ocr_result)  # Emit each result individually
+
+    def handle_error(self, idx: int, data: OCRData, msg: str):
+        error_msg = f"Failed to process {data.image_name}: {msg}"
+        print(error_msg)
+        self.signals.error.emit(error_msg)
 
     def run(self):
-        results = {}
+        """
+        Pages are decoded, detected, cropped and recognized in separate stages of a StagedOCRPipeline,
+        or distributed over an OCRProcessPool if process_workers is set. With a result cache, pages that were
+        processed before with the same models and settings are emitted right away.
+        Each page is emitted as soon as all of its lines went through the recognition model.
+        """
         try:
-            for idx, data in enumerate(self.data):
-                if self.stop:
-                    break
-                    
-                img = cv2.imread(data.image_path)
-                if img is None:
-                    error_msg = f"Failed to load image: {data.image_path}"
-                    print(error_msg)
-                    self.signals.error.emit(error_msg)
-                    continue
-                    
-                status, result = self.ocr_pipeline.run_ocr(
-                    image=img,
-                    k_factor=self.k_factor,
-                    bbox_tolerance=self.bbox_tolerance,
-                    merge_lines=self.merge_lines,
-                    use_tps=self.do_dewarp,
-                    target_encoding=self.target_encoding
-                )
-
-                if status == OpStatus.SUCCESS:
-                    rot_mask, lines, ocr_lines, angle = result
-                    ocr_result = OCResult(
-                        guid=data.guid,
-                        mask=rot_mask,
-                        lines=lines,
-                        text=ocr_lines,
-                        angle=angle
-                    )
-                    results[data.guid] = ocr_result
-                    sample = OCRSample(
-                        cnt=idx,
-                        guid=data.guid,
-                        name=data.image_name,
-                        result=ocr_result
-                    )
-                    self.signals.sample.emit(sample)
-                    self.signals.ocr_result.emit(ocr_result)  # Emit each result individually
-                else:
-                    error_msg = f"Failed to process {data.image_name}: {result}"
-                    print(error_msg)
-                    self.signals.error.emit(error_msg)
-                    
+            pages = [(data, data.image_path) for data in self.data]
+            self.executor.run(pages, self.handle_result, self.handle_error)
+
         except Exception as e:
             error_msg = f"Error in batch processing: {str(e)}"
             print(error_msg)
@@ -0,0 +1,287 @@
+"""
+Staged batch OCR: image decoding, line detection, line geometry and recognition run in separate worker threads
+connected by bounded queues, so that disk I/O and the NumPy/OpenCV geometry overlap with the ONNX inference.
+The number of pages in flight is capped by the queue sizes and worker counts, not by the size of the volume.
+"""
+
+import cv2
+import queue
+import logging
+import threading
+from typing import Callable, List, Sequence, Tuple
+
+from BDRC.Inference import OCRPipeline, LineBatchScheduler, get_geometry_args
+from BDRC.ProcessPool import get_threads_per_worker
+from BDRC.Trace import PageTrace, NO_TRACE
+from BDRC.Data import OpStatus, OCResult, Encoding, TPSMode, KFactorSearch, PipelineSettings
+
+_STAGE_END = object()
+_POLL_TIMEOUT = 0.1  # seconds between checks whether the recognition has to run a partial line batch
+
+
+class StagedOCRPipeline:
+    def __init__(
+            self,
+            ocr_pipeline: OCRPipeline,
+            settings: PipelineSettings | None = None,
+            k_factor: float = 2.5,
+            bbox_tolerance: float = 4.0,
+            merge_lines: bool = True,
+            use_tps: bool = False,
+            tps_mode: TPSMode = TPSMode.GLOBAL,
+            tps_threshold: float = 0.25,
+            tps_tolerance: float = 0.01,
+            k_search: KFactorSearch = KFactorSearch.Iterative,
+            target_encoding: Encoding = Encoding.Unicode
+    ):
+        self.ocr_pipeline = ocr_pipeline
+        self.settings = settings if settings is not None else PipelineSettings()
+        self.k_factor = k_factor
+        self.bbox_tolerance = bbox_tolerance
+        self.merge_lines = merge_lines
+        self.use_tps = use_tps
+        self.tps_mode = tps_mode
+        self.tps_threshold = tps_threshold
+        self.tps_tolerance = tps_tolerance
+        self.k_search = k_search
+        self.target_encoding = target_encoding
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+
+    def stopped(self) -> bool:
+        return self._stop.is_set()
+
+    def run(
+            self,
+            pages: Sequence[Tuple[object, str]],
+            on_result: Callable[[int, object, OCResult], None],
+            on_error: Callable[[int, object, str], None]
+    ):
+        """
+        Runs OCR on all (key, image_path) pairs and blocks until every page went through all stages.
+        on_result(idx, key, OCResult) and on_error(idx, key, message) are called from the worker threads.
+        The OCResult guid is taken from key.guid if present.
+        """
+        settings = self.settings
+        queue_size = max(1, settings.queue_size)
+
+        decoded = queue.Queue(maxsize=queue_size)
+        detected = queue.Queue(maxsize=queue_size)
+        geometry = queue.Queue(maxsize=queue_size)
+
+        max_in_flight = 3 * queue_size + settings.prefetch_workers + settings.detection_workers + \
+            settings.geometry_workers + settings.recognition_workers
+        in_flight = threading.BoundedSemaphore(max_in_flight)
+
+        page_iter = iter(enumerate(pages))
+        page_lock = threading.Lock()
+
+        def next_page():
+            with page_lock:
+                return next(page_iter, None)
+
+        def fail(idx: int, key, msg: str):
+            in_flight.release()
+            on_error(idx, key, msg)
+
+        def prefetch_worker():
+            while not self._stop.is_set():
+                # acquire before reading so that decoded images are bounded as well
+                while not in_flight.acquire(timeout=0.1):
+                    if self._stop.is_set():
+                        return
+
+                page = next_page()
+                if page is None:
+                    in_flight.release()
+                    return
+
+                idx, (key, image_path) = page
+                trace = PageTrace(image_path) if settings.trace else NO_TRACE
+
+                with trace.stage("imread"):
+                    img = cv2.imread(image_path)
+
+                if img is None:
+                    fail(idx, key, f"Failed to load image: {image_path}")
+                    continue
+
+                decoded.put((idx, key, img, trace))
+
+        geometry_args = get_geometry_args(
+            self.k_factor, self.bbox_tolerance, self.merge_lines, self.use_tps, self.tps_mode, self.tps_threshold,
+            self.tps_tolerance
+        )
+
+        # the stages run side by side, each geometry worker gets its share of the cores for the local dewarping
+        # instead of a thread per core on top of the other workers and the onnxruntime threads
+        geometry_threads = get_threads_per_worker(
+            settings.detection_workers + settings.geometry_workers + settings.recognition_workers
+        )
+
+        def detection_worker(item):
+            idx, key, img, trace = item
+            image_key = self.ocr_pipeline.get_image_key(img)
+
+            # pages with cached line data skip the detection, extract_lines returns the cached result
+            if self.ocr_pipeline.get_cached_lines(image_key, **geometry_args) is not None:
+                detected.put((idx, key, img, None, image_key, trace))
+                return
+
+            try:
+                line_mask = self.ocr_pipeline.detect_lines(img, image_key, trace)
+            except Exception as e:
+                fail(idx, key, f"Line detection failed: {str(e)}")
+                return
+
+            detected.put((idx, key, img, line_mask, image_key, trace))
+
+        def geometry_worker(item):
+            idx, key, img, line_mask, image_key, trace = item
+            status, result = self.ocr_pipeline.extract_lines(
+                img, line_mask, k_search=self.k_search, image_key=image_key, num_threads=geometry_threads, trace=trace,
+                **geometry_args
+            )
+
+            if status != OpStatus.SUCCESS:
+                fail(idx, key, result)
+                return
+
+            geometry.put((idx, key, result, trace))
+
+        schedulers = []
+
+        def all_slots_waiting() -> bool:
+            # pages waiting for a full line batch keep their in_flight slot, once they hold all of them
+            # no new page can reach the recognition and the partial batches have to be run
+            return sum(x.pending_pages() for x in schedulers) >= max_in_flight
+
+        def recognition_worker():
+            scheduler = LineBatchScheduler(self.ocr_pipeline.ocr_inference, settings.line_batch_size)
+            schedulers.append(scheduler)
+
+            def flush_if_blocked():
+                if scheduler.pending_lines() == 0 or self._stop.is_set() or not all_slots_waiting():
+                    return
+                try:
+                    emit(scheduler.flush())
+                except Exception as e:
+                    logging.error(f"Line recognition failed: {e}")
+                    self._fail_pending(scheduler, fail, f"OCR processing failed: {str(e)}")
+
+            def emit(completed: List):
+                for (idx, key, rot_mask, lines, angle, trace), texts in completed:
+                    try:
+                        with trace.stage("build_ocr_lines", lines=len(texts)):
+                            ocr_lines = self.ocr_pipeline.build_ocr_lines(texts, lines, self.target_encoding)
+                        ocr_result = OCResult(
+                            guid=getattr(key, "guid", None),
+                            mask=rot_mask,
+                            lines=lines,
+                            text=ocr_lines,
+                            angle=angle,
+                            trace=trace if trace.enabled else None
+                        )
+                    except Exception as e:
+                        fail(idx, key, f"OCR processing failed: {str(e)}")
+                        continue
+
+                    in_flight.release()
+                    on_result(idx, key, ocr_result)
+
+            while True:
+                try:
+                    item = geometry.get(timeout=_POLL_TIMEOUT)
+                except queue.Empty:
+                    flush_if_blocked()
+                    continue
+
+                if item is _STAGE_END:
+                    break
+                if self._stop.is_set():
+                    in_flight.release()
+                    continue
+
+                idx, key, (rot_mask, lines, line_images, angle), trace = item
+                try:
+                    emit(scheduler.submit((idx, key, rot_mask, lines, angle, trace), line_images, trace))
+                except Exception as e:
+                    logging.error(f"Line recognition failed: {e}")
+                    self._fail_pending(scheduler, fail, f"OCR processing failed: {str(e)}")
+
+                flush_if_blocked()
+
+            try:
+                if not self._stop.is_set():
+                    emit(scheduler.flush())
+            except Exception as e:
+                logging.error(f"Line recognition failed: {e}")
+            finally:
+                self._fail_pending(scheduler, fail, "OCR processing cancelled")
+
+        stages = [
+            self._start_workers(settings.prefetch_workers, prefetch_worker, decoded, settings.detection_workers),
+            self._start_workers(settings.detection_workers, self._consumer(decoded, detection_worker, in_flight, fail), detected, settings.geometry_workers),
+            self._start_workers(settings.geometry_workers, self._consumer(detected, geometry_worker, in_flight, fail), geometry, settings.recognition_workers),
+            self._start_workers(settings.recognition_workers, recognition_worker, None, 0)
+        ]
+
+        for workers in stages:
+            for worker in workers:
+                worker.join()
+
+    def _consumer(self, source: queue.Queue, handler: Callable, in_flight: threading.BoundedSemaphore, fail: Callable):
+        def run():
+            while True:
+                item = source.get()
+                if item is _STAGE_END:
+                    return
+                if self._stop.is_set():
+                    # keep draining the queue so that upstream workers never block on a full queue
+                    in_flight.release()
+                    continue
+                try:
+                    handler(item)
+                except Exception as e:
+                    fail(item[0], item[1], str(e))
+
+        return run
+
+    @staticmethod
+    def _fail_pending(scheduler: LineBatchScheduler, fail: Callable, msg: str):
+        for page_key, _ in scheduler.drain():
+            idx, key = page_key[0], page_key[1]
+            fail(idx, key, msg)
+
+    @staticmethod
+    def _start_workers(n_workers: int, target: Callable, output: queue.Queue | None, n_consumers: int) -> List[threading.Thread]:
+        """
+        Starts n_workers threads running target, the last one to finish signals the end of the stage
+        to each of the n_consumers workers of the next stage.
+        """
+        n_workers = max(1, n_workers)
+        remaining = [n_workers]
+        lock = threading.Lock()
+
+        def run():
+            try:
+                target()
+            except Exception as e:
+                logging.error(f"Pipeline stage failed: {e}")
+            finally:
+                with lock:
+                    remaining[0] -= 1
+                    is_last = remaining[0] == 0
+
+                if is_last and output is not None:
+                    for _ in range(max(1, n_consumers)):
+                        output.put(_STAGE_END)
+
+        workers = [threading.Thread(target=run, daemon=True) for _ in range(n_workers)]
+
+        for worker in workers:
+            worker.start()
+
+        return workers
@@ -0,0 +1,157 @@
+"""
+Per-page timing traces for the OCR pipeline. Every stage records its wall time and a few sizes (tiles, lines,
+array shapes) into a PageTrace, e.g.:
+
+    trace = PageTrace("page_001")
+    status, result = pipeline.run_ocr(image, trace=trace)
+    export_traces("trace.json", [trace])
+
+The functions of the pipeline take NO_TRACE by default, which ignores all records, so tracing costs nothing
+but a few function calls per page when it is disabled.
+"""
+
+import json
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List
+
+
+class PageTrace:
+    def __init__(self, name: str = ""):
+        self.name = name
+        self.events = []  # (stage name, seconds, info)
+
+    @property
+    def enabled(self) -> bool:
+        return True
+
+    @contextmanager
+    def stage(self, name: str, **info):
+        """
+        Times the enclosed block, the yielded dict can be used to add info that is only known afterwards.
+        """
+        start = time.perf_counter()
+        try:
+            yield info
+        finally:
+            self.events.append((name, time.perf_counter() - start, info))
+
+    def record(self, name: str, seconds: float, **info):
+        self.events.append((name, seconds, info))
+
+    def add_share(self, other: "PageTrace", fraction: float):
+        """
+        Adds a fraction of the stage times and counts of other, used to split shared work like a line batch
+        that holds lines of several pages.
+        """
+        for name, seconds, info in other.events:
+            shared_info = {
+                k: round(v * fraction) if isinstance(v, int) and not isinstance(v, bool) else v for k, v in info.items()
+            }
+            shared_info["share"] = round(fraction, 4)
+            self.events.append((name, seconds * fraction, shared_info))
+
+    def total(self) -> float:
+        return sum(x[1] for x in self.events)
+
+    def stages(self) -> Dict[str, dict]:
+        """
+        Sums up the events per stage: number of calls, seconds and all numeric info values.
+        """
+        stages = {}
+
+        for name, seconds, info in self.events:
+            stage = stages.setdefault(name, {"calls": 0, "seconds": 0.0})
+            stage["calls"] += 1
+            stage["seconds"] += seconds
+
+            for key, value in info.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool) and key != "share":
+                    stage[key] = stage.get(key, 0) + value
+
+        return stages
+
+    def to_dict(self) -> dict:
+        return {
+            "page": self.name,
+            "seconds": self.total(),
+            "stages": self.stages(),
+            "events": [
+                {"stage": name, "seconds": seconds, **{k: _to_json(v) for k, v in info.items()}}
+                for name, seconds, info in self.events
+            ]
+        }
+
+
+class NullTrace(PageTrace):
+    _context = nullcontext({})
+
+    @property
+    def enabled(self) -> bool:
+        return False
+
+    def stage(self, name: str, **info):
+        return self._context
+
+    def record(self, name: str, seconds: float, **info):
+        pass
+
+    def add_share(self, other: PageTrace, fraction: float):
+        pass
+
+
+NO_TRACE = NullTrace()
+
+
+def _to_json(value):
+    if isinstance(value, tuple):
+        return list(value)
+    return value
+
+
+def aggregate_traces(traces: List[PageTrace], wall_time: float | None = None) -> dict:
+    """
+    Combines the traces of a batch into per-stage totals and means per page. Stages of different pages
+    can overlap in a batch run, pass the wall time of the run to get the actual pages and lines per second.
+    """
+    traces = [x for x in traces if x is not None and x.enabled]
+    stages = {}
+
+    for trace in traces:
+        for name, stage in trace.stages().items():
+            summary = stages.setdefault(name, {"pages": 0, "min": None, "max": None})
+            summary["pages"] += 1
+            summary["min"] = stage["seconds"] if summary["min"] is None else min(summary["min"], stage["seconds"])
+            summary["max"] = stage["seconds"] if summary["max"] is None else max(summary["max"], stage["seconds"])
+
+            for key, value in stage.items():
+                summary[key] = summary.get(key, 0) + value
+
+    for summary in stages.values():
+        summary["mean"] = summary["seconds"] / summary["pages"]
+
+    lines = sum(x.stages().get("extract_line_images", {}).get("lines", 0) for x in traces)
+    summary = {
+        "pages": len(traces),
+        "lines": lines,
+        "seconds": sum(x.total() for x in traces),
+        "stages": dict(sorted(stages.items(), key=lambda x: -x[1]["seconds"]))
+    }
+
+    if wall_time is not None and wall_time > 0:
+        summary["wall_time"] = wall_time
+        summary["pages_per_second"] = len(traces) / wall_time
+        summary["lines_per_second"] = lines / wall_time
+
+    return summary
+
+
+def export_traces(file_path: str, traces: List[PageTrace], wall_time: float | None = None):
+    traces = [x for x in traces if x is not None and x.enabled]
+    content = {
+        "summary": aggregate_traces(traces, wall_time),
+        "pages": [x.to_dict() for x in traces]
+    }
+
+    with open(file_path, "w", encoding="utf-8") as f:
+        json.dump(content, f, ensure_ascii=False, indent=1)
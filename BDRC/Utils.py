@@ -10,18 +10,23 @@ import numpy.typing as npt
 import onnxruntime as ort
 
 from math import ceil
-from uuid import uuid1
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+from uuid import UUID, uuid1
 from pathlib import Path
 from datetime import datetime
 from tps import ThinPlateSpline
-from typing import List, Tuple, Optional, Sequence
+from typing import List, Tuple, Optional, Sequence, TYPE_CHECKING
 
-from BDRC.Data import OCRModelConfig, Platform, ScreenData, BBox, Line, \
-    OCRModel, OCRData
-from PySide6.QtWidgets import QApplication
-from PySide6.QtGui import QImage, Qt
+from BDRC.Data import ContourTable, OCRModelConfig, Platform, ScreenData, BBox, Line, \
+    OCRModel, OCRData, OCRLine, OCResult, Encoding, KFactorSearch
+from BDRC.Trace import PageTrace
+from BDRC.ReadingOrder import index_by_center, sort_bbox_centers
+from Config import OCRARCHITECTURE, CHARSETENCODER, CTC_DECODING
 
-from Config import OCRARCHITECTURE, CHARSETENCODER
+# Qt is only imported where it is needed so that the headless entry points (cli, process workers) never load the widget stack
+if TYPE_CHECKING:
+    from PySide6.QtWidgets import QApplication
 
 page_classes = {
                 "background": "0, 0, 0",
@@ -31,7 +36,7 @@ page_classes = {
                 "caption": "255, 100, 243"
             }
 
-def get_screen_center(app: QApplication, start_size_ratio: float = 0.8) -> ScreenData:
+def get_screen_center(app: "QApplication", start_size_ratio: float = 0.8) -> ScreenData:
     screen = app.primaryScreen()
     rect = screen.availableGeometry()
     max_width = rect.width()
@@ -80,6 +85,18 @@ def get_execution_providers() -> List[str]:
     print(f"Available ONNX providers: {available_providers}")
     return available_providers
 
+def get_session_options(num_threads: int = 0) -> ort.SessionOptions:
+    """
+    num_threads limits the intra-op thread pool of a session, 0 lets onnxruntime use all cores
+    """
+    options = ort.SessionOptions()
+
+    if num_threads > 0:
+        options.intra_op_num_threads = num_threads
+        options.inter_op_num_threads = 1
+
+    return options
+
 def get_filename(file_path: str) -> str:
     name_segments = os.path.basename(file_path).split(".")[:-1]
     name = "".join(f"{x}." for x in name_segments)
@@ -111,6 +128,8 @@ def build_ocr_data(id_val, file_path: str, target_width: int = None):
     Returns:
         OCRData object
     """
+    from PySide6.QtGui import QImage, Qt
+
     file_name = get_filename(file_path)
     
     # Generate GUID if id_val is an integer, otherwise use the provided UUID
@@ -138,6 +157,82 @@ def build_ocr_data(id_val, file_path: str, target_width: int = None):
 
     return ocr_data
 
+def serialize_ocr_result(result: OCResult) -> dict:
+    """
+    Packs an OCResult into a compact dict of plain types: the mask is stored as a single channel PNG,
+    contours as raw int32 buffers. Used to send results across processes and to store them on disk.
+    """
+    mask = result.mask
+    mask_channels = 1 if len(mask.shape) == 2 else mask.shape[2]
+
+    if mask_channels > 1:
+        mask = mask[:, :, 0]  # the line mask is replicated over all channels
+
+    _, mask_png = cv2.imencode(".png", mask)
+
+    lines = []
+    for line in result.lines:
+        contour = np.ascontiguousarray(line.contour, dtype=np.int32)
+        lines.append({
+            "guid": line.guid.bytes,
+            "contour": contour.tobytes(),
+            "contour_shape": contour.shape,
+            "bbox": (int(line.bbox.x), int(line.bbox.y), int(line.bbox.w), int(line.bbox.h)),
+            "center": (int(line.center[0]), int(line.center[1]))
+        })
+
+    text = [
+        {"guid": x.guid.bytes, "text": x.text, "encoding": x.encoding.value} for x in result.text
+    ]
+
+    data = {
+        "guid": result.guid.bytes if result.guid is not None else None,
+        "mask": mask_png.tobytes(),
+        "mask_channels": mask_channels,
+        "lines": lines,
+        "text": text,
+        "angle": float(result.angle)
+    }
+
+    if result.trace is not None:
+        data["trace"] = (result.trace.name, result.trace.events)
+
+    return data
+
+
+def deserialize_ocr_result(data: dict, guid: UUID | None = None) -> OCResult:
+    mask = cv2.imdecode(np.frombuffer(data["mask"], dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+
+    if data["mask_channels"] == 3:
+        mask = cv2.cvtColor(mask, cv2.COLOR_GRAY2RGB)
+
+    lines = []
+    for line in data["lines"]:
+        contour = np.frombuffer(line["contour"], dtype=np.int32).reshape(line["contour_shape"]).copy()
+        lines.append(
+            Line(
+                guid=UUID(bytes=line["guid"]),
+                contour=contour,
+                bbox=BBox(*line["bbox"]),
+                center=tuple(line["center"])
+            )
+        )
+
+    text = [
+        OCRLine(guid=UUID(bytes=x["guid"]), text=x["text"], encoding=Encoding(x["encoding"])) for x in data["text"]
+    ]
+
+    if guid is None and data["guid"] is not None:
+        guid = UUID(bytes=data["guid"])
+
+    trace = None
+    if data.get("trace") is not None:
+        trace = PageTrace(data["trace"][0])
+        trace.events = list(data["trace"][1])
+
+    return OCResult(guid=guid, mask=mask, lines=lines, text=text, angle=data["angle"], trace=trace)
+
+
 def read_theme_file(file_path: str) -> dict | None:
     if os.path.isfile(file_path):
         with open(file_path, "r") as f:
@@ -193,6 +288,7 @@ def read_ocr_model_config(config_file: str):
     swap_hw = True if json_content["swap_hw"] == "yes" else False
     characters = json_content["charset"]
     add_blank = True if json_content["add_blank"] == "yes" else False
+    ctc_decoding = CTC_DECODING[json_content.get("ctc_decoding", "beam")]
 
     config = OCRModelConfig(
         onnx_model_file,
@@ -206,12 +302,28 @@ def read_ocr_model_config(config_file: str):
         encoder=CHARSETENCODER[encoder],
         charset=characters,
         add_blank=add_blank,
-        version=version
+        version=version,
+        ctc_decoding=ctc_decoding
     )
 
     return config
 
 
+def read_tiling_config(json_content: dict) -> dict:
+    """
+    The optional tiling and resolution settings in the config.json of a line or layout model, as keyword arguments
+    for LineDetectionConfig and LayoutDetectionConfig.
+    """
+    return {
+        "tile_batch_size": int(json_content.get("tile_batch_size", 8)),
+        "tile_overlap": int(json_content.get("tile_overlap", 0)),
+        "skip_background_tiles": json_content.get("skip_background_tiles", "no") in ("yes", True),
+        "background_ink_ratio": float(json_content.get("background_ink_ratio", 0.001)),
+        "detection_scale": float(json_content.get("detection_scale", 1.0)),
+        "target_line_height": int(json_content.get("target_line_height", 0))
+    }
+
+
 def resize_to_height(image, target_height: int):
     scale_ratio = target_height / image.shape[0]
     image = cv2.resize(
@@ -274,19 +386,22 @@ def sigmoid(x):
     return 1 / (1 + np.exp(-x))
 
 
-def run_tps(image: npt.NDArray, input_pts, output_pts, add_corners=True, alpha=0.5):
+def logit(p: float) -> float:
+    """
+    The inverse of sigmoid, x > logit(p) is the same as sigmoid(x) > p.
+    """
+    return math.log(p / (1 - p))
 
-    if len(image.shape) == 3:
-        height, width, _ = image.shape
-    else:
-        image = cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
-        height, width, _ = image.shape
 
-    input_pts = npt.NDArray(input_pts)
-    output_pts = npt.NDArray(output_pts)
+def fit_tps(height: int, width: int, input_pts, output_pts, add_corners=True, alpha=0.5) -> ThinPlateSpline:
+    """
+    Fits a thin plate spline from input_pts to output_pts ((y, x) points), optionally pinning the image corners.
+    """
+    input_pts = np.array(input_pts, dtype=np.float64)
+    output_pts = np.array(output_pts, dtype=np.float64)
 
     if add_corners:
-        corners = npt.NDArray(  # Add corners ctrl points
+        corners = np.array(  # Add corners ctrl points
         [
             [0.0, 0.0],
             [1.0, 0.0],
@@ -294,7 +409,6 @@ def run_tps(image: npt.NDArray, input_pts, output_pts, add_corners=True, alpha=0
             [1.0, 1.0],
         ])
 
-        corners *= [height, width]
         corners *= [height, width]
 
         input_pts = np.concatenate((input_pts, corners))
@@ -303,52 +417,220 @@ def run_tps(image: npt.NDArray, input_pts, output_pts, add_corners=True, alpha=0
     tps = ThinPlateSpline(alpha)
     tps.fit(input_pts, output_pts)
 
+    return tps
+
+
+def get_tps_coordinates(height: int, width: int, input_pts, output_pts, add_corners=True, alpha=0.5) -> npt.NDArray:
+    """
+    Evaluates the spline from fit_tps for every pixel of a height x width image.
+    Returns the (2, H, W) source coordinates for map_coordinates.
+    """
+    tps = fit_tps(height, width, input_pts, output_pts, add_corners, alpha)
+
     output_indices = np.indices((height, width), dtype=np.float64).transpose(1, 2, 0)  # Shape: (H, W, 2)
     input_indices = tps.transform(output_indices.reshape(-1, 2)).reshape(height, width, 2)
-    warped = np.concatenate(
+
+    return input_indices.transpose(2, 0, 1)
+
+
+def get_interpolation_weights(size: int, grid_size: int) -> npt.NDArray:
+    """
+    (size, grid_size) matrix that linearly interpolates grid_size samples spaced evenly from 0 to size - 1.
+    """
+    positions = np.arange(size) * (grid_size - 1) / max(1, size - 1)
+    lower = np.minimum(np.floor(positions).astype(np.int64), grid_size - 2)
+    fraction = positions - lower
+
+    weights = np.zeros((size, grid_size), dtype=np.float32)
+    weights[np.arange(size), lower] = 1.0 - fraction
+    weights[np.arange(size), lower + 1] = fraction
+
+    return weights
+
+
+def get_tps_maps(
+        height: int,
+        width: int,
+        input_pts,
+        output_pts,
+        tolerance: float = 0.01,
+        grid_step: int = 64,
+        add_corners=True,
+        alpha=0.5
+) -> Tuple[npt.NDArray, npt.NDArray]:
+    """
+    Same mapping as get_tps_coordinates, but the spline is only evaluated on a coarse grid that is linearly upsampled
+    to the (map_x, map_y) float32 maps for cv2.remap. The grid is refined until the upsampled maps are within
+    tolerance pixels of the spline between the grid points and along the image border.
+    """
+    tps = fit_tps(height, width, input_pts, output_pts, add_corners, alpha)
+    step = max(1, grid_step)
+
+    while True:
+        grid_h = max(2, ceil((height - 1) / step) + 1)
+        grid_w = max(2, ceil((width - 1) / step) + 1)
+
+        # the grid includes the first and last row and column of the image
+        ys = np.linspace(0, height - 1, grid_h)
+        xs = np.linspace(0, width - 1, grid_w)
+        grid = np.stack(np.meshgrid(ys, xs, indexing="ij"), axis=-1)
+
+        coarse = tps.transform(grid.reshape(-1, 2)).reshape(grid_h, grid_w, 2)
+
+        # separable linear upsampling, cv2.resize/remap would quantize the sub-cell positions
+        weights_y = get_interpolation_weights(height, grid_h)
+        weights_x = get_interpolation_weights(width, grid_w)
+        dense = np.stack([weights_y @ coarse[..., idx] @ weights_x.T for idx in (0, 1)], axis=-1).astype(np.float32)
+
+        if step == 1:
+            break
+
+        # the interpolation error is largest in the middle of the cells and of the cell borders along the image border
+        mid_ys = np.concatenate([[0], np.round((ys[:-1] + ys[1:]) / 2), [height - 1]]).astype(np.int64)
+        mid_xs = np.concatenate([[0], np.round((xs[:-1] + xs[1:]) / 2), [width - 1]]).astype(np.int64)
+        check = np.stack(np.meshgrid(mid_ys, mid_xs, indexing="ij"), axis=-1).reshape(-1, 2)
+        expected = tps.transform(check.astype(np.float64))
+        error = np.abs(dense[check[:, 0], check[:, 1]] - expected).max()
+
+        if error <= tolerance:
+            break
+
+        step = step // 2
+
+    return dense[..., 1], dense[..., 0]
+
+
+def remap_with_mask(
+        image: npt.NDArray,
+        mask: npt.NDArray,
+        map_x: npt.NDArray,
+        map_y: npt.NDArray,
+        mask_order: int = 3
+) -> Tuple[npt.NDArray, npt.NDArray]:
+    """
+    Warps an image with cv2.remap and its mask with warp_image at the same coordinates. The lines are traced on
+    the mask, so it is sampled like in the exact path (mask_order as passed to map_coordinates there) to keep
+    the contours, and with them the line images, the same.
+    """
+    warped_img = cv2.remap(image, map_x, map_y, cv2.INTER_CUBIC, borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+    warped_mask = warp_image(mask, np.stack([map_y, map_x]), order=mask_order)
+
+    return warped_img, warped_mask
+
+
+def warp_image(image: npt.NDArray, coordinates: npt.NDArray, order: int = 3) -> npt.NDArray:
+    """
+    Samples all channels of image at the coordinates from get_tps_coordinates, use order=0 for masks.
+    """
+    if len(image.shape) == 2:
+        return scipy.ndimage.map_coordinates(image, coordinates, order=order)
+
+    return np.concatenate(
         [
-            scipy.ndimage.map_coordinates(image[..., channel], input_indices.transpose(2, 0, 1))[..., None]
-            for channel in (0, 1, 2)
+            scipy.ndimage.map_coordinates(image[..., channel], coordinates, order=order)[..., None]
+            for channel in range(image.shape[2])
         ],
         axis=-1,
     )
 
-    return warped
 
-def get_line_images_via_local_tps(image: npt.NDArray, line_data: list, k_factor: float = 1.7):
-    default_k_factor = k_factor
-    current_k = default_k_factor
-    line_images = []
+def run_tps(image: npt.NDArray, input_pts, output_pts, add_corners=True, alpha=0.5):
 
-    for line in line_data:
-        if line["tps"] is True:
-            output_pts = line["output_pts"]
-            input_pts = line["input_pts"]
+    if len(image.shape) == 3:
+        height, width, _ = image.shape
+    else:
+        image = cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
+        height, width, _ = image.shape
 
-            assert input_pts is not None and output_pts is not None
+    coordinates = get_tps_coordinates(height, width, input_pts, output_pts, add_corners, alpha)
 
-            tmp_mask = np.zeros((image.shape[0], image.shape[1]), dtype=np.uint8)
-            cv2.drawContours(tmp_mask, [line["contour"]], -1, (255, 255, 255), -1)
+    return warp_image(image[..., :3], coordinates)
 
-            warped_img = run_tps(image, output_pts, input_pts)
-            warped_mask = run_tps(tmp_mask, output_pts, input_pts)
+def dewarp_line_roi(
+        image: npt.NDArray,
+        line: dict,
+        k_factor: float,
+        bbox_tolerance: float,
+        tps_tolerance: float = 0.01
+) -> Tuple[npt.NDArray, npt.NDArray]:
+    """
+    Dewarps the region around a curved line (see check_line_tps) instead of the whole page. The bbox of a curved line
+    is taller than the line by its vertical deviation, the region covers the dilation of the straightened line
+    horizontally and the largest line image that fits bbox_tolerance vertically. tps_tolerance works as in
+    apply_global_tps. Returns the dewarped region and the dewarped line mask.
+    """
+    contour = line["contour"]
+    bbox = cv2.boundingRect(contour)
+    line_h = max(1, bbox[3] - int(line["max_yd"]))
+    x_start, y_start, x_end, y_end = get_roi_bounds(image, bbox, int(line_h * k_factor), int(ceil(line_h * bbox_tolerance)))
 
-            _, _, _, bbox_h = cv2.boundingRect(line["contour"])
+    roi_image = crop_image(image, x_start, y_start, x_end, y_end)
+    roi_mask = np.zeros((y_end - y_start, x_end - x_start), dtype=np.uint8)
+    cv2.drawContours(roi_mask, [contour], -1, (255, 255, 255), -1, offset=(-x_start, -y_start))
 
-            line_img, adapted_k = get_line_image(warped_img, warped_mask, bbox_h, bbox_tolerance=2.0,
-                                                 k_factor=current_k)
-            line_images.append(line_img)
+    # points are (y, x)
+    offset = np.array([y_start, x_start])
+    input_pts = np.array(line["input_pts"]) - offset
+    output_pts = np.array(line["output_pts"]) - offset
 
-            if current_k != adapted_k:
-                current_k = adapted_k
+    if tps_tolerance > 0:
+        map_x, map_y = get_tps_maps(roi_image.shape[0], roi_image.shape[1], output_pts, input_pts, tolerance=tps_tolerance)
+        return remap_with_mask(roi_image, roi_mask, map_x, map_y, mask_order=0)
 
-        else:
-            tmp_mask = np.zeros((image.shape[0], image.shape[1]), dtype=np.uint8)
-            cv2.drawContours(tmp_mask, [line["contour"]], -1, (255, 255, 255), -1)
+    # the spline is evaluated once for the image and the mask
+    coordinates = get_tps_coordinates(roi_image.shape[0], roi_image.shape[1], output_pts, input_pts)
+    warped_img = warp_image(roi_image, coordinates)
+    warped_mask = warp_image(roi_mask, coordinates, order=0)
 
-            _, _, _, h = cv2.boundingRect(line["contour"])
-            line_img, adapted_k = get_line_image(image, tmp_mask, h, bbox_tolerance=2.0, k_factor=current_k)
-            line_images.append(line_img)
+    return warped_img, warped_mask
+
+
+def get_line_images_via_local_tps(
+        image: npt.NDArray,
+        line_data: list,
+        k_factor: float = 1.7,
+        bbox_tolerance: float = 2.0,
+        k_search: KFactorSearch = KFactorSearch.Iterative,
+        num_threads: int = 0,
+        tps_tolerance: float = 0.01
+):
+    """
+    Like extract_line_images, but dewarps the curved lines of the line data from check_for_tps one by one.
+    The curved lines are dewarped in parallel on num_threads threads (0 uses all cores), the line images are then
+    cut in order so that the adapted k_factor is carried over from line to line just like in extract_line_images.
+    """
+    curved = [idx for idx, line in enumerate(line_data) if line["tps"] is True]
+    dewarped = {}
+
+    if len(curved) > 0:
+        num_threads = num_threads if num_threads > 0 else os.cpu_count() or 1
+        with ThreadPoolExecutor(max_workers=min(num_threads, len(curved))) as executor:
+            results = executor.map(lambda idx: dewarp_line_roi(image, line_data[idx], k_factor, bbox_tolerance, tps_tolerance), curved)
+            dewarped = dict(zip(curved, results))
+
+    current_k = k_factor
+    line_images = []
+
+    for idx, line in enumerate(line_data):
+        line_img = None
+
+        if idx in dewarped:
+            assert line["input_pts"] is not None and line["output_pts"] is not None
+            warped_img, warped_mask = dewarped[idx]
+            _, _, _, bbox_h = cv2.boundingRect(warped_mask)
+
+            if bbox_h > 0:
+                line_img, adapted_k = get_line_image(
+                    warped_img, warped_mask, bbox_h, bbox_tolerance=bbox_tolerance, k_factor=current_k, k_search=k_search
+                )
+
+        if line_img is None:
+            line_img, adapted_k = get_line_image_from_contour(
+                image, line["contour"], bbox_tolerance=bbox_tolerance, k_factor=current_k, k_search=k_search
+            )
+
+        line_images.append(line_img)
+        current_k = adapted_k
 
     return line_images
 
@@ -406,13 +688,19 @@ def mask_n_crop(image: np.array, mask: np.array) -> np.array:
     if len(image.shape) == 2:
         image = np.expand_dims(image, axis=-1)
 
-    image_masked = cv2.bitwise_and(image, image, mask, mask)
-    image_masked = np.delete(
-        image_masked, np.where(~image_masked.any(axis=1))[0], axis=0
-    )
-    image_masked = np.delete(
-        image_masked, np.where(~image_masked.any(axis=0))[0], axis=1
-    )
+    # everything outside the bounding box of the mask is blank and would be removed below anyway
+    x, y, w, h = cv2.boundingRect(mask)
+    if w > 0 and h > 0:
+        image = image[y:y + h, x:x + w]
+        mask = mask[y:y + h, x:x + w]
+
+    image_masked = cv2.bitwise_and(image, image, mask=mask)
+
+    # drops every row and column in which any channel is blank
+    rows = image_masked.any(axis=1)
+    image_masked = image_masked[rows.all(axis=-1) if rows.ndim > 1 else rows]
+    cols = image_masked.any(axis=0)
+    image_masked = image_masked[:, cols.all(axis=-1) if cols.ndim > 1 else cols]
 
     return image_masked
 
@@ -450,24 +738,116 @@ def calculate_rotation_angle_from_lines(
     return mean_angle
 
 
+def get_rotation_matrix(image_shape: Tuple[int, ...], angle: float) -> npt.NDArray:
+    """
+    The affine matrix of rotate_from_angle for an image of the given shape.
+    """
+    rows, cols = image_shape[:2]
+
+    return cv2.getRotationMatrix2D((cols / 2, rows / 2), angle, 1)
+
+
 def rotate_from_angle(image: np.array, angle: float) -> np.array:
+    if angle == 0:
+        # warping with the identity samples every pixel at its own position
+        return image.copy()
+
     rows, cols = image.shape[:2]
-    rot_matrix = cv2.getRotationMatrix2D((cols / 2, rows / 2), angle, 1)
+    rot_matrix = get_rotation_matrix(image.shape, angle)
 
     rotated_img = cv2.warpAffine(image, rot_matrix, (cols, rows), borderValue=(0, 0, 0))
 
     return rotated_img
 
 
+class DeferredWarp:
+    """
+    A page image that is warped with an affine matrix (as in rotate_from_angle) or with a pair of cv2.remap maps
+    only where it is read. crop() warps the rows it needs in full-width bands, which gives exactly the pixels of
+    warping the whole image at once, rows that no line reaches are never warped.
+    """
+    def __init__(self, image: npt.NDArray, matrix: npt.NDArray | None = None, maps: Tuple[npt.NDArray, npt.NDArray] | None = None, band_height: int = 64):
+        assert (matrix is None) != (maps is None), "either an affine matrix or remap maps are required"
+
+        self.image = image
+        self.inverse_matrix = None if matrix is None else cv2.invertAffineTransform(matrix)
+        self.maps = maps
+        self.band_height = band_height
+
+        height, width = image.shape[:2] if maps is None else maps[0].shape[:2]
+        self.shape = (height, width) + image.shape[2:]
+        self.warped = np.zeros(self.shape, dtype=image.dtype)
+        self.warped_bands = np.zeros(ceil(height / band_height), dtype=bool)
+        self.lock = Lock()
+
+    def _warp_band(self, idx: int):
+        y_start = idx * self.band_height
+        y_end = min(self.shape[0], y_start + self.band_height)
+
+        if self.maps is not None:
+            map_x, map_y = self.maps
+            band = cv2.remap(
+                self.image, map_x[y_start:y_end], map_y[y_start:y_end], cv2.INTER_CUBIC,
+                borderMode=cv2.BORDER_CONSTANT, borderValue=0
+            )
+        else:
+            # shifting the inverse map by the first row of the band keeps the per-pixel source positions
+            matrix = self.inverse_matrix.copy()
+            matrix[:, 2] += matrix[:, 1] * y_start
+            band = cv2.warpAffine(
+                self.image, matrix, (self.shape[1], y_end - y_start),
+                flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP, borderValue=(0, 0, 0)
+            )
+
+        self.warped[y_start:y_end] = band.reshape(self.warped[y_start:y_end].shape)
+
+    def warp_rows(self, y_start: int, y_end: int):
+        if y_end <= y_start:
+            return
+
+        # crops of several threads can share a band (see get_line_images_via_local_tps)
+        with self.lock:
+            for idx in range(y_start // self.band_height, ceil(y_end / self.band_height)):
+                if not self.warped_bands[idx]:
+                    self._warp_band(idx)
+                    self.warped_bands[idx] = True
+
+    def crop(self, x_start: int, y_start: int, x_end: int, y_end: int) -> npt.NDArray:
+        self.warp_rows(y_start, y_end)
+
+        return self.warped[y_start:y_end, x_start:x_end]
+
+    def to_array(self) -> npt.NDArray:
+        self.warp_rows(0, self.shape[0])
+
+        return self.warped
+
+
+def crop_image(image: npt.NDArray | DeferredWarp, x_start: int, y_start: int, x_end: int, y_end: int) -> npt.NDArray:
+    """
+    Region of a page image that might be a DeferredWarp.
+    """
+    if isinstance(image, DeferredWarp):
+        return image.crop(x_start, y_start, x_end, y_end)
+
+    return image[y_start:y_end, x_start:x_end]
+
+
 def get_rotation_angle_from_lines(
     line_mask: npt.NDArray,
     max_angle: float = 5.0,
     debug_angles: bool = False,
 ) -> float:
-    contours, _ = cv2.findContours(line_mask, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
-    mask_threshold = (line_mask.shape[0] * line_mask.shape[1]) * 0.001
-    contours = [x for x in contours if cv2.contourArea(x) > mask_threshold]
-    angles = [cv2.minAreaRect(x)[2] for x in contours]
+    table = get_contour_table(line_mask, rect_min_area=(line_mask.shape[0] * line_mask.shape[1]) * 0.001)
+
+    return get_rotation_angle_from_table(table, max_angle, debug_angles)
+
+
+def get_rotation_angle_from_table(table: ContourTable, max_angle: float = 5.0, debug_angles: bool = False) -> float:
+    """
+    The deskew angle of get_rotation_angle_from_lines from the minAreaRects of the contour table.
+    """
+    angles = [float(x) for x in table.rects[:, 4] if not np.isnan(x)]
 
     low_angles = [x for x in angles if abs(x) != 0.0 and x < max_angle]
     high_angles = [x for x in angles if abs(x) != 90.0 and x > (90 - max_angle)]
@@ -488,6 +868,74 @@ def get_rotation_angle_from_lines(
     return mean_angle
 
 
+def build_contour_table(contours: Sequence, rect_min_area: float | None = None) -> ContourTable:
+    """
+    Collects the points of the contours in one array and computes the areas and bboxes of all contours at once.
+    The minAreaRects are only computed for contours larger than rect_min_area (all contours if None).
+    """
+    if len(contours) == 0:
+        points = np.zeros((0, 2), dtype=np.int32)
+        empty = np.zeros(0)
+        return ContourTable([], points, np.zeros(1, dtype=np.int64), empty, np.zeros((0, 4), dtype=np.int32), np.zeros((0, 5)))
+
+    lengths = np.array([len(x) for x in contours])
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    points = np.concatenate([x.reshape(-1, 2) for x in contours]).astype(np.int32)
+    starts = offsets[:-1]
+
+    # shoelace formula over each closed contour, exact for integer points just like cv2.contourArea
+    x, y = points[:, 0].astype(np.int64), points[:, 1].astype(np.int64)
+    following = np.arange(1, len(points) + 1)
+    following[offsets[1:] - 1] = starts
+    areas = np.abs(np.add.reduceat(x * y[following] - x[following] * y, starts)) / 2.0
+
+    x_min, y_min = np.minimum.reduceat(x, starts), np.minimum.reduceat(y, starts)
+    x_max, y_max = np.maximum.reduceat(x, starts), np.maximum.reduceat(y, starts)
+    bboxes = np.stack([x_min, y_min, x_max - x_min + 1, y_max - y_min + 1], axis=1).astype(np.int32)
+
+    table_contours = [x.reshape(-1, 1, 2) for x in np.split(points, offsets[1:-1])]
+    rects = np.full((len(contours), 5), np.nan)
+
+    for idx in range(len(contours)):
+        if rect_min_area is None or areas[idx] > rect_min_area:
+            (center_x, center_y), (w, h), angle = cv2.minAreaRect(table_contours[idx])
+            rects[idx] = center_x, center_y, w, h, angle
+
+    return ContourTable(table_contours, points, offsets, areas, bboxes, rects)
+
+
+def get_contour_table(mask: npt.NDArray, rect_min_area: float | None = None) -> ContourTable:
+    return build_contour_table(get_contours(mask), rect_min_area)
+
+
+def select_contours(table: ContourTable, keep: npt.NDArray) -> ContourTable:
+    """
+    The rows of the table for which keep is True.
+    """
+    indices = np.flatnonzero(keep)
+
+    if len(indices) == len(table.contours):
+        return table
+
+    if len(indices) == 0:
+        return build_contour_table([])
+
+    offsets = np.concatenate([[0], np.cumsum(np.diff(table.offsets)[indices])])
+    points = np.concatenate([table.contours[x].reshape(-1, 2) for x in indices])
+    contours = [x.reshape(-1, 1, 2) for x in np.split(points, offsets[1:-1])]
+
+    return ContourTable(contours, points, offsets, table.areas[indices], table.bboxes[indices], table.rects[indices])
+
+
+def filter_contour_table(table: ContourTable, image_width: int, threshold: float = 0.01) -> ContourTable:
+    """
+    filter_line_contours on the bboxes of the table.
+    """
+    keep = (table.bboxes[:, 2] > image_width * threshold) & (table.bboxes[:, 3] > 10)
+
+    return select_contours(table, keep)
+
+
 def pol2cart(theta, rho):
     x = rho * np.cos(theta)
     y = rho * np.sin(theta)
@@ -610,113 +1058,48 @@ def get_line_threshold(line_prediction: npt.NDArray, slice_width: int = 20):
     x, y, w, h = cv2.boundingRect(line_prediction)
     x_steps = (w // slice_width) // 2
 
-    bbox_numbers = []
-
-    for step in range(1, x_steps + 1):
-        x_offset = x_steps * step
-        x_start = x + x_offset
-        x_end = x_start + slice_width
-
-        _slice = line_prediction[y : y + h, x_start:x_end]
-        contours, _ = cv2.findContours(_slice, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
-        bbox_numbers.append((len(contours), contours))
-
-    sorted_list = sorted(bbox_numbers, key=lambda x: x[0], reverse=True)
-
-    if len(sorted_list) > 0:
-        reference_slice = sorted_list[0]
-
-        y_points = []
-        n_contours, contours = reference_slice
+    if x_steps == 0:
+        return 0.0
 
-        if n_contours == 0:
-            print("number of contours is 0")
-            line_threshold = 0.0
-        else:
-            for _, contour in enumerate(contours):
-                x, y, w, h = cv2.boundingRect(contour)
-                y_center = y + (h // 2)
-                y_points.append(y_center)
-
-            # Check if y_points is empty before calculating median
-            if len(y_points) > 0:
-                line_threshold = float(np.median(y_points) // n_contours)
-            else:
-                line_threshold = 0.0
-    else:
-        line_threshold = 0.0
+    # the slices are copied side by side into one image, separated by an empty column so that no contour can reach
+    # into a neighbouring slice, and traced with a single findContours call. Slices starting right of the mask
+    # have no contours and are left out.
+    starts = x + x_steps * np.arange(1, x_steps + 1)
+    starts = starts[starts < line_prediction.shape[1]]
+    slices = np.zeros((h, len(starts), slice_width + 1), dtype=np.uint8)
 
-    return line_threshold
+    for idx, x_start in enumerate(starts):
+        _slice = line_prediction[y: y + h, x_start: x_start + slice_width]
+        slices[:, idx, :_slice.shape[1]] = _slice
 
+    contours, _ = cv2.findContours(slices.reshape(h, -1), cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
 
-def sort_bbox_centers(bbox_centers: List[Tuple[int, int]], line_threshold: int = 20) -> List:
-    # Handle empty bbox_centers
-    if not bbox_centers:
-        return []
-        
-    sorted_bbox_centers = []
-    tmp_line = []
-
-    for i in range(0, len(bbox_centers)):
-        if len(tmp_line) > 0:
-            for s in range(0, len(tmp_line)):
-
-                # TODO: refactor this to make this calculation an enum to choose between both methods
-                # y_diff = abs(tmp_line[s][1] - bbox_centers[i][1])
-                """
-                I use the mean of the hitherto present line chunks in tmp_line since
-                the precalculated fixed threshold can break the sorting if
-                there is some slight bending in the line. This part may need some tweaking after
-                some further practical review
-                """
-                ys = [y[1] for y in tmp_line]
-                
-                # Check if ys is not empty before calculating mean
-                if ys:
-                    mean_y = np.mean(ys)
-                    y_diff = abs(mean_y - bbox_centers[i][1])
-
-                    if y_diff > line_threshold:
-                        tmp_line.sort(key=lambda x: x[0])
-                        sorted_bbox_centers.append(tmp_line.copy())
-                        tmp_line.clear()
-
-                        tmp_line.append(bbox_centers[i])
-                        break
-                    else:
-                        tmp_line.append(bbox_centers[i])
-                        break
-                else:
-                    tmp_line.append(bbox_centers[i])
-                    break
-        else:
-            tmp_line.append(bbox_centers[i])
+    if len(contours) == 0:
+        print("number of contours is 0")
+        return 0.0
 
-    # Add the last tmp_line if it's not empty
-    if tmp_line:
-        sorted_bbox_centers.append(tmp_line)
+    bboxes = np.array([cv2.boundingRect(x) for x in contours])
+    slice_ids = bboxes[:, 0] // (slice_width + 1)
+    contour_counts = np.bincount(slice_ids, minlength=len(starts))
 
-    # Sort each line by x-coordinate
-    for y in sorted_bbox_centers:
-        y.sort(key=lambda x: x[0])
+    # the first slice with the most contours
+    reference = int(np.argmax(contour_counts))
+    n_contours = int(contour_counts[reference])
 
-    sorted_bbox_centers = list(reversed(sorted_bbox_centers))
+    reference_bboxes = bboxes[slice_ids == reference]
+    y_points = reference_bboxes[:, 1] + reference_bboxes[:, 3] // 2
 
-    return sorted_bbox_centers
+    return float(np.median(y_points) // n_contours)
 
 
 def group_line_chunks(sorted_bbox_centers, lines: List[Line], adaptive_grouping: bool = True):
+    # a center stands for the first line with that center
+    line_index = index_by_center([x.center for x in lines])
     new_line_data = []
     for bbox_centers in sorted_bbox_centers:
 
         if len(bbox_centers) > 1:  # i.e. more than 1 bbox center in a group
-            contour_stack = []
-
-            for box_center in bbox_centers:
-                for line_data in lines:
-                    if box_center == line_data.center:
-                        contour_stack.append(line_data.contour)
-                        break
+            contour_stack = [lines[line_index[x][0]].contour for x in bbox_centers if x in line_index]
 
             if adaptive_grouping:
                 for contour in contour_stack:
@@ -748,14 +1131,21 @@ def group_line_chunks(sorted_bbox_centers, lines: List[Line], adaptive_grouping:
 
         else:
             for _bcenter in bbox_centers:
-                for line_data in lines:
-                    if _bcenter == line_data.center:
-                        new_line_data.append(line_data)
-                        break
+                if _bcenter in line_index:
+                    new_line_data.append(lines[line_index[_bcenter][0]])
 
     return new_line_data
 
 
+def get_lines_in_order(sorted_bbox_centers, lines: List[Line]) -> List[Line]:
+    """
+    The lines in the order of the sorted centers, all lines with the same center are added for each occurrence.
+    """
+    line_index = index_by_center([x.center for x in lines])
+
+    return [lines[idx] for centers in sorted_bbox_centers for center in centers for idx in line_index.get(center, [])]
+
+
 def sort_lines_by_threshold(
     line_mask: np.array,
     lines: list[Line],
@@ -775,13 +1165,7 @@ def sort_lines_by_threshold(
     if group_lines:
         new_lines = group_line_chunks(sorted_bbox_centers, lines)
     else:
-        _bboxes = [x for xs in sorted_bbox_centers for x in xs]
-
-        new_lines = []
-        for _bbox in _bboxes:
-            for _line in lines:
-                if _bbox == _line.center:
-                    new_lines.append(_line)
+        new_lines = get_lines_in_order(sorted_bbox_centers, lines)
 
     return new_lines, line_treshold
 
@@ -806,42 +1190,49 @@ def sort_lines_by_threshold2(
     if group_lines:
         new_lines = group_line_chunks(sorted_bbox_centers, lines)
     else:
-        _bboxes = [x for xs in sorted_bbox_centers for x in xs]
-
-        new_lines = []
-        for _bbox in _bboxes:
-            for _line in lines:
-                if _bbox == _line.center:
-                    new_lines.append(_line)
+        new_lines = get_lines_in_order(sorted_bbox_centers, lines)
 
     return new_lines, line_treshold
 
 
-def build_raw_line_data(image: npt.NDArray, line_mask: npt.NDArray):
-
+def build_line_geometry(line_mask: npt.NDArray):
+    """
+    The mask part of build_raw_line_data: deskews the line mask and finds the line contours without touching the
+    page image. Returns the rotated (single channel) mask, the ContourTable of the rotated contours, the angle and
+    the rotation matrix, which rotates the page image the same way (see DeferredWarp).
+    """
     if len(line_mask.shape) == 3:
         line_mask = cv2.cvtColor(line_mask, cv2.COLOR_BGR2GRAY)
 
-    angle = get_rotation_angle_from_lines(line_mask)
+    table = get_contour_table(line_mask, rect_min_area=(line_mask.shape[0] * line_mask.shape[1]) * 0.001)
+    angle = get_rotation_angle_from_table(table)
     rot_mask = rotate_from_angle(line_mask, angle)
-    rot_img = rotate_from_angle(image, angle)
+    rot_matrix = get_rotation_matrix(line_mask.shape, angle)
+
+    # the line contours are traced on the rotated mask, rotating the points of the unrotated contours gives outlines
+    # that are about a pixel tighter, which changes the size of the dilated line images by several pixels
+    line_table = table if angle == 0 else get_contour_table(rot_mask, rect_min_area=np.inf)
+    line_table = select_contours(line_table, line_table.areas > 10)
 
-    line_contours = get_contours(rot_mask)
-    line_contours = [x for x in line_contours if cv2.contourArea(x) > 10]
+    return rot_mask, line_table, angle, rot_matrix
 
+
+def build_raw_line_data(image: npt.NDArray, line_mask: npt.NDArray):
+    rot_mask, line_table, angle, _ = build_line_geometry(line_mask)
+    rot_img = rotate_from_angle(image, angle)
     rot_mask = cv2.cvtColor(rot_mask, cv2.COLOR_GRAY2RGB)
 
-    return rot_img, rot_mask, line_contours, angle
+    return rot_img, rot_mask, line_table.contours, angle
 
-def tile_image(padded_img: npt.NDArray, patch_size: int = 512):
-    x_steps = int(padded_img.shape[1] / patch_size)
-    y_steps = int(padded_img.shape[0] / patch_size)
-    y_splits = np.split(padded_img, y_steps, axis=0)
+def get_tile_origins(length: int, patch_size: int = 512, overlap: int = 0) -> List[int]:
+    """
+    Start positions of the tiles along one axis, neighbouring tiles share overlap pixels.
+    """
+    stride = patch_size - overlap
+    count = max(1, ceil(max(0, length - patch_size) / stride) + 1)
 
-    patches = [np.split(x, x_steps, axis=1) for x in y_splits]
-    patches = [x for xs in patches for x in xs]
+    return [idx * stride for idx in range(count)]
 
-    return patches, y_steps
 
 def stitch_predictions(prediction: npt.NDArray, y_steps: int) -> npt.NDArray:
     pred_y_split = np.split(prediction, y_steps, axis=0)
@@ -851,9 +1242,68 @@ def stitch_predictions(prediction: npt.NDArray, y_steps: int) -> npt.NDArray:
     return concat_img
 
 
-def get_paddings(image: npt.NDArray, patch_size: int = 512) -> Tuple[int, int]:
-    max_x = ceil(image.shape[1] / patch_size) * patch_size
-    max_y = ceil(image.shape[0] / patch_size) * patch_size
+def get_blend_weights(patch_size: int, overlap: int) -> npt.NDArray:
+    """
+    Weights of the pixels of a tile in blend_predictions, ramping up over the overlap at each border.
+    """
+    weights = np.ones(patch_size, dtype=np.float32)
+    ramp = (np.arange(overlap, dtype=np.float32) + 1) / (overlap + 1)
+    weights[:overlap] = ramp
+    weights[patch_size - overlap:] = np.minimum(weights[patch_size - overlap:], ramp[::-1])
+
+    return np.outer(weights, weights)
+
+
+def blend_predictions(
+        prediction: npt.NDArray, y_steps: int, overlap: int, active: npt.NDArray | None = None
+) -> npt.NDArray:
+    """
+    stitch_predictions for tiles that overlap by overlap pixels (see get_tile_view), the overlapping predictions are
+    averaged with weights that fade out towards the tile borders, which hides the seams between the tiles.
+    Tiles that are not active (skipped background tiles) have no weight, their prediction is only used for the
+    pixels that no active tile covers.
+    """
+    patch_size = prediction.shape[1]
+    x_steps = prediction.shape[0] // y_steps
+    stride = patch_size - overlap
+    height = (y_steps - 1) * stride + patch_size
+    width = (x_steps - 1) * stride + patch_size
+
+    weights = get_blend_weights(patch_size, overlap)
+    if prediction.ndim == 4:
+        weights = weights[:, :, None]
+
+    blended = np.zeros((height, width) + prediction.shape[3:], dtype=np.float32)
+    weight_sum = np.zeros((height, width) + weights.shape[2:], dtype=np.float32)
+
+    if active is None:
+        active = np.ones(prediction.shape[0], dtype=bool)
+
+    for idx in np.flatnonzero(active):
+        y = (idx // x_steps) * stride
+        x = (idx % x_steps) * stride
+        blended[y:y + patch_size, x:x + patch_size] += prediction[idx] * weights
+        weight_sum[y:y + patch_size, x:x + patch_size] += weights
+
+    for idx in np.flatnonzero(~active):
+        y = (idx // x_steps) * stride
+        x = (idx % x_steps) * stride
+        uncovered = weight_sum[y:y + patch_size, x:x + patch_size] == 0
+        blended[y:y + patch_size, x:x + patch_size] = np.where(
+            uncovered, prediction[idx], blended[y:y + patch_size, x:x + patch_size]
+        )
+        weight_sum[y:y + patch_size, x:x + patch_size][uncovered] = 1.0
+
+    return blended / weight_sum
+
+
+def get_paddings(image: npt.NDArray, patch_size: int = 512, overlap: int = 0) -> Tuple[int, int]:
+    if overlap > 0:
+        max_x = get_tile_origins(image.shape[1], patch_size, overlap)[-1] + patch_size
+        max_y = get_tile_origins(image.shape[0], patch_size, overlap)[-1] + patch_size
+    else:
+        max_x = ceil(image.shape[1] / patch_size) * patch_size
+        max_y = ceil(image.shape[0] / patch_size) * patch_size
     pad_x = max_x - image.shape[1]
     pad_y = max_y - image.shape[0]
 
@@ -866,9 +1316,11 @@ def preprocess_image(
     clamp_width: int = 4096,
     clamp_height: int = 2048,
     clamp_size: bool = True,
+    overlap: int = 0
 ):
     """
     Some dimension checking and resizing to avoid very large inputs on which the line(s) on the resulting tiles could be too big and cause troubles with the current line model.
+    The image is padded to fit tiles that overlap by overlap pixels (see get_tile_view).
     """
     if clamp_size and image.shape[1] > image.shape[0] and image.shape[1] > clamp_width:
         image, _ = resize_to_width(image, clamp_width)
@@ -881,7 +1333,7 @@ def preprocess_image(
     elif image.shape[0] < patch_size:
         image, _ = resize_to_height(image, patch_size)
 
-    pad_x, pad_y = get_paddings(image, patch_size)
+    pad_x, pad_y = get_paddings(image, patch_size, overlap)
     padded_img = pad_image(image, pad_x, pad_y, pad_value=255)
 
     return padded_img, pad_x, pad_y
@@ -910,8 +1362,18 @@ def extract_line(image: npt.NDArray, mask: npt.NDArray, bbox_h: int, k_factor: f
     return masked_line
 
 
-def get_line_image(image: npt.NDArray, mask: npt.NDArray, bbox_h: int, bbox_tolerance: float = 2.5, k_factor: float = 1.2):
+def get_line_image(
+        image: npt.NDArray,
+        mask: npt.NDArray,
+        bbox_h: int,
+        bbox_tolerance: float = 2.5,
+        k_factor: float = 1.2,
+        k_search: KFactorSearch = KFactorSearch.Iterative
+):
     try:
+        if k_search == KFactorSearch.Bisect:
+            return search_line_image(image, mask, bbox_h, bbox_tolerance, k_factor)
+
         tmp_k = k_factor
         line_img = extract_line(image, mask, bbox_h, k_factor=tmp_k)
         
@@ -934,6 +1396,142 @@ def get_line_image(image: npt.NDArray, mask: npt.NDArray, bbox_h: int, bbox_tole
         fallback_img = np.zeros((bbox_h, bbox_h * 2, 3), dtype=np.uint8)
         return fallback_img, k_factor
 
+
+def get_dilation_kernel_size(bbox_h: int, k_factor: float) -> Tuple[int, int]:
+    """
+    (width, height) of the dilation kernel that extract_line uses for k_factor.
+    """
+    k_size = int(bbox_h * k_factor)
+    return k_size, int(k_size * k_factor)
+
+
+def get_max_line_height(mask: npt.NDArray, bbox_h: int, k_factor: float) -> int:
+    """
+    Upper bound for the height of the line image that extract_line returns: the rows of the dilated mask.
+    The line image can only be lower if the image itself has blank rows.
+    """
+    _, y, _, h = cv2.boundingRect(mask)
+
+    if h == 0:
+        return 0
+
+    _, kernel_h = get_dilation_kernel_size(bbox_h, k_factor)
+    anchor = kernel_h // 2
+    top = max(0, y - (kernel_h - 1 - anchor))
+    bottom = min(mask.shape[0], y + h + anchor)
+
+    return bottom - top
+
+
+def search_line_image(image: npt.NDArray, mask: npt.NDArray, bbox_h: int, bbox_tolerance: float, k_factor: float):
+    """
+    Finds the same line image and adapted k_factor as the iterative loop in get_line_image with fewer extractions.
+    The height of the line image only grows with k_factor, so the first fitting k_factor of the sequence
+    k_factor, k_factor - 0.1, ... is found by a bisection. The upper bound from get_max_line_height gives a k_factor
+    that is known to fit, for regular line images the result is found with one or two extractions.
+    """
+    max_height = bbox_h * bbox_tolerance
+
+    # same sequence of k_factors (including the float rounding) and stop condition as the loop in get_line_image
+    candidates = [k_factor]
+    stop_k = None
+    tmp_k = k_factor
+
+    for _ in range(10):
+        tmp_k = tmp_k - 0.1
+        if tmp_k <= 0.1:
+            stop_k = tmp_k
+            break
+        candidates.append(tmp_k)
+
+    # extract_line fails for empty kernels, which only occur at the end of the sequence
+    n_valid = 0
+    while n_valid < len(candidates) and min(get_dilation_kernel_size(bbox_h, candidates[n_valid])) > 0:
+        n_valid += 1
+
+    if n_valid == 0:
+        return extract_line(image, mask, bbox_h, k_factor=candidates[0]), candidates[0]
+
+    line_images = {}
+
+    def fits(idx: int) -> bool:
+        if idx not in line_images:
+            line_images[idx] = extract_line(image, mask, bbox_h, k_factor=candidates[idx])
+        return line_images[idx].shape[0] <= max_height
+
+    high = n_valid - 1
+    for idx in range(n_valid):
+        if get_max_line_height(mask, bbox_h, candidates[idx]) <= max_height:
+            high = idx
+            break
+
+    if not fits(high):
+        if n_valid < len(candidates):
+            # the loop would reach an empty kernel, raises the same error
+            extract_line(image, mask, bbox_h, k_factor=candidates[n_valid])
+
+        return line_images[high], stop_k if stop_k is not None else candidates[high]
+
+    low = 0
+    if high > 0 and not fits(high - 1):
+        low = high
+
+    while low < high:
+        mid = (low + high) // 2
+        if fits(mid):
+            high = mid
+        else:
+            low = mid + 1
+
+    return line_images[low], candidates[low]
+
+
+def get_roi_bounds(image: npt.NDArray, bbox: Tuple[int, int, int, int], pad_x: int, pad_y: int) -> Tuple[int, int, int, int]:
+    """
+    (x_start, y_start, x_end, y_end) of a bbox padded by pad_x and pad_y, clipped to the image.
+    """
+    x, y, w, h = bbox
+    x_start = max(0, x - pad_x)
+    y_start = max(0, y - pad_y)
+    x_end = min(image.shape[1], x + w + pad_x)
+    y_end = min(image.shape[0], y + h + pad_y)
+
+    return x_start, y_start, x_end, y_end
+
+
+def get_line_roi(image: npt.NDArray, contour: npt.NDArray, k_factor: float) -> Tuple[npt.NDArray, npt.NDArray, int]:
+    """
+    Crops the region around a line contour that the dilation in extract_line can reach, i.e. the bounding box
+    padded by the kernel size for k_factor, and draws the contour into a mask of that size.
+    Returns the image region (a view), the mask and the bbox height of the contour.
+    """
+    bbox = cv2.boundingRect(contour)
+    h = bbox[3]
+    k_size = max(0, int(h * k_factor))
+    x_start, y_start, x_end, y_end = get_roi_bounds(image, bbox, k_size, max(0, int(k_size * k_factor)))
+
+    roi_mask = np.zeros((y_end - y_start, x_end - x_start), dtype=np.uint8)
+    cv2.drawContours(roi_mask, [contour], -1, (255, 255, 255), -1, offset=(-x_start, -y_start))
+
+    return crop_image(image, x_start, y_start, x_end, y_end), roi_mask, h
+
+
+def get_line_image_from_contour(
+        image: npt.NDArray,
+        contour: npt.NDArray,
+        bbox_tolerance: float = 2.5,
+        k_factor: float = 1.2,
+        k_search: KFactorSearch = KFactorSearch.Iterative
+):
+    """
+    Same result as get_line_image on a full page mask of the contour, but only works on the region of the page
+    around the contour. The retries in get_line_image only lower k_factor, so the padding for k_factor is enough.
+    """
+    roi_image, roi_mask, bbox_h = get_line_roi(image, contour, k_factor)
+
+    return get_line_image(roi_image, roi_mask, bbox_h, bbox_tolerance=bbox_tolerance, k_factor=k_factor, k_search=k_search)
+
+
 # TODO: check if this is the same normalization applied during training
 def normalize(image: npt.NDArray) -> npt.NDArray:
     image = image.astype(np.float32)
@@ -941,9 +1539,12 @@ def normalize(image: npt.NDArray) -> npt.NDArray:
     return image
 
 
-def binarize(
+def binarize_gray(
         img: npt.NDArray, adaptive: bool = True, block_size: int = 51, c: int = 13
 ) -> npt.NDArray:
+    """
+    binarize with a single channel result.
+    """
     line_img = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
 
     if adaptive:
@@ -959,9 +1560,85 @@ def binarize(
     else:
         _, bw = cv2.threshold(line_img, 120, 255, cv2.THRESH_BINARY)
 
+    return bw
+
+
+def binarize(
+        img: npt.NDArray, adaptive: bool = True, block_size: int = 51, c: int = 13
+) -> npt.NDArray:
+    bw = binarize_gray(img, adaptive, block_size, c)
     bw = cv2.cvtColor(bw, cv2.COLOR_GRAY2RGB)
     return bw
 
+
+def get_ink_ratio(binarized: npt.NDArray) -> npt.NDArray:
+    """
+    Share of the black pixels over the last two axes of a single channel binarized image, e.g. of every tile of
+    get_tile_view.
+    """
+    pixels = binarized.shape[-2] * binarized.shape[-1]
+    return 1.0 - np.count_nonzero(binarized, axis=(-2, -1)) / pixels
+
+
+def estimate_line_height(image: npt.NDArray, max_size: int = 1024, strip_width: int = 128) -> float:
+    """
+    Estimates the distance between neighbouring text lines of a page in pixels, or returns 0.0 if the page has no
+    regular lines. The page is binarized at max_size, the period of the lines is the first peak of the
+    autocorrelation of the ink per row. The rows are counted in vertical strips of strip_width, so that a skewed
+    page doesn't smear the lines of the profile into each other.
+    """
+    scale = min(1.0, max_size / max(image.shape[:2]))
+    if scale < 1.0:
+        image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR)
+
+    ink = binarize_gray(image, block_size=15) == 0
+    strip_starts = np.arange(0, ink.shape[1], strip_width)
+    profiles = np.add.reduceat(ink, strip_starts, axis=1).T.astype(np.float64)
+    profiles -= profiles.mean(axis=1, keepdims=True)
+
+    height = ink.shape[0]
+    spectrum = np.fft.rfft(profiles, n=2 * height, axis=1)
+    correlation = np.fft.irfft(np.abs(spectrum) ** 2, axis=1).sum(axis=0)[:height // 2]
+
+    # the period is the highest peak after the correlation of the line with itself has dropped below zero
+    negative = np.flatnonzero(correlation < 0)
+    if len(negative) == 0:
+        return 0.0
+
+    lag = negative[0] + int(np.argmax(correlation[negative[0]:]))
+    if correlation[lag] <= 0:
+        return 0.0
+
+    return lag / scale
+
+
+def get_tile_view(padded_img: npt.NDArray, patch_size: int = 512, overlap: int = 0) -> npt.NDArray:
+    """
+    The patch_size tiles of a padded single channel image as a (y_steps, x_steps, patch_size, patch_size) view,
+    without copying any pixels. Neighbouring tiles share overlap pixels, see get_tile_origins.
+    """
+    stride = patch_size - overlap
+    windows = np.lib.stride_tricks.sliding_window_view(padded_img, (patch_size, patch_size))
+
+    return windows[::stride, ::stride]
+
+
+def normalize_tiles(tile_view: npt.NDArray, out: npt.NDArray | None = None) -> npt.NDArray:
+    """
+    Writes the tiles of get_tile_view as the normalized (N, 3, H, W) float32 model input into out, which is
+    allocated if it is None. The channels are copies of the single binarized channel, as in normalize(binarize(x)).
+    """
+    y_steps, x_steps, height, width = tile_view.shape
+    if out is None:
+        out = np.empty((y_steps * x_steps, 3, height, width), dtype=np.float32)
+
+    np.divide(
+        tile_view[:, :, None], 255.0, out=out.reshape(y_steps, x_steps, 3, height, width), dtype=np.float32
+    )
+
+    return out
+
+
 def pad_to_width(img: np.array, target_width: int, target_height: int, padding: str) -> np.array:
     _, width, channels = img.shape
     tmp_img, ratio = resize_to_width(img, target_width)
@@ -1135,81 +1812,109 @@ def get_global_center(slice_image: npt.NDArray, start_x: int, bbox_y: int):
     return global_x, global_y, bbox_h
 
 
-def apply_global_tps(image: npt.NDArray, line_mask: npt.NDArray, line_data: List):
+def get_global_tps_maps(height: int, width: int, line_data: List, tolerance: float = 0.01) -> Tuple[npt.NDArray, npt.NDArray]:
+    """
+    The remap maps of apply_global_tps for a page of the given size.
+    """
     best_idx = get_global_tps_line(line_data)
     output_pts = line_data[best_idx]["output_pts"]
     input_pts = line_data[best_idx]["input_pts"]
 
     assert input_pts is not None and output_pts is not None
 
-    warped_img = run_tps(image, output_pts, input_pts)
-    warped_mask = run_tps(line_mask, output_pts, input_pts)
+    return get_tps_maps(height, width, output_pts, input_pts, tolerance=tolerance)
 
-    return warped_img, warped_mask
 
+def chain_page_maps(
+        rot_matrix: npt.NDArray,
+        map_x: npt.NDArray,
+        map_y: npt.NDArray,
+        dew_rot_matrix: npt.NDArray
+) -> Tuple[npt.NDArray, npt.NDArray]:
+    """
+    Remap maps from the original page straight to the page that is deskewed with rot_matrix, dewarped with the maps
+    and deskewed again with dew_rot_matrix, so the page image is resampled once instead of three times.
+    """
+    if not np.allclose(dew_rot_matrix, np.eye(2, 3)):
+        # pixels rotated in from outside the dewarped page point far outside the original page
+        border = -10.0 * max(map_x.shape)
+        height, width = map_x.shape[:2]
+        map_x = cv2.warpAffine(map_x, dew_rot_matrix, (width, height), flags=cv2.INTER_LINEAR, borderValue=border)
+        map_y = cv2.warpAffine(map_y, dew_rot_matrix, (width, height), flags=cv2.INTER_LINEAR, borderValue=border)
 
-def check_line_tps(image: npt.NDArray, contour: npt.NDArray, slice_width: int = 40):
+    points = cv2.transform(np.dstack([map_x, map_y]), cv2.invertAffineTransform(rot_matrix))
 
-    mask = np.zeros(image.shape, dtype=np.uint8)
-    x, y, w, h = cv2.boundingRect(contour)
+    return points[..., 0], points[..., 1]
+
+
+def apply_global_tps(image: npt.NDArray, line_mask: npt.NDArray, line_data: List, tolerance: float = 0.01):
+    """
+    Dewarps the page with the points of the most representative curved line. With a tolerance > 0 the spline is
+    evaluated on a coarse grid (see get_tps_maps) and the image is warped with cv2.remap, tolerance = 0 evaluates
+    the spline for every pixel.
+    """
+    if tolerance > 0:
+        map_x, map_y = get_global_tps_maps(image.shape[0], image.shape[1], line_data, tolerance)
+        return remap_with_mask(image, line_mask, map_x, map_y)
+
+    best_idx = get_global_tps_line(line_data)
+    output_pts = line_data[best_idx]["output_pts"]
+    input_pts = line_data[best_idx]["input_pts"]
 
-    cv2.drawContours(mask, [contour], contourIdx=0, color=(255, 255, 255), thickness=-1)
+    assert input_pts is not None and output_pts is not None
 
-    slice1_start_x = x
-    slice1_end_x = x+slice_width
+    warped_img = run_tps(image, output_pts, input_pts)
+    warped_mask = run_tps(line_mask, output_pts, input_pts)
 
-    slice2_start_x = x+w//4-slice_width
-    slice2_end_x = x+w//4
+    return warped_img, warped_mask
 
-    slice3_start_x = x+w//2
-    slice3_end_x = x+w//2+slice_width
 
-    slice4_start_x = x+w//2+w//4
-    slice4_end_x = x+w//2+(w//4)+slice_width
+def get_tps_slices(x: int, w: int, slice_width: int) -> List[Tuple[int, int]]:
+    """
+    (start_x, end_x) of the five slices along a line bbox from left to right in which check_line_tps samples the line center.
+    """
+    return [
+        (x, x + slice_width),
+        (x + w // 4 - slice_width, x + w // 4),
+        (x + w // 2, x + w // 2 + slice_width),
+        (x + w // 2 + w // 4, x + w // 2 + w // 4 + slice_width),
+        (x + w - slice_width, x + w)
+    ]
 
-    slice5_start_x = x+w-slice_width
-    slice5_end_x = x+w
 
-    # define slices along the bbox from left to right
-    slice_1 = mask[y:y+h, slice1_start_x:slice1_end_x, 0]
-    slice_2 = mask[y:y+h, slice2_start_x:slice2_end_x, 0]
-    slice_3 = mask[y:y+h, slice3_start_x:slice3_end_x, 0]
-    slice_4 = mask[y:y+h, slice4_start_x:slice4_end_x, 0]
-    slice_5 = mask[y:y+h, slice5_start_x:slice5_end_x, 0]
+def check_line_tps(image: npt.NDArray, contour: npt.NDArray, slice_width: int = 40):
+    """
+    Samples the center of the line in five slices along its bbox and reports whether the line is curved enough to be
+    dewarped. Only the region covered by the slices is drawn, the slices are resolved against the full image width
+    so that they are cut exactly like the slices of a page-sized mask.
+    """
+    x, y, w, h = cv2.boundingRect(contour)
+    slice_starts = [start for start, _ in get_tps_slices(x, w, slice_width)]
+    slices = [slice(start, end).indices(image.shape[1])[:2] for start, end in get_tps_slices(x, w, slice_width)]
+    used_slices = [(start, end) for start, end in slices if end > start]
 
-    slice1_center_x, slice1_center_y, bbox1_h = get_global_center(slice_1, slice1_start_x, y)
-    slice2_center_x, slice2_center_y, bbox2_h = get_global_center(slice_2, slice2_start_x, y)
-    slice3_center_x, slice3_center_y, bbox3_h = get_global_center(slice_3, slice3_start_x, y)
-    slice4_center_x, slice4_center_y, bbox4_h = get_global_center(slice_4, slice4_start_x, y)
-    slice5_center_x, slice5_center_y, bbox5_h = get_global_center(slice_5, slice5_start_x, y)
+    roi_start = min((start for start, _ in used_slices), default=x)
+    roi_end = max((end for _, end in used_slices), default=x)
 
-    all_bboxes = [bbox1_h, bbox2_h, bbox3_h, bbox4_h, bbox5_h]
-    all_centers = [slice1_center_y, slice2_center_y, slice3_center_y, slice4_center_y, slice5_center_y]
+    mask = np.zeros((h, roi_end - roi_start), dtype=np.uint8)
+    cv2.drawContours(mask, [contour], contourIdx=0, color=255, thickness=-1, offset=(-roi_start, -y))
 
-    min_value = min(all_centers)
-    max_value = max(all_centers)
-    max_ydelta = max_value-min_value
+    centers = []
+    for slice_start, (start, end) in zip(slice_starts, slices):
+        slice_mask = mask[:, start - roi_start:end - roi_start] if end > start else mask[:, :0]
+        centers.append(get_global_center(slice_mask, slice_start, y))
+
+    all_centers_x, all_centers, all_bboxes = (list(x) for x in zip(*centers))
+
+    max_ydelta = max(all_centers) - min(all_centers)
     mean_bbox_h = np.mean(all_bboxes)
     mean_center_y = np.mean(all_centers)
 
     if max_ydelta > mean_bbox_h:
         target_y = round(mean_center_y)
 
-        input_pts = [
-            [slice1_center_y, slice1_center_x],
-            [slice2_center_y, slice2_center_x],
-            [slice3_center_y, slice3_center_x],
-            [slice4_center_y, slice4_center_x],
-            [slice5_center_y, slice5_center_x]
-        ]
-
-        output_pts = [
-            [target_y, slice1_center_x],
-            [target_y, slice2_center_x],
-            [target_y, slice3_center_x],
-            [target_y, slice4_center_x],
-            [target_y, slice5_center_x]
-        ]
+        input_pts = [[center_y, center_x] for center_x, center_y in zip(all_centers_x, all_centers)]
+        output_pts = [[target_y, center_x] for center_x in all_centers_x]
 
         return True, input_pts, output_pts, max_ydelta
     else:
@@ -1217,11 +1922,13 @@ def check_line_tps(image: npt.NDArray, contour: npt.NDArray, slice_width: int =
 
 
 def check_for_tps(image: npt.NDArray, line_contours: List[npt.NDArray]):
+    """
+    Runs check_line_tps for every contour. The line data keeps the input and output points of the curved lines,
+    so the dewarping (apply_global_tps, get_line_images_via_local_tps) uses them without sampling the lines again.
+    Returns the ratio of curved lines and the line data.
+    """
     line_data = []
-    for _, line_cnt in enumerate(line_contours):
-
-        _, y, _, _ = cv2.boundingRect(line_cnt)
-        # TODO: store input and output points to avoid running that step twice
+    for line_cnt in line_contours:
         tps_status, input_pts, output_pts, max_yd = check_line_tps(image, line_cnt)
 
         line = {
@@ -1239,18 +1946,22 @@ def check_for_tps(image: npt.NDArray, line_contours: List[npt.NDArray]):
 
     return ratio, line_data
 
-def extract_line_images(image: npt.NDArray, line_data: List[Line], default_k: float = 1.7, bbox_tolerance: float = 3):
+def extract_line_images(
+        image: npt.NDArray,
+        line_data: List[Line],
+        default_k: float = 1.7,
+        bbox_tolerance: float = 3,
+        k_search: KFactorSearch = KFactorSearch.Iterative
+):
     default_k_factor = default_k
     current_k = default_k_factor
 
     line_images = []
 
     for _, line in enumerate(line_data):
-        _, _, _, h = cv2.boundingRect(line.contour)
-        tmp_mask = np.zeros((image.shape[0], image.shape[1]), dtype=np.uint8)
-        cv2.drawContours(tmp_mask, [line.contour], -1, (255, 255, 255), -1)
-
-        line_img, adapted_k = get_line_image(image, tmp_mask, h, bbox_tolerance=bbox_tolerance, k_factor=current_k)
+        line_img, adapted_k = get_line_image_from_contour(
+            image, line.contour, bbox_tolerance=bbox_tolerance, k_factor=current_k, k_search=k_search
+        )
         line_images.append(line_img)
 
         if current_k != adapted_k:
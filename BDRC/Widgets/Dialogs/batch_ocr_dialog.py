@@ -12,6 +12,7 @@ from PySide6.QtWidgets import (
     QComboBox
 )
 
+from BDRC.Cache import OCRResultCache
 from BDRC.Data import OCRData, OCRModel, OCRSettings, OCRSample, OCResult, Encoding
 from BDRC.Inference import OCRPipeline
 from BDRC.Runner import OCRBatchRunner
@@ -29,6 +30,7 @@ class BatchOCRDialog(QDialog):
         ocr_settings: OCRSettings,
         threadpool: QThreadPool,
         current_model: OCRModel = None,
+        cache: OCRResultCache | None = None,
     ):
         super().__init__()
         self.setObjectName("BatchOCRDialog")
@@ -41,6 +43,7 @@ class BatchOCRDialog(QDialog):
         self.ocr_settings = ocr_settings
         self.threadpool = threadpool
         self.current_model = current_model
+        self.cache = cache
         
         self.setWindowTitle("Batch Process")
         self.setMinimumWidth(600)
@@ -239,10 +242,12 @@ class BatchOCRDialog(QDialog):
             ocr_pipeline=self.pipeline,
             mode=self.ocr_settings.line_mode,
             dewarp=self.ocr_settings.dewarping,
+            tps_mode=self.ocr_settings.tps_mode,
             merge_lines=self.ocr_settings.merge_lines,
             k_factor=self.ocr_settings.k_factor,
             bbox_tolerance=self.ocr_settings.bbox_tolerance,
-            target_encoding=self.ocr_settings.output_encoding
+            target_encoding=self.ocr_settings.output_encoding,
+            cache=self.cache
         )
         
         # Connect signals
@@ -255,7 +260,8 @@ class BatchOCRDialog(QDialog):
         self.threadpool.start(self.runner)
 
     def handle_sample(self, sample: OCRSample):
-        self.progress_bar.setValue(sample.cnt + 1)  # Add 1 since cnt is 0-based
+        # pages can complete out of order in the staged pipeline, so count them instead of using sample.cnt
+        self.progress_bar.setValue(self.progress_bar.value() + 1)
         self.status.setText(f"Processing {sample.name}")
 
     def handle_error(self, error_msg: str):
@@ -1,6 +1,7 @@
 from PySide6.QtCore import Qt, Signal, QThreadPool
 from PySide6.QtWidgets import QProgressDialog, QPushButton
 
+from BDRC.Cache import OCRResultCache
 from BDRC.Data import OCRData, OCRSettings, OCResult
 from BDRC.Inference import OCRPipeline
 from BDRC.Runner import OCRunner
@@ -14,6 +15,7 @@ class OCRDialog(QProgressDialog):
         settings: OCRSettings,
         data: OCRData,
         pool: QThreadPool,
+        cache: OCRResultCache | None = None,
     ):
         super(OCRDialog, self).__init__()
         self.setObjectName("OCRDialog")
@@ -26,6 +28,7 @@ class OCRDialog(QProgressDialog):
         self.settings = settings
         self.data = data
         self.pool = pool
+        self.cache = cache
         self.result = None
 
         # build layout
@@ -58,7 +61,7 @@ class OCRDialog(QProgressDialog):
         self.show()
 
     def exec(self):
-        runner = OCRunner(self.data, self.pipeline, self.settings)
+        runner = OCRunner(self.data, self.pipeline, self.settings, self.cache)
         runner.signals.error.connect(self.handle_error)
         runner.signals.ocr_result.connect(self.handle_ocr_result)
         runner.signals.finished.connect(self.thread_complete)
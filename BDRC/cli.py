@@ -0,0 +1,309 @@
+"""
+Headless command line entry point for batch OCR, e.g.:
+
+    python -m BDRC.cli ocr scans/ "more/*.tif" volume.pdf --out results --format xml
+    python -m BDRC.cli serve --port 8765 --workers 2
+
+The pipeline is configured from the same settings files as the app (see SettingsModel), command line options
+override single values. This module must not import Qt widgets, it is meant to run on machines without a display.
+"""
+
+import os
+import sys
+import time
+import argparse
+import multiprocessing
+from dataclasses import replace
+from glob import glob, has_magic
+from typing import List
+
+from platformdirs import user_data_dir
+
+from BDRC.Cache import CachedExecutor
+from BDRC.Data import OCResult, LineMode, PipelineSettings
+from BDRC.Exporter import PageXMLExporter, JsonExporter, TextExporter
+from BDRC.Inference import OCRPipeline
+from BDRC.MVVM.model import SettingsModel
+from BDRC.ProcessPool import OCRProcessPool
+from BDRC.server import OCRService, serve
+from BDRC.Stages import StagedOCRPipeline
+from BDRC.Trace import export_traces
+from BDRC.Utils import create_dir, get_filename, get_platform, import_local_models
+from BDRC.utils.pdf_extract import extract_images_from_pdf
+from Config import ENCODINGS, LINE_MODES, K_FACTOR_SEARCH, TPS_MODE, CTC_DECODING
+
+APP_NAME = "BDRC_OCR"
+APP_AUTHOR = "BDRC"
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")
+
+EXPORTERS = {
+    "text": TextExporter,
+    "xml": PageXMLExporter,
+    "json": JsonExporter
+}
+
+
+def collect_images(inputs: List[str], tmp_dir: str) -> List[str]:
+    """
+    Expands image directories, glob patterns and PDF files into a flat list of image files.
+    Embedded page images of PDFs are extracted into tmp_dir.
+    """
+    image_paths = []
+
+    for entry in inputs:
+        if os.path.isdir(entry):
+            candidates = sorted(os.path.join(entry, x) for x in os.listdir(entry))
+        elif has_magic(entry):
+            candidates = sorted(glob(entry))
+        else:
+            candidates = [entry]
+
+        for candidate in candidates:
+            if candidate.lower().endswith(".pdf"):
+                pdf_dir = os.path.join(tmp_dir, get_filename(candidate))
+                pdf_images, _ = extract_images_from_pdf(candidate, pdf_dir)
+                image_paths.extend(pdf_images)
+            elif candidate.lower().endswith(IMAGE_EXTENSIONS):
+                image_paths.append(candidate)
+            elif candidate == entry:
+                print(f"Skipping unsupported input: {entry}", file=sys.stderr)
+
+    return image_paths
+
+
+def add_pipeline_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--user-dir", default=user_data_dir(APP_NAME, APP_AUTHOR), help="directory holding app_settings.json and ocr_settings.json")
+    parser.add_argument("--models-dir", default=None, help="directory with OCR models, overrides the configured model path")
+    parser.add_argument("--model", default=None, help="name of the OCR model to use, defaults to the first available model")
+    parser.add_argument("--line-mode", choices=list(LINE_MODES.keys()), default=None)
+    parser.add_argument("--encoding", choices=list(ENCODINGS.keys()), default=None)
+    parser.add_argument("--k-factor", type=float, default=None)
+    parser.add_argument("--bbox-tolerance", type=float, default=None)
+    parser.add_argument(
+        "--k-search", choices=list(K_FACTOR_SEARCH.keys()), default="iterative",
+        help="how the dilation of each line is reduced to fit --bbox-tolerance, both give the same line images"
+    )
+    parser.add_argument("--dewarp", action=argparse.BooleanOptionalAction, default=None)
+    parser.add_argument("--tps-mode", choices=list(TPS_MODE.keys()), default=None, help="dewarp the whole page or only the curved lines")
+    parser.add_argument(
+        "--tps-tolerance", type=float, default=0.01,
+        help="maximum error in pixels of the interpolated dewarping maps, 0 evaluates the spline for every pixel"
+    )
+    parser.add_argument("--merge-lines", action=argparse.BooleanOptionalAction, default=None)
+    parser.add_argument(
+        "--ctc-decoding", choices=list(CTC_DECODING.keys()), default=None,
+        help="greedy decoding is much faster than the beam search, defaults to the setting of the OCR model"
+    )
+    parser.add_argument("--threads", type=int, default=0, help="onnxruntime intra-op threads (per worker), 0 uses all cores")
+    parser.add_argument("--line-batch-size", type=int, default=64)
+    parser.add_argument("--tile-batch-size", type=int, default=None, help="max. detection tiles per model call, 0 runs all tiles of a page at once")
+    parser.add_argument("--tile-overlap", type=int, default=None, help="pixels shared by neighbouring detection tiles, their predictions are blended")
+    parser.add_argument("--skip-background-tiles", action=argparse.BooleanOptionalAction, default=None, help="don't run detection tiles without ink")
+    parser.add_argument("--background-ink-ratio", type=float, default=None, help="max. share of ink pixels of a detection tile that is skipped as background")
+    parser.add_argument("--detection-scale", type=float, default=None, help="downscale the pages by this factor for the line detection")
+    parser.add_argument("--target-line-height", type=int, default=None, help="downscale the pages for the line detection so that their lines are about this many pixels apart")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m BDRC.cli", description="BDRC Tibetan OCR")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ocr = commands.add_parser("ocr", help="run OCR on images, image directories, glob patterns or PDFs")
+    ocr.add_argument("inputs", nargs="+", help="image files, directories, glob patterns or PDF files")
+    ocr.add_argument("--out", required=True, help="output directory")
+    ocr.add_argument("--format", choices=list(EXPORTERS.keys()), default="text", help="export format")
+    ocr.add_argument("--workers", type=int, default=0, help="number of worker processes, 0 runs a threaded pipeline in this process")
+    ocr.add_argument("--no-cache", action="store_true", help="ignore and don't update the OCR result cache in the user directory")
+    ocr.add_argument("--trace", default=None, metavar="FILE", help="write per-page stage timings and a summary as JSON to FILE")
+    ocr.add_argument("--queue-size", type=int, default=PipelineSettings.queue_size, help="pages buffered between the stages of the threaded pipeline")
+    ocr.add_argument("--prefetch-workers", type=int, default=PipelineSettings.prefetch_workers, help="threads decoding the page images")
+    ocr.add_argument("--detection-workers", type=int, default=PipelineSettings.detection_workers, help="threads running the line detection")
+    ocr.add_argument("--geometry-workers", type=int, default=PipelineSettings.geometry_workers, help="threads extracting and dewarping the lines")
+    ocr.add_argument("--recognition-workers", type=int, default=PipelineSettings.recognition_workers, help="threads running the line recognition")
+    add_pipeline_arguments(ocr)
+
+    serve = commands.add_parser("serve", help="run a local OCR service with warm models")
+    serve.add_argument("--host", default="127.0.0.1", help="interface to bind to, the service is meant for local use")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--workers", type=int, default=1, help="number of pipelines that process requests concurrently")
+    serve.add_argument("--queue-size", type=int, default=8, help="requests waiting for a pipeline before new ones are rejected with 503")
+    add_pipeline_arguments(serve)
+
+    return parser
+
+
+def load_pipeline_config(args: argparse.Namespace):
+    """
+    Resolves the OCR model, line model config and run_ocr arguments from the settings files and the command line.
+    Returns None if no usable OCR model was found.
+    """
+    execution_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    create_dir(args.user_dir)
+    settings = SettingsModel(args.user_dir, execution_dir)
+    ocr_settings = settings.ocr_settings
+
+    ocr_models = import_local_models(args.models_dir) if args.models_dir is not None else settings.ocr_models
+
+    if len(ocr_models) == 0:
+        print("No OCR models found, use --models-dir to point to a directory of OCR models", file=sys.stderr)
+        return None
+
+    if args.model is not None:
+        selected = [x for x in ocr_models if x.name == args.model]
+        if len(selected) == 0:
+            print(f"Unknown OCR model '{args.model}', available: {', '.join(x.name for x in ocr_models)}", file=sys.stderr)
+            return None
+        ocr_model = selected[0]
+    else:
+        ocr_model = ocr_models[0]
+
+    if args.ctc_decoding is not None:
+        ocr_model = replace(ocr_model, config=replace(ocr_model.config, ctc_decoding=CTC_DECODING[args.ctc_decoding]))
+
+    line_mode = LINE_MODES[args.line_mode] if args.line_mode is not None else ocr_settings.line_mode
+    line_config = settings.line_model_config if line_mode == LineMode.Line else settings.layout_model_config
+    detection_settings = {
+        "tile_batch_size": args.tile_batch_size,
+        "tile_overlap": args.tile_overlap,
+        "skip_background_tiles": args.skip_background_tiles,
+        "background_ink_ratio": args.background_ink_ratio,
+        "detection_scale": args.detection_scale,
+        "target_line_height": args.target_line_height
+    }
+    line_config = replace(line_config, **{k: v for k, v in detection_settings.items() if v is not None})
+    target_encoding = ENCODINGS[args.encoding] if args.encoding is not None else ocr_settings.output_encoding
+
+    ocr_args = {
+        "k_factor": args.k_factor if args.k_factor is not None else ocr_settings.k_factor,
+        "bbox_tolerance": args.bbox_tolerance if args.bbox_tolerance is not None else ocr_settings.bbox_tolerance,
+        "merge_lines": args.merge_lines if args.merge_lines is not None else ocr_settings.merge_lines,
+        "use_tps": args.dewarp if args.dewarp is not None else ocr_settings.dewarping,
+        "tps_mode": TPS_MODE[args.tps_mode] if args.tps_mode is not None else ocr_settings.tps_mode,
+        "tps_tolerance": args.tps_tolerance,
+        "k_search": K_FACTOR_SEARCH[args.k_search],
+        "target_encoding": target_encoding
+    }
+
+    return settings, ocr_model, line_config, ocr_args
+
+
+def run_ocr_command(args: argparse.Namespace) -> int:
+    config = load_pipeline_config(args)
+
+    if config is None:
+        return 2
+
+    settings, ocr_model, line_config, ocr_args = config
+    image_paths = collect_images(args.inputs, settings.tmp_dir)
+
+    if len(image_paths) == 0:
+        print("No input images found", file=sys.stderr)
+        return 2
+
+    create_dir(args.out)
+    exporter = EXPORTERS[args.format](args.out)
+    platform = get_platform()
+
+    if args.workers > 0:
+        executor = OCRProcessPool(
+            platform,
+            ocr_model.config,
+            line_config,
+            workers=args.workers,
+            threads_per_worker=args.threads,
+            trace=args.trace is not None,
+            **ocr_args
+        )
+    else:
+        pipeline = OCRPipeline(platform, ocr_model.config, line_config, num_threads=args.threads, line_cache_size=0)
+        executor = StagedOCRPipeline(
+            pipeline,
+            PipelineSettings(
+                prefetch_workers=args.prefetch_workers,
+                detection_workers=args.detection_workers,
+                geometry_workers=args.geometry_workers,
+                recognition_workers=args.recognition_workers,
+                queue_size=args.queue_size,
+                line_batch_size=args.line_batch_size,
+                trace=args.trace is not None
+            ),
+            **ocr_args
+        )
+
+    # cached results carry no timings, so tracing always runs the full pipeline
+    if not args.no_cache and args.trace is None and settings.result_cache.enabled:
+        executor = CachedExecutor(executor, settings.result_cache, ocr_model.config, line_config, **ocr_args)
+
+    total = len(image_paths)
+    done = [0]
+    failed = []
+    traces = []
+
+    def on_result(idx: int, image_path: str, result: OCResult):
+        image_name = get_filename(image_path)
+        # the rotated mask has the size of the input image, the exporters only need the image dimensions
+        exporter.export_lines(result.mask, image_name, result.lines, result.text, angle=result.angle)
+        traces.append(result.trace)
+        done[0] += 1
+        print(f"[{done[0]}/{total}] {image_name}: {len(result.text)} lines", file=sys.stderr)
+
+    def on_error(idx: int, image_path: str, msg: str):
+        done[0] += 1
+        failed.append(image_path)
+        print(f"[{done[0]}/{total}] {get_filename(image_path)}: {msg}", file=sys.stderr)
+
+    pages = [(x, x) for x in image_paths]
+
+    start = time.perf_counter()
+
+    try:
+        executor.run(pages, on_result, on_error)
+    except KeyboardInterrupt:
+        executor.stop()
+        return 130
+
+    if args.trace is not None:
+        export_traces(args.trace, traces, wall_time=time.perf_counter() - start)
+
+    print(f"Processed {total - len(failed)} of {total} images, results written to {args.out}", file=sys.stderr)
+
+    return 1 if len(failed) > 0 else 0
+
+
+def run_serve_command(args: argparse.Namespace) -> int:
+    config = load_pipeline_config(args)
+
+    if config is None:
+        return 2
+
+    _, ocr_model, line_config, ocr_args = config
+    service = OCRService(
+        get_platform(),
+        ocr_model.config,
+        line_config,
+        workers=args.workers,
+        queue_size=args.queue_size,
+        num_threads=args.threads,
+        line_batch_size=args.line_batch_size,
+        **ocr_args
+    )
+    serve(service, args.host, args.port)
+
+    return 0
+
+
+def main(argv: List[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+
+    if args.command == "ocr":
+        return run_ocr_command(args)
+    elif args.command == "serve":
+        return run_serve_command(args)
+
+    return 2
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()  # lets frozen builds run the spawned OCR worker processes
+    sys.exit(main())
@@ -0,0 +1,355 @@
+"""
+Local OCR service that keeps the ONNX sessions of a pool of OCRPipelines warm between requests, e.g.:
+
+    python -m BDRC.cli serve --port 8765 --workers 2
+
+    curl --data-binary @page.jpg http://127.0.0.1:8765/ocr
+    curl -H "Content-Type: application/json" -d '{"images": ["<base64>", ...]}' http://127.0.0.1:8765/batch
+
+Endpoints:
+    GET  /health  status, model and queue state
+    POST /ocr     raw image bytes in the request body, returns the lines and text of the page
+    POST /batch   JSON object with a list of base64 encoded "images", returns one result per image
+
+Run parameters (k_factor, bbox_tolerance, merge_lines, dewarp, encoding) can be overridden per request via query
+parameters. Requests wait in a bounded queue for a free pipeline, once the queue is full the service answers
+with 503 and a Retry-After header instead of piling up work. Nothing is fetched from the network.
+"""
+
+import cv2
+import json
+import base64
+import logging
+import threading
+import numpy as np
+import numpy.typing as npt
+from queue import Queue
+from typing import List, Tuple
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from BDRC.Inference import OCRPipeline, LineBatchScheduler
+from BDRC.ProcessPool import get_threads_per_worker
+from BDRC.Data import (
+    OpStatus,
+    Encoding,
+    Line,
+    OCRLine,
+    Platform,
+    OCRModelConfig,
+    LineDetectionConfig,
+    LayoutDetectionConfig
+)
+from Config import ENCODINGS
+
+MAX_REQUEST_SIZE = 256 * 1024 * 1024
+
+
+class ServiceBusy(Exception):
+    pass
+
+
+class OCRService:
+    def __init__(
+            self,
+            platform: Platform,
+            ocr_config: OCRModelConfig,
+            line_config: LineDetectionConfig | LayoutDetectionConfig,
+            workers: int = 1,
+            queue_size: int = 8,
+            num_threads: int = 0,
+            line_batch_size: int = 64,
+            **ocr_args
+    ):
+        """
+        Loads one OCRPipeline per worker up front. At most workers + queue_size requests are accepted at a time,
+        num_threads = 0 splits the available cores between the pipelines.
+        The remaining keyword arguments are the default run_ocr arguments of every request.
+        """
+        self.ocr_config = ocr_config
+        self.workers = max(1, workers)
+        self.queue_size = max(0, queue_size)
+        self.line_batch_size = line_batch_size
+        self.ocr_args = ocr_args
+
+        num_threads = num_threads if num_threads > 0 else get_threads_per_worker(self.workers)
+
+        self._pipelines = Queue()
+        # requests rarely repeat an image and the pipelines don't share a line cache, so it is disabled
+        for _ in range(self.workers):
+            self._pipelines.put(OCRPipeline(platform, ocr_config, line_config, num_threads=num_threads, line_cache_size=0))
+
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_size)
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    def pending(self) -> int:
+        with self._lock:
+            return self._pending
+
+    def status(self) -> dict:
+        return {
+            "status": "ok",
+            "model": self.ocr_config.model_file,
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "pending": self.pending()
+        }
+
+    def _acquire(self) -> OCRPipeline:
+        if not self._slots.acquire(blocking=False):
+            raise ServiceBusy()
+
+        with self._lock:
+            self._pending += 1
+
+        return self._pipelines.get()
+
+    def _release(self, pipeline: OCRPipeline):
+        self._pipelines.put(pipeline)
+
+        with self._lock:
+            self._pending -= 1
+
+        self._slots.release()
+
+    def run_args(self, overrides: dict) -> dict:
+        args = dict(self.ocr_args)
+        args.update(overrides)
+        return args
+
+    def ocr(self, image: npt.NDArray, **overrides) -> dict:
+        """
+        Runs a single page on the next free pipeline, raises ServiceBusy if the request queue is full.
+        """
+        args = self.run_args(overrides)
+        pipeline = self._acquire()
+
+        try:
+            status, result = pipeline.run_ocr(image, **args)
+        finally:
+            self._release(pipeline)
+
+        if status != OpStatus.SUCCESS:
+            return build_error(result)
+
+        _, lines, ocr_lines, angle = result
+
+        return build_page_result(lines, ocr_lines, angle)
+
+    def batch(self, images: List[npt.NDArray | None], **overrides) -> List[dict]:
+        """
+        Runs all pages of a batch on one pipeline and recognizes their lines in shared batches across the pages.
+        Undecodable images (None) produce an error entry, the batch occupies a single request slot.
+        """
+        args = self.run_args(overrides)
+        target_encoding = args.pop("target_encoding", Encoding.Unicode)
+        results = [None] * len(images)
+        pipeline = self._acquire()
+
+        try:
+            scheduler = LineBatchScheduler(pipeline.ocr_inference, self.line_batch_size)
+            page_data = {}
+            completed = []
+
+            for idx, image in enumerate(images):
+                if image is None:
+                    results[idx] = build_error("Failed to decode image")
+                    continue
+
+                status, result = run_page_geometry(pipeline, image, args)
+
+                if status != OpStatus.SUCCESS:
+                    results[idx] = build_error(result)
+                    continue
+
+                _, lines, line_images, angle = result
+                page_data[idx] = (lines, angle)
+                completed.extend(scheduler.submit(idx, line_images))
+
+            completed.extend(scheduler.flush())
+
+            for idx, predictions in completed:
+                lines, angle = page_data[idx]
+                ocr_lines = pipeline.build_ocr_lines(predictions, lines, target_encoding)
+                results[idx] = build_page_result(lines, ocr_lines, angle)
+
+        finally:
+            self._release(pipeline)
+
+        return results
+
+
+def run_page_geometry(pipeline: OCRPipeline, image: npt.NDArray, args: dict):
+    try:
+        line_mask = pipeline.detect_lines(image)
+    except Exception as e:
+        return OpStatus.FAILED, f"Line detection failed: {str(e)}"
+
+    return pipeline.extract_lines(image, line_mask, **args)
+
+
+def build_error(msg: str) -> dict:
+    return {"status": "failed", "error": msg}
+
+
+def build_page_result(lines: List[Line], ocr_lines: List[OCRLine], angle: float) -> dict:
+    page_lines = []
+
+    for line, ocr_line in zip(lines, ocr_lines):
+        page_lines.append({
+            "id": str(line.guid),
+            "text": ocr_line.text,
+            "bbox": [int(line.bbox.x), int(line.bbox.y), int(line.bbox.w), int(line.bbox.h)],
+            "center": [int(line.center[0]), int(line.center[1])],
+            "contour": line.contour.reshape(-1, 2).tolist()
+        })
+
+    return {
+        "status": "success",
+        "angle": float(angle),
+        "encoding": ocr_lines[0].encoding.name.lower() if len(ocr_lines) > 0 else None,
+        "lines": page_lines,
+        "text": "\n".join(x.text for x in ocr_lines)
+    }
+
+
+def decode_image(data: bytes) -> npt.NDArray | None:
+    if len(data) == 0:
+        return None
+
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def parse_overrides(query: str) -> dict:
+    """
+    Maps the query parameters of a request onto run_ocr arguments, raises ValueError on invalid values.
+    """
+    params = {k: v[-1] for k, v in parse_qs(query).items()}
+    overrides = {}
+
+    def parse_bool(value: str) -> bool:
+        if value.lower() in ("1", "true", "yes"):
+            return True
+        if value.lower() in ("0", "false", "no"):
+            return False
+        raise ValueError(f"invalid boolean: {value}")
+
+    if "k_factor" in params:
+        overrides["k_factor"] = float(params["k_factor"])
+    if "bbox_tolerance" in params:
+        overrides["bbox_tolerance"] = float(params["bbox_tolerance"])
+    if "merge_lines" in params:
+        overrides["merge_lines"] = parse_bool(params["merge_lines"])
+    if "dewarp" in params:
+        overrides["use_tps"] = parse_bool(params["dewarp"])
+    if "encoding" in params:
+        if params["encoding"] not in ENCODINGS:
+            raise ValueError(f"unknown encoding: {params['encoding']}")
+        overrides["target_encoding"] = ENCODINGS[params["encoding"]]
+
+    return overrides
+
+
+class OCRRequestHandler(BaseHTTPRequestHandler):
+    server_version = "BDRC-OCR"
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def service(self) -> OCRService:
+        return self.server.service
+
+    def log_message(self, format, *args):
+        logging.info(f"{self.address_string()} {format % args}")
+
+    def send_json(self, code: int, payload, headers: List[Tuple[str, str]] | None = None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+
+        for key, value in headers or []:
+            self.send_header(key, value)
+
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self) -> bytes | None:
+        length = int(self.headers.get("Content-Length", 0))
+
+        if length > MAX_REQUEST_SIZE:
+            self.close_connection = True
+            self.send_json(413, build_error("Request too large"))
+            return None
+
+        return self.rfile.read(length)
+
+    def do_GET(self):
+        if urlparse(self.path).path == "/health":
+            self.send_json(200, self.service.status())
+        else:
+            self.send_json(404, build_error("Not found"))
+
+    def do_POST(self):
+        url = urlparse(self.path)
+
+        if url.path not in ("/ocr", "/batch"):
+            self.send_json(404, build_error("Not found"))
+            return
+
+        body = self.read_body()
+        if body is None:
+            return
+
+        try:
+            overrides = parse_overrides(url.query)
+        except ValueError as e:
+            self.send_json(400, build_error(f"Invalid parameter: {e}"))
+            return
+
+        try:
+            if url.path == "/ocr":
+                self.handle_ocr(body, overrides)
+            else:
+                self.handle_batch(body, overrides)
+        except ServiceBusy:
+            self.send_json(503, build_error("Service busy, retry later"), headers=[("Retry-After", "1")])
+        except Exception as e:
+            logging.error(f"OCR request failed: {e}")
+            self.send_json(500, build_error(f"OCR request failed: {e}"))
+
+    def handle_ocr(self, body: bytes, overrides: dict):
+        image = decode_image(body)
+
+        if image is None:
+            self.send_json(400, build_error("Failed to decode image"))
+            return
+
+        result = self.service.ocr(image, **overrides)
+        self.send_json(200 if result["status"] == "success" else 422, result)
+
+    def handle_batch(self, body: bytes, overrides: dict):
+        try:
+            request = json.loads(body)
+            images = [decode_image(base64.b64decode(x, validate=True)) for x in request["images"]]
+        except Exception as e:
+            self.send_json(400, build_error(f"Invalid batch request, expected {{\"images\": [<base64>, ...]}}: {e}"))
+            return
+
+        results = self.service.batch(images, **overrides)
+        self.send_json(200, {"results": results})
+
+
+def serve(service: OCRService, host: str = "127.0.0.1", port: int = 8765):
+    server = ThreadingHTTPServer((host, port), OCRRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+
+    print(f"Serving OCR on http://{host}:{server.server_port} with {service.workers} worker(s)")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
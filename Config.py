@@ -7,6 +7,8 @@ from BDRC.Data import (
     LineMerge, 
     LineSorting,
     TPSMode,
+    KFactorSearch,
+    CTCDecoding,
     CharsetEncoder,
     OCRArchitecture
 )
@@ -80,3 +82,13 @@ TPS_MODE = {
     "local": TPSMode.LOCAL,
     "global": TPSMode.GLOBAL
 }
+
+K_FACTOR_SEARCH = {
+    "iterative": KFactorSearch.Iterative,
+    "bisect": KFactorSearch.Bisect
+}
+
+CTC_DECODING = {
+    "greedy": CTCDecoding.Greedy,
+    "beam": CTCDecoding.BeamSearch
+}
@@ -0,0 +1,369 @@
+"""
+Benchmarks for the OCR hot paths, runs headless on CPU:
+
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --ocr-model OCRModels/Woodblock --output new.json --baseline results.json
+
+The line geometry benchmarks run on synthetic pages with ground truth line masks (see benchmarks/synthetic.py),
+or on the images in --images with line masks from the line model. Model benchmarks are skipped if a model can't be
+loaded (e.g. the git-lfs files in Models/ are not checked out). Every benchmark reports the median time of a round
+over all pages, pages/sec, lines/sec and the peak memory allocated during one extra, untimed round (measured with
+tracemalloc, so it covers Python and NumPy/OpenCV arrays but not the internal buffers of onnxruntime). The peak RSS
+of the whole process is only reported once for the run.
+With --baseline, the results are compared against a previous run and the exit code is 1 if any benchmark got slower
+than --max-regression.
+"""
+
+import os
+import sys
+import cv2
+import json
+import time
+import argparse
+import platform
+import statistics
+import tracemalloc
+import numpy as np
+import onnxruntime as ort
+from glob import glob
+from typing import Callable, List
+
+from BDRC.Data import KFactorSearch, LineDetectionConfig, LayoutDetectionConfig, TPSMode
+from BDRC.Inference import LineDetection, LayoutDetection, OCRInference, OCRPipeline, extract_page_lines
+from BDRC.Utils import (
+    DeferredWarp,
+    build_line_data,
+    build_line_geometry,
+    check_for_tps,
+    extract_line_images,
+    filter_contour_table,
+    get_platform,
+    read_ocr_model_config,
+    read_tiling_config,
+    sort_lines_by_threshold2
+)
+from benchmarks.synthetic import generate_pages, generate_line_image
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")
+
+
+def get_peak_rss_mb() -> float | None:
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def read_detection_config(model_dir: str, layout: bool) -> LineDetectionConfig | LayoutDetectionConfig:
+    with open(os.path.join(model_dir, "config.json"), encoding="utf-8") as f:
+        content = json.load(f)
+
+    model_file = os.path.join(model_dir, content["onnx-model"])
+
+    if layout:
+        return LayoutDetectionConfig(model_file, int(content["patch_size"]), content["classes"], **read_tiling_config(content))
+
+    return LineDetectionConfig(model_file, int(content["patch_size"]), **read_tiling_config(content))
+
+
+def time_rounds(fn: Callable, items: List, repeat: int, warmup: int) -> List[float]:
+    for _ in range(warmup):
+        for item in items:
+            fn(item)
+
+    rounds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            fn(item)
+        rounds.append(time.perf_counter() - start)
+
+    return rounds
+
+
+def measure_peak_alloc(fn: Callable, items: List) -> float:
+    """
+    Peak size in MB of the memory allocated by one round over the items, on top of what was allocated before.
+    """
+    tracemalloc.start()
+    try:
+        for item in items:
+            fn(item)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return peak / (1024 * 1024)
+
+
+def build_result(rounds: List[float], pages: int, lines: int, peak_alloc_mb: float) -> dict:
+    median = statistics.median(rounds)
+
+    return {
+        "status": "ok",
+        "rounds": rounds,
+        "median": median,
+        "min": min(rounds),
+        "pages": pages,
+        "lines": lines,
+        "pages_per_second": pages / median if pages > 0 and median > 0 else None,
+        "lines_per_second": lines / median if lines > 0 and median > 0 else None,
+        "peak_alloc_mb": peak_alloc_mb
+    }
+
+
+def prepare_geometry(pages: List) -> List[dict]:
+    """
+    Runs the line geometry once per page, as in extract_page_lines, to get the inputs of the individual steps.
+    """
+    prepared = []
+
+    for image, line_mask in pages:
+        rot_mask, line_table, angle, rot_matrix = build_line_geometry(line_mask)
+        filtered = filter_contour_table(line_table, rot_mask.shape[1]).contours
+        line_data = [build_line_data(x) for x in filtered]
+        sorted_lines, _ = sort_lines_by_threshold2(rot_mask, line_data, group_lines=True)
+
+        prepared.append({
+            "image": image,
+            "line_mask": line_mask,
+            "rot_mask": rot_mask,
+            "rot_matrix": rot_matrix if angle != 0 else None,
+            "line_table": line_table,
+            "contours": filtered,
+            "line_data": line_data,
+            "sorted_lines": sorted_lines
+        })
+
+    return prepared
+
+
+def load_pages(args: argparse.Namespace, line_detection: LineDetection | None) -> List:
+    if args.images is None:
+        return generate_pages(args.pages, args.height, args.width, args.lines, seed=args.seed)
+
+    image_files = sorted(x for x in glob(os.path.join(args.images, "*")) if x.lower().endswith(IMAGE_EXTENSIONS))
+    image_files = image_files[:args.pages]
+
+    if line_detection is None:
+        print("Real images need the line model to produce line masks", file=sys.stderr)
+        return []
+
+    pages = []
+    for image_file in image_files:
+        image = cv2.imread(image_file)
+        pages.append((image, line_detection.predict(image)))
+
+    return pages
+
+
+def run_benchmarks(args: argparse.Namespace) -> dict:
+    target_platform = get_platform()
+    results = {}
+
+    def skip(name: str, reason: str):
+        print(f"{name:<32} skipped: {reason}")
+        results[name] = {"status": "skipped", "reason": reason}
+
+    def bench(name: str, fn: Callable, items: List, pages: int, lines: int):
+        if args.only is not None and name not in args.only:
+            return
+
+        rounds = time_rounds(fn, items, args.repeat, args.warmup)
+        results[name] = build_result(rounds, pages, lines, measure_peak_alloc(fn, items))
+        result = results[name]
+        rates = []
+        if result["pages_per_second"] is not None:
+            rates.append(f"{result['pages_per_second']:.2f} pages/s")
+        if result["lines_per_second"] is not None:
+            rates.append(f"{result['lines_per_second']:.1f} lines/s")
+        print(f"{name:<32} {result['median'] * 1000:10.1f} ms  {result['peak_alloc_mb']:8.1f} MB  {', '.join(rates)}")
+
+    def load(name: str, loader: Callable):
+        try:
+            return loader()
+        except Exception as e:
+            skip(name, f"failed to load model: {e}")
+            return None
+
+    line_detection = load(
+        "LineDetection.predict",
+        lambda: LineDetection(target_platform, read_detection_config(args.line_model, False), num_threads=args.threads)
+    )
+    layout_detection = load(
+        "LayoutDetection.predict",
+        lambda: LayoutDetection(target_platform, read_detection_config(args.layout_model, True), num_threads=args.threads)
+    )
+    ocr_config = None
+    ocr_inference = None
+
+    if args.ocr_model is not None:
+        ocr_config = read_ocr_model_config(os.path.join(args.ocr_model, "model_config.json"))
+        ocr_inference = load("OCRInference.run", lambda: OCRInference(target_platform, ocr_config, num_threads=args.threads))
+    else:
+        skip("OCRInference.run", "no --ocr-model given")
+
+    pages = load_pages(args, line_detection)
+    if len(pages) == 0:
+        return results
+
+    images = [x[0] for x in pages]
+    prepared = prepare_geometry(pages)
+    n_pages = len(pages)
+    n_lines = sum(len(x["sorted_lines"]) for x in prepared)
+
+    if line_detection is not None:
+        bench("LineDetection.predict", line_detection.predict, images, n_pages, 0)
+    if layout_detection is not None:
+        bench("LayoutDetection.predict", layout_detection.predict, images, n_pages, 0)
+
+    def line_source(x: dict):
+        # a new DeferredWarp per call, the warped bands are cached after the first crop
+        return DeferredWarp(x["image"], matrix=x["rot_matrix"]) if x["rot_matrix"] is not None else x["image"]
+
+    bench("build_line_geometry", lambda x: build_line_geometry(x["line_mask"]), prepared, n_pages, n_lines)
+    bench(
+        "filter_contour_table",
+        lambda x: filter_contour_table(x["line_table"], x["rot_mask"].shape[1]),
+        prepared, n_pages, n_lines
+    )
+    bench(
+        "sort_lines_by_threshold2",
+        lambda x: sort_lines_by_threshold2(x["rot_mask"], x["line_data"], group_lines=True),
+        prepared, n_pages, n_lines
+    )
+    bench(
+        "extract_line_images",
+        lambda x: extract_line_images(line_source(x), x["sorted_lines"], args.k_factor, args.bbox_tolerance),
+        prepared, n_pages, n_lines
+    )
+    bench(
+        "extract_line_images[bisect]",
+        lambda x: extract_line_images(
+            line_source(x), x["sorted_lines"], args.k_factor, args.bbox_tolerance, k_search=KFactorSearch.Bisect
+        ),
+        prepared, n_pages, n_lines
+    )
+    bench("check_for_tps", lambda x: check_for_tps(x["rot_mask"], x["contours"]), prepared, n_pages, n_lines)
+    bench(
+        "extract_page_lines",
+        lambda x: extract_page_lines(x["image"], x["line_mask"], args.k_factor, args.bbox_tolerance),
+        prepared, n_pages, n_lines
+    )
+    bench(
+        "extract_page_lines[global_tps]",
+        lambda x: extract_page_lines(
+            x["image"], x["line_mask"], args.k_factor, args.bbox_tolerance, use_tps=True, tps_mode=TPSMode.GLOBAL
+        ),
+        prepared, n_pages, n_lines
+    )
+
+    if ocr_inference is not None:
+        line_images = [generate_line_image(seed=args.seed + idx) for idx in range(args.line_images)]
+        bench("OCRInference.run", ocr_inference.run, line_images, 0, len(line_images))
+        bench("OCRInference.run_batch", ocr_inference.run_batch, [line_images], 0, len(line_images))
+
+    if ocr_config is not None and line_detection is not None:
+        pipeline = OCRPipeline(
+            target_platform, ocr_config, line_detection.config, num_threads=args.threads, line_cache_size=0
+        )
+        bench(
+            "OCRPipeline.run_ocr",
+            lambda x: pipeline.run_ocr(x, k_factor=args.k_factor, bbox_tolerance=args.bbox_tolerance, use_tps=True),
+            images, n_pages, n_lines
+        )
+    else:
+        skip("OCRPipeline.run_ocr", "needs the line model and --ocr-model")
+
+    return results
+
+
+def compare(results: dict, baseline: dict, max_regression: float, min_delta: float) -> bool:
+    """
+    Prints the change of the median times against the baseline, returns False if any benchmark regressed.
+    Slowdowns below min_delta seconds are ignored, very short benchmarks are dominated by timer noise.
+    """
+    passed = True
+    print(f"\n{'benchmark':<32} {'baseline':>10} {'current':>10} {'change':>8}")
+
+    for name, result in results.items():
+        base = baseline.get("benchmarks", {}).get(name)
+
+        if result["status"] != "ok" or base is None or base.get("status") != "ok":
+            continue
+
+        change = result["median"] / base["median"] - 1.0
+        regressed = change > max_regression and result["median"] - base["median"] > min_delta
+        passed = passed and not regressed
+        marker = "  REGRESSION" if regressed else ""
+        print(f"{name:<32} {base['median'] * 1000:8.1f}ms {result['median'] * 1000:8.1f}ms {change * 100:+7.1f}%{marker}")
+
+    return passed
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run", description="BDRC OCR benchmarks")
+    parser.add_argument("--pages", type=int, default=6, help="number of synthetic pages or images")
+    parser.add_argument("--height", type=int, default=1400, help="synthetic page height")
+    parser.add_argument("--width", type=int, default=4200, help="synthetic page width")
+    parser.add_argument("--lines", type=int, default=7, help="lines per synthetic page")
+    parser.add_argument("--line-images", type=int, default=32, help="number of synthetic line images for OCRInference")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--images", default=None, help="directory of page images to use instead of synthetic pages")
+    parser.add_argument("--line-model", default=os.path.join(ROOT_DIR, "Models", "Lines"))
+    parser.add_argument("--layout-model", default=os.path.join(ROOT_DIR, "Models", "Layout"))
+    parser.add_argument("--ocr-model", default=None, help="OCR model directory containing model_config.json")
+    parser.add_argument("--k-factor", type=float, default=2.5)
+    parser.add_argument("--bbox-tolerance", type=float, default=3.0)
+    parser.add_argument("--threads", type=int, default=0, help="onnxruntime intra-op threads, 0 uses all cores")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--only", nargs="+", default=None, help="names of the benchmarks to run")
+    parser.add_argument("--output", default=None, help="write the results as JSON to this file")
+    parser.add_argument("--baseline", default=None, help="results of a previous run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.1, help="allowed slowdown against the baseline, 0.1 = 10%%")
+    parser.add_argument("--min-delta", type=float, default=0.002, help="slowdowns below this many seconds are not regressions")
+    return parser
+
+
+def main(argv: List[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+    results = run_benchmarks(args)
+
+    output = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+            "onnxruntime": ort.__version__,
+            "args": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")}
+        },
+        "peak_rss_mb": get_peak_rss_mb(),
+        "benchmarks": results
+    }
+
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(output, f, indent=1)
+
+    if args.baseline is not None:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+        if not compare(results, baseline, args.max_regression, args.min_delta):
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
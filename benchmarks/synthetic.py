@@ -0,0 +1,117 @@
+"""
+Deterministic synthetic pecha pages for the benchmarks. Lines are made of Tibetan-like syllables: a head stroke
+on top of a few stacked vertical strokes and hooks, separated by tsheg dots, drawn on a light paper background.
+Every page comes with its ground truth line mask, so the line geometry can be benchmarked without a detection model.
+"""
+
+import cv2
+import numpy as np
+import numpy.typing as npt
+from typing import List, Tuple
+
+
+def _draw_syllable(image: npt.NDArray, mask: npt.NDArray, x: int, y: int, height: int, rs: np.random.RandomState) -> int:
+    stacks = rs.randint(1, 4)
+    width = 0
+
+    for _ in range(stacks):
+        glyph_w = int(height * rs.uniform(0.45, 0.7))
+        stack_h = int(height * rs.uniform(0.6, 1.0))
+        thickness = max(1, height // 12)
+
+        # head stroke and body
+        cv2.line(image, (x + width, y), (x + width + glyph_w, y), 20, thickness + 1)
+        cv2.line(image, (x + width + glyph_w // 2, y), (x + width + glyph_w // 2, y + stack_h // 2), 20, thickness)
+        cv2.ellipse(image, (x + width + glyph_w // 2, y + stack_h // 2), (glyph_w // 2, stack_h // 3), 0, 0, 180, 20, thickness)
+
+        if rs.rand() < 0.3:
+            # subjoined letter or vowel sign reaching below the line
+            cv2.line(image, (x + width + glyph_w // 3, y + stack_h // 2), (x + width + glyph_w // 3, y + stack_h), 20, thickness)
+
+        width += glyph_w + thickness
+
+    # tsheg
+    dot = max(1, height // 10)
+    cv2.circle(image, (x + width + dot * 2, y + dot), dot, 20, -1)
+    width += dot * 5
+
+    cv2.rectangle(mask, (x, y - height // 6), (x + width, y + int(height * 0.9)), 255, -1)
+
+    return width
+
+
+def generate_page(
+        height: int = 1400,
+        width: int = 4200,
+        n_lines: int = 7,
+        seed: int = 0,
+        skew: float = 0.0,
+        curve: float = 0.0
+) -> Tuple[npt.NDArray, npt.NDArray]:
+    """
+    Returns a (BGR page image, line mask) pair. skew rotates the page by that many degrees,
+    curve bends the lines by up to that many pixels to exercise the dewarping.
+    """
+    rs = np.random.RandomState(seed)
+    page = np.full((height, width), 235, dtype=np.uint8)
+    page = (page + rs.normal(0, 6, size=page.shape)).clip(0, 255).astype(np.uint8)
+    text = np.full((height, width), 255, dtype=np.uint8)
+    mask = np.zeros((height, width), dtype=np.uint8)
+
+    margin_x = width // 20
+    margin_y = height // 10
+    line_pitch = (height - 2 * margin_y) // max(1, n_lines)
+    glyph_h = int(line_pitch * 0.45)
+
+    for line_idx in range(n_lines):
+        y = margin_y + line_idx * line_pitch + line_pitch // 4
+        x = margin_x
+
+        while x < width - margin_x - glyph_h * 3:
+            x += _draw_syllable(text, mask, x, y, glyph_h, rs)
+
+    if curve > 0:
+        map_x, map_y = np.meshgrid(np.arange(width, dtype=np.float32), np.arange(height, dtype=np.float32))
+        map_y += (curve * np.sin(map_x / width * np.pi)).astype(np.float32)
+        text = cv2.remap(text, map_x, map_y, cv2.INTER_LINEAR, borderValue=255)
+        mask = cv2.remap(mask, map_x, map_y, cv2.INTER_NEAREST, borderValue=0)
+
+    if skew != 0:
+        matrix = cv2.getRotationMatrix2D((width / 2, height / 2), skew, 1.0)
+        text = cv2.warpAffine(text, matrix, (width, height), borderValue=255)
+        mask = cv2.warpAffine(mask, matrix, (width, height), flags=cv2.INTER_NEAREST, borderValue=0)
+
+    page = np.minimum(page, text)
+    page = cv2.cvtColor(page, cv2.COLOR_GRAY2BGR)
+
+    return page, mask
+
+
+def generate_pages(count: int, height: int, width: int, n_lines: int, seed: int = 0) -> List[Tuple[npt.NDArray, npt.NDArray]]:
+    """
+    A mix of straight, skewed and curved pages, the same for every run with the same arguments.
+    """
+    pages = []
+
+    for idx in range(count):
+        skew = [0.0, 1.5, -0.8][idx % 3]
+        curve = [0.0, 0.0, height / 100][idx % 3]
+        pages.append(generate_page(height, width, n_lines, seed=seed + idx, skew=skew, curve=curve))
+
+    return pages
+
+
+def generate_line_image(height: int = 80, width: int = 1600, seed: int = 0) -> npt.NDArray:
+    """
+    A single BGR line image as it comes out of extract_line_images.
+    """
+    rs = np.random.RandomState(seed)
+    line = np.full((height, width), 255, dtype=np.uint8)
+    mask = np.zeros((height, width), dtype=np.uint8)
+    glyph_h = int(height * 0.6)
+    x = glyph_h // 2
+
+    while x < width - glyph_h * 3:
+        x += _draw_syllable(line, mask, x, height // 5, glyph_h, rs)
+
+    return cv2.cvtColor(line, cv2.COLOR_GRAY2BGR)
@@ -16,6 +16,7 @@ Note:
 
 import os
 import sys
+import multiprocessing
 from platformdirs import user_data_dir
 from PySide6.QtCore import QPoint
 from BDRC.MVVM.view import AppView
@@ -30,6 +31,8 @@ APP_AUTHOR = "BDRC"
 
 
 if __name__ == "__main__":
+    # lets frozen builds run the spawned OCR worker processes, must come before anything else
+    multiprocessing.freeze_support()
     platform = get_platform()
     execution_dir= os.path.dirname(__file__)
     udi = user_data_dir(APP_NAME, APP_AUTHOR)
@@ -0,0 +1,92 @@
+"""
+Tiny ONNX stand-ins for the OCR and line detection models, so the inference code can be tested without the
+real model files. Both need the onnx package, tests that use them skip if it isn't installed.
+"""
+
+import numpy as np
+import onnx
+from onnx import TensorProto, helper, numpy_helper
+
+from BDRC.Data import CharsetEncoder, CTCDecoding, LineDetectionConfig, OCRArchitecture, OCRModelConfig
+
+OCR_INPUT_HEIGHT, OCR_INPUT_WIDTH, OCR_TIME_STEPS = 16, 160, 8
+CHARSET = ["a", "b", "c", "d", "e"]
+
+
+def _save(graph, path: str):
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    onnx.save(model, path)
+
+
+def write_ocr_model(path: str, batch_dim="N"):
+    """
+    (N, 1, H, W) -> (N, T, V): the mean over the height of every column block times a fixed matrix.
+    """
+    vocab = len(CHARSET) + 1
+    block_width = OCR_INPUT_WIDTH // OCR_TIME_STEPS
+    weights = np.random.default_rng(0).normal(size=(block_width, vocab)).astype(np.float32) * 20
+    shape = np.array([-1, OCR_TIME_STEPS, block_width], dtype=np.int64)
+
+    nodes = [
+        helper.make_node("ReduceMean", ["input"], ["mean"], axes=[-2], keepdims=0),
+        helper.make_node("Reshape", ["mean", "shape"], ["blocks"]),
+        helper.make_node("MatMul", ["blocks", "weights"], ["output"])
+    ]
+    graph = helper.make_graph(
+        nodes,
+        "ocr",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, [batch_dim, 1, OCR_INPUT_HEIGHT, OCR_INPUT_WIDTH])],
+        [helper.make_tensor_value_info("output", TensorProto.FLOAT, [batch_dim, OCR_TIME_STEPS, vocab])],
+        [numpy_helper.from_array(weights, "weights"), numpy_helper.from_array(shape, "shape")]
+    )
+    _save(graph, path)
+
+
+def write_line_model(path: str):
+    """
+    (N, 3, P, P) -> (N, 1, P, P): logits that are positive around dark pixels, smeared horizontally into lines.
+    """
+    nodes = [
+        helper.make_node("ReduceMean", ["input"], ["gray"], axes=[1], keepdims=1),
+        helper.make_node("Sub", ["one", "gray"], ["ink"]),
+        helper.make_node("MaxPool", ["ink"], ["lines"], kernel_shape=[9, 41], pads=[4, 20, 4, 20]),
+        helper.make_node("Sub", ["one", "lines"], ["background"]),
+        helper.make_node("Mul", ["background", "scale"], ["scaled"]),
+        helper.make_node("Add", ["scaled", "offset"], ["output"])
+    ]
+    constants = [
+        numpy_helper.from_array(np.array([1.0], dtype=np.float32), "one"),
+        numpy_helper.from_array(np.array([-10.0], dtype=np.float32), "scale"),
+        numpy_helper.from_array(np.array([5.0], dtype=np.float32), "offset")
+    ]
+    graph = helper.make_graph(
+        nodes,
+        "line",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, ["N", 3, "P", "P"])],
+        [helper.make_tensor_value_info("output", TensorProto.FLOAT, ["N", 1, "P", "P"])],
+        constants
+    )
+    _save(graph, path)
+
+
+def make_ocr_config(model_file: str) -> OCRModelConfig:
+    return OCRModelConfig(
+        model_file=model_file,
+        architecture=OCRArchitecture.Easter2,
+        input_width=OCR_INPUT_WIDTH,
+        input_height=OCR_INPUT_HEIGHT,
+        input_layer="input",
+        output_layer="output",
+        squeeze_channel=False,
+        swap_hw=False,
+        encoder=CharsetEncoder.Stack,
+        charset=CHARSET,
+        add_blank=True,
+        version="test",
+        ctc_decoding=CTCDecoding.Greedy
+    )
+
+
+def make_line_config(model_file: str) -> LineDetectionConfig:
+    return LineDetectionConfig(model_file=model_file, patch_size=512)
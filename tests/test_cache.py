@@ -0,0 +1,116 @@
+import io
+import json
+import os
+import pickle
+from uuid import uuid1
+
+import numpy as np
+import pytest
+
+from BDRC.Cache import OCRResultCache
+from BDRC.Data import BBox, Encoding, Line, OCRLine, OCResult
+from BDRC.Trace import PageTrace
+
+
+def make_result() -> OCResult:
+    mask = np.zeros((40, 60, 3), dtype=np.uint8)
+    mask[10:20, 5:50] = 255
+    lines = [
+        Line(guid=uuid1(), contour=np.array([[[5, 10]], [[50, 10]], [[50, 20]], [[5, 20]]], dtype=np.int32),
+             bbox=BBox(5, 10, 45, 10), center=(27, 15)),
+        Line(guid=uuid1(), contour=np.array([[1, 2], [3, 4], [5, 6]], dtype=np.int32),
+             bbox=BBox(1, 2, 4, 4), center=(3, 4))
+    ]
+    text = [OCRLine(guid=line.guid, text=f"line {idx}", encoding=Encoding.Unicode) for idx, line in enumerate(lines)]
+    trace = PageTrace("page")
+    trace.record("ocr", 0.5, lines=np.int64(2))
+
+    return OCResult(guid=uuid1(), mask=mask, lines=lines, text=text, angle=1.25, trace=trace)
+
+
+def test_cache_round_trip_without_pickle(tmp_path):
+    cache = OCRResultCache(str(tmp_path))
+    result = make_result()
+    key = "ab" + "0" * 62
+    cache.put(key, result)
+
+    entry_path = tmp_path / "ab" / f"{key}.npz"
+    assert entry_path.is_file()
+    with np.load(entry_path, allow_pickle=False) as entry:
+        assert all(entry[name].dtype != object for name in entry.files)
+
+    cached = OCRResultCache(str(tmp_path)).get(key, result.guid)
+    assert cached is not None
+    assert cached.guid == result.guid
+    assert cached.angle == result.angle
+    np.testing.assert_array_equal(cached.mask, result.mask)
+    assert [x.text for x in cached.text] == ["line 0", "line 1"]
+    assert [x.guid for x in cached.text] == [x.guid for x in cached.lines]
+    assert cached.trace.events == [("ocr", 0.5, {"lines": 2})]
+
+    for cached_line, line in zip(cached.lines, result.lines):
+        np.testing.assert_array_equal(cached_line.contour, line.contour)
+        assert cached_line.bbox == line.bbox
+        assert cached_line.center == line.center
+
+
+def test_pickled_entries_are_not_loaded(tmp_path):
+    key = "cd" + "0" * 62
+    os.makedirs(tmp_path / "cd")
+    with open(tmp_path / "cd" / f"{key}.pkl", "wb") as f:
+        pickle.dump({"guid": None}, f)
+
+    cache = OCRResultCache(str(tmp_path))
+    assert cache.get(key) is None
+    assert not (tmp_path / "cd" / f"{key}.pkl").exists()
+
+    with open(tmp_path / "cd" / f"{key}.npz", "wb") as f:
+        pickle.dump({"guid": None}, f)
+
+    cache = OCRResultCache(str(tmp_path))
+    assert cache.get(key) is None
+    assert not (tmp_path / "cd" / f"{key}.npz").exists()
+
+
+def truncate_entry(entry: bytes) -> bytes:
+    return entry[:len(entry) // 2]
+
+
+def tamper_contour_type(entry: bytes) -> bytes:
+    with np.load(io.BytesIO(entry), allow_pickle=False) as data:
+        arrays = {name: data[name] for name in data.files}
+    arrays["contours"] = arrays["contours"].astype(np.float64)
+
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    return buffer.getvalue()
+
+
+def tamper_contour_shape(entry: bytes) -> bytes:
+    with np.load(io.BytesIO(entry), allow_pickle=False) as data:
+        arrays = {name: data[name] for name in data.files}
+    header = json.loads(arrays["header"].tobytes().decode("utf-8"))
+    header["lines"][0]["contour_shape"] = [100, 1, 2]
+    arrays["header"] = np.frombuffer(json.dumps(header).encode("utf-8"), dtype=np.uint8)
+
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("tamper", [truncate_entry, tamper_contour_type, tamper_contour_shape])
+def test_damaged_entries_are_misses(tmp_path, tamper):
+    cache = OCRResultCache(str(tmp_path))
+    result = make_result()
+    key = "ef" + "0" * 62
+    cache.put(key, result)
+
+    entry_path = tmp_path / "ef" / f"{key}.npz"
+    entry_path.write_bytes(tamper(entry_path.read_bytes()))
+
+    cache = OCRResultCache(str(tmp_path))
+    assert cache.get(key, result.guid) is None
+    assert not entry_path.exists()
+
+    cache.put(key, result)
+    assert cache.get(key, result.guid) is not None
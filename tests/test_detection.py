@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("onnx")
+
+from dataclasses import replace  # noqa: E402
+
+from BDRC.Data import Platform  # noqa: E402
+from BDRC.Inference import BACKGROUND_LOGIT, Detection, LineDetection  # noqa: E402
+from benchmarks.synthetic import generate_page  # noqa: E402
+from onnx_models import make_line_config, write_line_model  # noqa: E402
+
+
+class PlainDetection(Detection):
+    """
+    A detection without its own background logits, like a new model type would start out.
+    """
+
+    def predict(self, image, trace=None):
+        _, tiles, y_steps, _, _, active = self._preprocess_image(image, patch_size=self._patch_size)
+        return self._merge_tiles(self._predict_tiles(tiles, active), y_steps, active), active
+
+
+@pytest.fixture(scope="module")
+def line_config(tmp_path_factory):
+    line_file = str(tmp_path_factory.mktemp("detection") / "line.onnx")
+    write_line_model(line_file)
+    return replace(make_line_config(line_file), skip_background_tiles=True)
+
+
+def blank_margin_page():
+    image, _ = generate_page(600, 1200, 3, seed=5)
+    page = np.full((1400, 1600, 3), 255, dtype=np.uint8)
+    page[:600, :1200] = image
+    return page
+
+
+def test_subclass_without_background_logits_skips_tiles(line_config):
+    detection = PlainDetection(Platform.Linux, line_config)
+    np.testing.assert_array_equal(detection._background_logits(), [BACKGROUND_LOGIT])
+
+    logits, active = detection.predict(blank_margin_page())
+    assert not active.all()
+    assert logits.ndim == 3 and logits.shape[-1] == 1
+    assert (logits == BACKGROUND_LOGIT).any()
+
+
+def test_skipping_background_tiles_keeps_the_line_mask(line_config):
+    page = blank_margin_page()
+    skipped = LineDetection(Platform.Linux, line_config).predict(page)
+    full = LineDetection(Platform.Linux, replace(line_config, skip_background_tiles=False)).predict(page)
+
+    np.testing.assert_array_equal(skipped, full)
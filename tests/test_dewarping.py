@@ -0,0 +1,37 @@
+import cv2
+import numpy as np
+import pytest
+
+from BDRC.Data import OpStatus, TPSMode
+from BDRC.Inference import extract_page_lines
+from benchmarks.synthetic import generate_page
+
+
+def get_line_images(image, line_mask, tps_mode: TPSMode, **kwargs):
+    status, result = extract_page_lines(image, line_mask, use_tps=True, tps_mode=tps_mode, **kwargs)
+    assert status == OpStatus.SUCCESS
+    return result[2]
+
+
+@pytest.mark.parametrize("tps_mode", [TPSMode.GLOBAL, TPSMode.LOCAL])
+@pytest.mark.parametrize("seed, curve, skew", [(0, 75, 0.0), (2, 60, -1.5)])
+def test_interpolated_maps_match_the_exact_dewarping(tps_mode, seed, curve, skew):
+    image, line_mask = generate_page(700, 2100, 6, seed=seed, skew=skew, curve=curve)
+
+    exact = get_line_images(image, line_mask, tps_mode, tps_tolerance=0)
+    interpolated = get_line_images(image, line_mask, tps_mode)
+
+    assert len(interpolated) == len(exact)
+    for line_image, reference in zip(interpolated, exact):
+        assert abs(line_image.shape[0] - reference.shape[0]) <= 1
+        assert abs(line_image.shape[1] - reference.shape[1]) <= 1
+
+        # the exact global path resamples the page three times (deskew, dewarp, deskew) instead of once, so the
+        # crops differ in the noise, but no shift by a pixel brings them closer together
+        h, w = min(line_image.shape[0], reference.shape[0]) - 2, min(line_image.shape[1], reference.shape[1]) - 2
+        diffs = {
+            (dy, dx): cv2.absdiff(line_image[1:1 + h, 1:1 + w], reference[1 + dy:1 + dy + h, 1 + dx:1 + dx + w]).mean()
+            for dy in (-1, 0, 1) for dx in (-1, 0, 1)
+        }
+        assert diffs[(0, 0)] < 8
+        assert diffs[(0, 0)] == min(diffs.values())
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("onnx")
+
+from BDRC.Data import OpStatus, Platform  # noqa: E402
+from BDRC.Inference import OCRPipeline  # noqa: E402
+from benchmarks.synthetic import generate_page  # noqa: E402
+from onnx_models import make_line_config, make_ocr_config, write_line_model, write_ocr_model  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def pipeline(tmp_path_factory):
+    tmp_path = tmp_path_factory.mktemp("line_cache")
+    ocr_file = str(tmp_path / "ocr.onnx")
+    line_file = str(tmp_path / "line.onnx")
+    write_ocr_model(ocr_file)
+    write_line_model(line_file)
+
+    return OCRPipeline(Platform.Linux, make_ocr_config(ocr_file), make_line_config(line_file), num_threads=1)
+
+
+def test_duplicate_pages_get_their_own_lines(pipeline):
+    image, _ = generate_page(700, 1400, 5, seed=4)
+
+    status, first = pipeline.run_ocr(image.copy())
+    assert status == OpStatus.SUCCESS
+    _, first_lines, first_text, _ = first
+
+    # editing the lines of the first page must not leak into the cached line data
+    original_contour = first_lines[0].contour.copy()
+    first_lines[0].contour[:] = 0
+    first_lines[0].bbox.x = -1
+
+    status, second = pipeline.run_ocr(image.copy())
+    assert status == OpStatus.SUCCESS
+    _, second_lines, second_text, _ = second
+
+    assert len(second_lines) == len(first_lines) > 0
+    np.testing.assert_array_equal(second_lines[0].contour, original_contour)
+    assert second_lines[0].bbox.x != -1
+
+    first_guids = {x.guid for x in first_lines}
+    assert first_guids.isdisjoint(x.guid for x in second_lines)
+    assert [x.guid for x in second_text] == [x.guid for x in second_lines]
+    assert [x.text for x in second_text] == [x.text for x in first_text]
+
+    status, third = pipeline.run_ocr(image.copy())
+    assert status == OpStatus.SUCCESS
+    assert {x.guid for x in third[1]}.isdisjoint(first_guids | {x.guid for x in second_lines})
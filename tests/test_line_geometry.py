@@ -0,0 +1,49 @@
+import cv2
+import numpy as np
+import pytest
+
+from BDRC.Data import OpStatus
+from BDRC.Inference import extract_page_lines
+from BDRC.Utils import (
+    build_line_data,
+    extract_line_images,
+    filter_line_contours,
+    get_contours,
+    get_rotation_angle_from_lines,
+    rotate_from_angle,
+    sort_lines_by_threshold2
+)
+from benchmarks.synthetic import generate_page
+
+
+def extract_lines_on_rotated_page(image, line_mask, k_factor=2.5, bbox_tolerance=4.0):
+    """
+    The line geometry as it was before the contours were traced only once: the page image and the mask are rotated
+    as a whole and the contours are traced on the rotated mask.
+    """
+    angle = get_rotation_angle_from_lines(line_mask)
+    rot_mask = rotate_from_angle(line_mask, angle)
+    rot_img = rotate_from_angle(image, angle)
+
+    contours = [x for x in get_contours(rot_mask) if cv2.contourArea(x) > 10]
+    contours = filter_line_contours(cv2.cvtColor(rot_mask, cv2.COLOR_GRAY2RGB), contours)
+    line_data = [build_line_data(x) for x in contours]
+    sorted_lines, _ = sort_lines_by_threshold2(rot_mask, line_data, group_lines=True)
+
+    return angle, extract_line_images(rot_img, sorted_lines, k_factor, bbox_tolerance)
+
+
+@pytest.mark.parametrize("skew", [0.0, 1.5, -0.8, 2.5])
+def test_line_images_match_the_rotated_page(skew):
+    image, line_mask = generate_page(1000, 2400, 5, seed=3, skew=skew)
+    angle, expected = extract_lines_on_rotated_page(image, line_mask)
+
+    status, result = extract_page_lines(image, line_mask)
+    assert status == OpStatus.SUCCESS
+    _, _, line_images, page_angle = result
+
+    assert page_angle == angle
+    assert len(line_images) == len(expected)
+    for line_image, reference in zip(line_images, expected):
+        assert abs(line_image.shape[0] - reference.shape[0]) <= 1
+        assert abs(line_image.shape[1] - reference.shape[1]) <= 1
@@ -0,0 +1,52 @@
+import cv2
+import numpy as np
+import pytest
+
+from BDRC.Utils import get_line_threshold
+from benchmarks.synthetic import generate_page
+
+
+def get_line_threshold_per_slice(line_prediction, slice_width: int = 20):
+    """
+    The line threshold as it was computed before the slices were traced together: one findContours call per slice.
+    """
+    x, y, w, h = cv2.boundingRect(line_prediction)
+    x_steps = (w // slice_width) // 2
+
+    bbox_numbers = []
+    for step in range(1, x_steps + 1):
+        x_start = x + x_steps * step
+        _slice = line_prediction[y: y + h, x_start: x_start + slice_width]
+        contours, _ = cv2.findContours(_slice, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+        bbox_numbers.append((len(contours), contours))
+
+    if len(bbox_numbers) == 0:
+        return 0.0
+
+    n_contours, contours = sorted(bbox_numbers, key=lambda x: x[0], reverse=True)[0]
+    if n_contours == 0:
+        return 0.0
+
+    y_points = [cv2.boundingRect(c)[1] + cv2.boundingRect(c)[3] // 2 for c in contours]
+    return float(np.median(y_points) // n_contours)
+
+
+@pytest.mark.parametrize("skew, curve", [(0.0, 0.0), (1.5, 0.0), (-2.0, 40.0), (3.0, 80.0), (3.0, 100.0), (0.7, 120.0)])
+@pytest.mark.parametrize("height, width, n_lines", [(900, 2400, 6), (700, 1800, 12)])
+def test_threshold_matches_the_per_slice_contours(skew, curve, height, width, n_lines):
+    _, line_mask = generate_page(height, width, n_lines, seed=1, skew=skew, curve=curve)
+    assert get_line_threshold(line_mask) == get_line_threshold_per_slice(line_mask)
+
+
+@pytest.mark.parametrize("seed", range(6))
+def test_threshold_matches_on_blobs_with_holes(seed):
+    rng = np.random.default_rng(seed)
+    mask = np.zeros((500, 1300), dtype=np.uint8)
+    for _ in range(40):
+        center = (int(rng.integers(0, 1300)), int(rng.integers(0, 500)))
+        axes = (int(rng.integers(5, 120)), int(rng.integers(3, 30)))
+        cv2.ellipse(mask, center, axes, float(rng.uniform(-20, 20)), 0, 360, 255, int(rng.choice([-1, 2])))
+
+    assert get_line_threshold(mask) == get_line_threshold_per_slice(mask)
+    assert get_line_threshold(mask[:, :300]) == get_line_threshold_per_slice(mask[:, :300])
+    assert get_line_threshold(mask[:, :30]) == get_line_threshold_per_slice(mask[:, :30])
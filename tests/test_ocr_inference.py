@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("onnx")
+
+from BDRC.Data import Platform  # noqa: E402
+from BDRC.Inference import OCRInference  # noqa: E402
+from onnx_models import make_ocr_config, write_ocr_model  # noqa: E402
+
+
+def make_inference(model_file: str) -> OCRInference:
+    return OCRInference(Platform.Linux, make_ocr_config(model_file), batch_size=4)
+
+
+@pytest.mark.parametrize("batch_dim", [1, 3])
+def test_run_batch_with_a_static_batch_dimension(tmp_path, batch_dim):
+    dynamic_file = str(tmp_path / "dynamic.onnx")
+    static_file = str(tmp_path / "static.onnx")
+    write_ocr_model(dynamic_file)
+    write_ocr_model(static_file, batch_dim)
+
+    rng = np.random.default_rng(1)
+    line_images = [rng.integers(0, 255, (12, 40 + 25 * idx, 3), dtype=np.uint8) for idx in range(5)]
+
+    dynamic = make_inference(dynamic_file)
+    static = make_inference(static_file)
+    assert dynamic._static_batch_size is None
+    assert static._static_batch_size == batch_dim
+
+    expected = [dynamic.run(x) for x in line_images]
+    assert dynamic.run_batch(line_images) == expected
+    assert static.run_batch(line_images) == expected
+    assert static.run_batch(line_images[:1], batch_size=8) == expected[:1]
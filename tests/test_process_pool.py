@@ -0,0 +1,67 @@
+import threading
+import time
+
+import cv2
+import pytest
+
+pytest.importorskip("onnx")
+
+from BDRC.Data import Platform  # noqa: E402
+from BDRC.ProcessPool import OCRProcessPool  # noqa: E402
+from benchmarks.synthetic import generate_page  # noqa: E402
+from onnx_models import make_line_config, make_ocr_config, write_line_model, write_ocr_model  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def pool_setup(tmp_path_factory):
+    tmp_path = tmp_path_factory.mktemp("pool")
+    ocr_file = str(tmp_path / "ocr.onnx")
+    line_file = str(tmp_path / "line.onnx")
+    write_ocr_model(ocr_file)
+    write_line_model(line_file)
+
+    pages = []
+    for idx in range(8):
+        image_path = str(tmp_path / f"page_{idx}.png")
+        cv2.imwrite(image_path, generate_page(700, 1400, 5, seed=idx)[0])
+        pages.append((idx, image_path))
+
+    return make_ocr_config(ocr_file), make_line_config(line_file), pages
+
+
+def start_run(pool: OCRProcessPool, pages):
+    results = {}
+    errors = {}
+    runner = threading.Thread(
+        target=pool.run,
+        args=(pages, lambda idx, key, result: results.setdefault(idx, result), lambda idx, key, msg: errors.setdefault(idx, msg)),
+        daemon=True
+    )
+    runner.start()
+    return runner, results, errors
+
+
+def test_pool_runs_all_pages(pool_setup):
+    ocr_config, line_config, pages = pool_setup
+    pool = OCRProcessPool(Platform.Linux, ocr_config, line_config, workers=2, threads_per_worker=1)
+
+    runner, results, errors = start_run(pool, pages[:3])
+    runner.join(timeout=120)
+
+    assert not runner.is_alive()
+    assert errors == {}
+    assert sorted(results.keys()) == [0, 1, 2]
+    assert all(len(result.lines) > 0 for result in results.values())
+
+
+def test_stop_ends_a_running_pool(pool_setup):
+    ocr_config, line_config, pages = pool_setup
+    pool = OCRProcessPool(Platform.Linux, ocr_config, line_config, workers=2, threads_per_worker=1)
+
+    runner, results, _ = start_run(pool, pages)
+    time.sleep(0.5)
+    pool.stop()
+    runner.join(timeout=10)
+
+    assert not runner.is_alive()
+    assert len(results) < len(pages)
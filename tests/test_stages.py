@@ -0,0 +1,115 @@
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from BDRC.Data import OpStatus, PipelineSettings
+from BDRC.Stages import StagedOCRPipeline
+
+
+class FakeOCRInference:
+    def __init__(self):
+        self.batch_sizes = []
+
+    def run_batch(self, line_images, pre_pad=True, batch_size=None, trace=None):
+        self.batch_sizes.append(len(line_images))
+        return [f"line {x.shape[1]}" for x in line_images]
+
+
+class FakeOCRPipeline:
+    """
+    Stands in for OCRPipeline without any models, every page has lines_per_page lines.
+    """
+
+    def __init__(self, lines_per_page: int, geometry_delay: float = 0.0):
+        self.lines_per_page = lines_per_page
+        self.geometry_delay = geometry_delay
+        self.ocr_inference = FakeOCRInference()
+        self.geometry_threads = []
+
+    def get_image_key(self, image):
+        return None
+
+    def get_cached_lines(self, image_key, **geometry_args):
+        return None
+
+    def detect_lines(self, image, image_key=None, trace=None):
+        return np.zeros(image.shape[:2], dtype=np.uint8)
+
+    def extract_lines(self, image, line_mask, k_search=None, image_key=None, num_threads=None, trace=None, **geometry_args):
+        self.geometry_threads.append(num_threads)
+        time.sleep(self.geometry_delay)
+        lines = list(range(self.lines_per_page))
+        line_images = [np.zeros((8, 16 + idx, 3), dtype=np.uint8) for idx in lines]
+        return OpStatus.SUCCESS, (line_mask, lines, line_images, 0.0)
+
+    def build_ocr_lines(self, predictions, lines, target_encoding=None):
+        return predictions
+
+
+def run_pipeline(pipeline: StagedOCRPipeline, pages):
+    results = {}
+    errors = {}
+    runner = threading.Thread(
+        target=pipeline.run,
+        args=(pages, lambda idx, key, result: results.setdefault(idx, result), lambda idx, key, msg: errors.setdefault(idx, msg)),
+        daemon=True
+    )
+    runner.start()
+    runner.join(timeout=30)
+
+    if runner.is_alive():
+        pipeline.stop()
+
+    assert not runner.is_alive()
+    return results, errors
+
+
+def write_page(tmp_path) -> str:
+    image_path = str(tmp_path / "page.png")
+    cv2.imwrite(image_path, np.full((32, 32, 3), 255, dtype=np.uint8))
+    return image_path
+
+
+def test_pages_with_few_lines_do_not_block_the_pipeline(tmp_path):
+    settings = PipelineSettings(line_batch_size=64)
+    max_in_flight = 3 * settings.queue_size + settings.prefetch_workers + settings.detection_workers + \
+        settings.geometry_workers + settings.recognition_workers
+    n_pages = 2 * max_in_flight
+
+    image_path = write_page(tmp_path)
+    pages = [(idx, image_path) for idx in range(n_pages)]
+
+    results, errors = run_pipeline(StagedOCRPipeline(FakeOCRPipeline(lines_per_page=3), settings), pages)
+
+    assert errors == {}
+    assert sorted(results.keys()) == list(range(n_pages))
+    assert all(result.text == ["line 16", "line 17", "line 18"] for result in results.values())
+
+
+def test_slow_geometry_does_not_split_line_batches(tmp_path):
+    settings = PipelineSettings(line_batch_size=9, geometry_workers=1)
+    image_path = write_page(tmp_path)
+    pages = [(idx, image_path) for idx in range(7)]
+
+    ocr_pipeline = FakeOCRPipeline(lines_per_page=3, geometry_delay=0.3)
+    results, errors = run_pipeline(StagedOCRPipeline(ocr_pipeline, settings), pages)
+
+    assert errors == {}
+    assert sorted(results.keys()) == list(range(7))
+    # only the batch run at the end of the volume is partial
+    assert ocr_pipeline.ocr_inference.batch_sizes == [9, 9, 3]
+
+
+def test_geometry_workers_share_the_cores(tmp_path):
+    settings = PipelineSettings(detection_workers=1, geometry_workers=2, recognition_workers=1)
+    ocr_pipeline = FakeOCRPipeline(lines_per_page=3)
+    image_path = write_page(tmp_path)
+
+    results, errors = run_pipeline(StagedOCRPipeline(ocr_pipeline, settings), [(idx, image_path) for idx in range(4)])
+
+    assert len(results) == 4 and len(errors) == 0
+    expected = max(1, (os.cpu_count() or 1) // 4)
+    assert ocr_pipeline.geometry_threads == [expected] * 4
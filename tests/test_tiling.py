@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from BDRC.Utils import blend_predictions, get_tile_origins, get_tile_view, preprocess_image
+
+BACKGROUND = -1e4
+
+
+def _tile_origins(idx: int, x_steps: int, stride: int):
+    return (idx // x_steps) * stride, (idx % x_steps) * stride
+
+
+def test_blend_ignores_skipped_tiles_in_the_overlap():
+    patch_size, overlap, y_steps, x_steps = 64, 16, 2, 2
+    stride = patch_size - overlap
+    prediction = np.full((y_steps * x_steps, patch_size, patch_size), 5.0, dtype=np.float32)
+    active = np.ones(len(prediction), dtype=bool)
+    active[1] = False
+    prediction[1] = BACKGROUND
+
+    blended = blend_predictions(prediction, y_steps, overlap, active)
+
+    covered = np.zeros(blended.shape, dtype=bool)
+    for idx in np.flatnonzero(active):
+        y, x = _tile_origins(idx, x_steps, stride)
+        covered[y:y + patch_size, x:x + patch_size] = True
+
+    # the active tiles keep their full prediction up to their borders, only the rest is background
+    np.testing.assert_allclose(blended[covered], 5.0, rtol=1e-6)
+    np.testing.assert_allclose(blended[~covered], BACKGROUND)
+    assert (~covered).any()
+
+
+def test_blend_with_classes_and_all_tiles_active():
+    patch_size, overlap, y_steps, x_steps = 32, 8, 2, 3
+    rng = np.random.default_rng(0)
+    constant = rng.normal(size=5).astype(np.float32)
+    prediction = np.broadcast_to(constant, (y_steps * x_steps, patch_size, patch_size, 5)).copy()
+    prediction[2] = BACKGROUND
+
+    blended = blend_predictions(prediction, y_steps, overlap, np.array([True, True, False, True, True, True]))
+    reference = blend_predictions(prediction[[0, 1, 0, 3, 4, 5]], y_steps, overlap)
+
+    stride = patch_size - overlap
+    assert blended.shape == (stride + patch_size, 2 * stride + patch_size, 5)
+    np.testing.assert_allclose(blended[:, :2 * stride], reference[:, :2 * stride], rtol=1e-6)
+    np.testing.assert_allclose(blended[:stride, 2 * stride + overlap:], BACKGROUND)
+
+
+@pytest.mark.parametrize("overlap", [0, 64])
+def test_tile_view_covers_the_padded_page(overlap):
+    patch_size = 256
+    image = np.random.default_rng(1).integers(0, 255, (700, 900, 3), dtype=np.uint8)
+    padded, _, _ = preprocess_image(image, patch_size, overlap=overlap)
+    page = padded[..., 0]
+
+    tiles = get_tile_view(page, patch_size, overlap)
+    y_origins = get_tile_origins(page.shape[0], patch_size, overlap)
+    x_origins = get_tile_origins(page.shape[1], patch_size, overlap)
+
+    assert tiles.shape == (len(y_origins), len(x_origins), patch_size, patch_size)
+    assert y_origins[-1] + patch_size == page.shape[0] and x_origins[-1] + patch_size == page.shape[1]
+    for row, y in enumerate(y_origins):
+        for col, x in enumerate(x_origins):
+            np.testing.assert_array_equal(tiles[row, col], page[y:y + patch_size, x:x + patch_size])